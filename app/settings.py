@@ -43,6 +43,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.QueryInstrumentationMiddleware',
+    'core.metrics.MetricsMiddleware',
+    'core.hashers.PasswordHashingBusyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -82,10 +85,54 @@ DATABASES = {
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
         'PASSWORD': os.environ.get('DB_PASS'),
-
+        # keep connections open between requests
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
     }
 }
 
+# Persistent connections idle for longer than this many seconds are
+# tested before a request uses them, see core.signals.check_connections
+CONN_HEALTH_CHECK_IDLE = 30
+
+# Read replicas of the default database, as a comma separated host list.
+# They share its name and credentials and get the aliases replica-<n>.
+# Tests read them through the default connection's test database.
+for number, host in enumerate(
+        filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), 1):
+    DATABASES[f'replica-{number}'] = dict(DATABASES['default'],
+                                          HOST=host.strip(),
+                                          TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Reads of the recipe API go to a replica unless the user wrote in the
+# last READ_YOUR_WRITES seconds. A failing replica is skipped for
+# FAILOVER_SECONDS. CACHE names a CACHES alias shared by all workers,
+# required when there are replicas.
+DATABASE_ROUTING = {
+    'REPLICAS': [alias for alias in DATABASES if alias != 'default'],
+    'READ_YOUR_WRITES': 5,
+    'FAILOVER_SECONDS': 30,
+    'CACHE': os.environ.get('DB_ROUTING_CACHE'),
+}
+
+# The first hasher hashes new passwords, the others verify older hashes
+# until the next login rehashes them.
+PASSWORD_HASHERS = [
+    'core.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# Cost and concurrency of core.hashers.PBKDF2PasswordHasher. ITERATIONS
+# None keeps Django's default, WORKERS bounds the hashes running at once
+# per process and defaults to core.hashers.default_workers(), the cores
+# shared by WEB_CONCURRENCY processes, and TIMEOUT is how long a login
+# waits for a free slot before a 503.
+PASSWORD_HASHING = {
+    'ITERATIONS': None,
+    'TIMEOUT': 1,
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
 
@@ -123,7 +170,110 @@ USE_TZ = True
 STATIC_URL = '/static/'
 MEDIA_URL = '/MEDIA/'
 
-MEDIAL_ROOT = '/vol/web/media'
+MEDIA_ROOT = '/vol/web/media'
 STATIC_ROOT = 'vol/web/static'
 
+# let the web server send media files: None, 'X-Sendfile' (Apache,
+# lighttpd) or 'X-Accel-Redirect' (nginx, with an internal location
+# aliased to MEDIA_ROOT)
+MEDIA_SENDFILE_HEADER = None
+MEDIA_ACCEL_REDIRECT_LOCATION = '/protected-media/'
+
+# store uploads once per content under sharded sha256 names, see
+# core/storage.py and the migrate_image_storage command
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+
 AUTH_USER_MODEL = "core.User"
+
+REST_FRAMEWORK = {
+    'EXCEPTION_HANDLER': 'core.hashers.exception_handler',
+    'DEFAULT_PAGINATION_CLASS': 'recipe.pagination.KeysetPagination',
+    'PAGE_SIZE': 100,
+    # orjson backed when installed, see core/renderers.py
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # token buckets per user and scope, see core/throttling.py
+    'DEFAULT_THROTTLE_CLASSES': (
+        'core.throttling.TokenBucketThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'read': '1200/min',
+        'write': '300/min',
+        'upload-image': '120/min',
+        'token': '20/min',
+    },
+}
+
+# Buckets of core.throttling.TokenBucketThrottle. BACKEND is an optional
+# CACHES alias counting requests for all worker processes, which must be
+# shared between them (memcached, redis) for the limits to be global.
+TOKEN_BUCKET_THROTTLE = {
+    'MAX_SIZE': 100000,
+    'BACKEND': None,
+}
+
+# SQL timing of the API requests, reported in Server-Timing headers.
+# Requests slower than SLOW_REQUEST_MS are logged with their TOP_QUERIES.
+QUERY_INSTRUMENTATION = {
+    'ENABLED': True,
+    'PATHS': ('/api/recipe/', '/api/user/'),
+    'SLOW_REQUEST_MS': 500,
+    'TOP_QUERIES': 5,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.instrumentation': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# Readiness checks of /healthz, cached per process for CACHE_SECONDS
+HEALTH_CHECK = {
+    'CACHE_SECONDS': 5,
+    'DATABASE': 'default',
+}
+
+# Clients allowed to read /metrics: addresses in ALLOWED_NETWORKS, and
+# requests sending "Authorization: Bearer <TOKEN>" when TOKEN is set.
+# Behind a reverse proxy REMOTE_ADDR is the proxy, so set a TOKEN.
+METRICS = {
+    'ALLOWED_NETWORKS': ('127.0.0.1/32', '::1/128'),
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+}
+
+# Token -> user lookups cached by core.authentication. Set BACKEND to a
+# CACHES alias shared between worker processes when running several, or
+# a deleted token keeps working in the other workers for up to TTL.
+TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'BACKEND': None,
+}
+
+# Resized variants of recipe images rendered by core.images
+RECIPE_IMAGE_DERIVATIVES = {
+    'SIZES': {'thumb': 150, 'medium': 600, 'large': 1200},
+    'FORMATS': {'webp': 'WEBP', 'jpg': 'JPEG'},
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ASYNC': True,
+}
+
+# largest image accepted by chunked uploads of the upload-image action
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
@@ -0,0 +1,44 @@
+"""Performance benchmarks for the recipe api
+
+Run them from the project root, e.g. `python -m benchmarks.recipe_filters`.
+Each benchmark builds its data in a throwaway test database.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+import django
+
+
+def setup():
+    """Configure django for a standalone benchmark script"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Create a migrated test database and destroy it afterwards"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, \
+        teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def best_of(func, repeat=5, number=1):
+    """Return the best average run time of func in seconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+
+    return min(timings)
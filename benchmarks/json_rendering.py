@@ -0,0 +1,60 @@
+"""Render and parse time of recipe payloads, stdlib against orjson"""
+from collections import OrderedDict
+from io import BytesIO
+
+from benchmarks import best_of, setup
+
+PAYLOAD_SIZES = (100, 1000, 10000)
+
+
+def recipe_payload(count):
+    """Return data shaped like a page of RecipeSerializer output"""
+    return OrderedDict([
+        ('next', 'http://testserver/api/recipe/recipes/?cursor=eyJvIjoxfQ'),
+        ('previous', None),
+        ('results', [OrderedDict([
+            ('id', i),
+            ('title', f'Recipe {i} crème brûlée'),
+            ('ingredients', [i, i + 1, i + 2, i + 3, i + 4, i + 5]),
+            ('tags', [i, i + 7, i + 11]),
+            ('time_minutes', i % 120),
+            ('price', f'{i % 1000}.{i % 100:02d}'),
+            ('link', f'https://example.com/recipes/{i}'),
+            ('image_variants', None),
+        ]) for i in range(count)]),
+    ])
+
+
+def main():
+    setup()
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from core import renderers
+    from core.parsers import FastJSONParser
+    from core.renderers import FastJSONRenderer
+
+    if renderers.orjson is None:
+        print('orjson is not installed, both columns use the stdlib')
+    print(f'{"recipes":>8} {"render std":>11} {"render fast":>12} '
+          f'{"parse std":>10} {"parse fast":>11}  (ms)')
+    for count in PAYLOAD_SIZES:
+        payload = recipe_payload(count)
+        body = JSONRenderer().render(payload)
+        assert FastJSONRenderer().render(payload) == body
+        timings = [
+            best_of(lambda: renderer().render(payload), number=5)
+            for renderer in (JSONRenderer, FastJSONRenderer)
+        ] + [
+            best_of(lambda: parser().parse(
+                BytesIO(body), 'application/json', {}
+            ), number=5)
+            for parser in (JSONParser, FastJSONParser)
+        ]
+        print(f'{count:>8} ' + ' '.join(
+            f'{timing * 1000:>{width}.2f}'
+            for timing, width in zip(timings, (11, 12, 10, 11))
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""Logins per second per core for a few PBKDF2 iteration counts
+
+The second column runs one login thread per core at once.
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import best_of, setup, test_database
+
+ITERATIONS = (None, 100000, 50000, 20000)
+LOGINS = 20
+
+
+def main():
+    setup()
+    from django.contrib.auth import authenticate, get_user_model
+    from django.test import override_settings
+    from core import hashers
+
+    cores = os.cpu_count() or 1
+    with test_database():
+        get_user_model().objects.create_user('bench@test.com', 'password')
+
+        def login():
+            assert authenticate(username='bench@test.com',
+                                password='password')
+
+        print(f'{cores} cores')
+        print(f'{"iterations":>10} {"1 thread":>12} {"per core":>12}')
+        for iterations in ITERATIONS:
+            options = {'ITERATIONS': iterations, 'WORKERS': cores}
+            with override_settings(
+                PASSWORD_HASHERS=['core.hashers.PBKDF2PasswordHasher'],
+                PASSWORD_HASHING=options,
+            ):
+                # the first login rehashes to the new iteration count
+                login()
+                single = 1 / best_of(login, repeat=3, number=LOGINS)
+                with ThreadPoolExecutor(cores) as pool:
+                    start = time.perf_counter()
+                    list(pool.map(lambda _: login(),
+                                  range(LOGINS * cores)))
+                    elapsed = time.perf_counter() - start
+                parallel = LOGINS * cores / elapsed / cores
+                name = iterations or hashers.PBKDF2PasswordHasher().iterations
+            print(f'{name:>10} {single:>10.1f}/s {parallel:>10.1f}/s')
+
+
+if __name__ == '__main__':
+    main()
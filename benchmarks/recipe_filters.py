@@ -0,0 +1,62 @@
+"""Latency of the recipe list tag filter as the number of ids grows"""
+import random
+
+from benchmarks import best_of, setup, test_database
+
+RECIPES = 5000
+TAGS = 500
+TAGS_PER_RECIPE = 5
+ID_COUNTS = (1, 10, 50, 200, 500)
+
+
+def populate(user):
+    from core.models import Recipe, Tag
+
+    tags = Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {i}') for i in range(TAGS)
+    )
+    if tags[0].pk is None:
+        tags = list(Tag.objects.filter(user=user).order_by('id'))
+    Recipe.objects.bulk_create(
+        Recipe(user=user, title=f'recipe {i}', time_minutes=10, price=5)
+        for i in range(RECIPES)
+    )
+    through = Recipe.tags.through
+    rng = random.Random(0)
+    through.objects.bulk_create(
+        through(recipe_id=recipe_id, tag_id=tag.pk)
+        for recipe_id in Recipe.objects.values_list('id', flat=True)
+        for tag in rng.sample(tags, TAGS_PER_RECIPE)
+    )
+
+    return [tag.pk for tag in tags]
+
+
+def main():
+    setup()
+    from django.contrib.auth import get_user_model
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    with test_database():
+        user = get_user_model().objects.create_user('bench@test.com', 'x')
+        tag_ids = populate(user)
+        client = APIClient()
+        client.force_authenticate(user)
+        url = reverse('recipe:recipe-list')
+
+        print(f'{RECIPES} recipes, {TAGS_PER_RECIPE} of {TAGS} tags each')
+        print(f'{"ids":>6} {"any (ms)":>10} {"all (ms)":>10}')
+        for count in ID_COUNTS:
+            ids = ','.join(str(pk) for pk in tag_ids[:count])
+            timings = [
+                best_of(lambda: client.get(url, {'tags': ids, 'match': m}))
+                for m in ('any', 'all')
+            ]
+            print(f'{count:>6} ' + ' '.join(
+                f'{timing * 1000:>10.2f}' for timing in timings
+            ))
+
+
+if __name__ == '__main__':
+    main()
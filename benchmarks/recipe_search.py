@@ -0,0 +1,48 @@
+"""Latency of full text search against a title scan"""
+import random
+
+from benchmarks import best_of, setup, test_database
+
+RECIPES = 50000
+WORDS = [f'word{i}' for i in range(2000)]
+
+
+def populate(user):
+    from core import search
+    from core.models import Recipe
+
+    rng = random.Random(0)
+    Recipe.objects.bulk_create(
+        Recipe(user=user, title=' '.join(rng.sample(WORDS, 4)),
+               time_minutes=10, price=5)
+        for _ in range(RECIPES)
+    )
+    search.update_index(Recipe.objects.values_list('id', flat=True))
+
+
+def main():
+    setup()
+    from django.contrib.auth import get_user_model
+    from core import search
+    from core.models import Recipe
+
+    with test_database():
+        user = get_user_model().objects.create_user('bench@test.com', 'x')
+        populate(user)
+        recipes = Recipe.objects.filter(user=user)
+
+        def scan():
+            list(recipes.filter(title__icontains='word42')
+                 .order_by('-id')[:100])
+
+        def indexed():
+            list(search.search(recipes, 'word42')
+                 .order_by('-rank', '-id')[:100])
+
+        print(f'{RECIPES} recipes')
+        print(f'icontains scan: {best_of(scan) * 1000:.2f} ms')
+        print(f'full text:      {best_of(indexed) * 1000:.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
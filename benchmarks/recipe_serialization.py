@@ -0,0 +1,87 @@
+"""Rows per second of RecipeSerializer against ValuesSerializer"""
+import random
+
+from benchmarks import best_of, setup, test_database
+
+ROW_COUNTS = (1000, 10000, 100000)
+TAGS = 200
+INGREDIENTS = 500
+
+
+def populate(user, count):
+    from core.models import Ingredient, Recipe, Tag
+
+    Tag.objects.bulk_create(
+        Tag(user=user, name=f'tag {i}') for i in range(TAGS)
+    )
+    Ingredient.objects.bulk_create(
+        Ingredient(user=user, name=f'ingredient {i}')
+        for i in range(INGREDIENTS)
+    )
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+    rng = random.Random(0)
+    Recipe.objects.bulk_create(
+        (Recipe(user=user, title=f'recipe {i}', time_minutes=i % 120,
+                price=f'{rng.randint(1, 99999) / 100:.2f}',
+                link=f'https://example.com/{i}')
+         for i in range(count)),
+        batch_size=1000,
+    )
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+    for relation, ids, per_recipe in (('tags', tag_ids, 3),
+                                      ('ingredients', ingredient_ids, 6)):
+        through = getattr(Recipe, relation).through
+        target = f'{through._meta.get_field(relation[:-1]).attname}'
+        through.objects.bulk_create(
+            (through(recipe_id=recipe_id, **{target: pk})
+             for recipe_id in recipe_ids
+             for pk in rng.sample(ids, per_recipe)),
+            batch_size=5000,
+        )
+
+
+def main():
+    setup()
+    from django.contrib.auth import get_user_model
+    from django.db.models import Prefetch
+    from rest_framework.request import Request
+    from rest_framework.test import APIRequestFactory
+    from core.models import Ingredient, Recipe, Tag
+    from recipe.serializers import RecipeSerializer, ValuesSerializer
+
+    with test_database():
+        user = get_user_model().objects.create_user('bench@test.com', 'x')
+        populate(user, max(ROW_COUNTS))
+        context = {'request': Request(APIRequestFactory().get('/'))}
+
+        print(f'{"rows":>7} {"serializer":>12} {"values":>12} {"speedup":>8}')
+        for count in ROW_COUNTS:
+            recipes = Recipe.objects.order_by('pk')[:count]
+
+            def serializer():
+                queryset = recipes.prefetch_related(
+                    Prefetch('tags', queryset=Tag.objects.only('id')
+                             .order_by('pk')),
+                    Prefetch('ingredients',
+                             queryset=Ingredient.objects.only('id')
+                             .order_by('pk')),
+                )
+                RecipeSerializer(queryset, many=True, context=context).data
+
+            def values():
+                serializer = ValuesSerializer(
+                    RecipeSerializer(many=True, context=context)
+                )
+                serializer.to_representation(
+                    serializer.get_queryset(recipes)
+                )
+
+            slow = count / best_of(serializer, repeat=3)
+            fast = count / best_of(values, repeat=3)
+            print(f'{count:>7} {slow:>10.0f}/s {fast:>10.0f}/s '
+                  f'{fast / slow:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,50 @@
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
+from django.test.signals import setting_changed
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from rest_framework.authtoken.models import Token
+        from core import authentication, hashers, health, search, signals, \
+            storage, throttling
+        from core import routers  # noqa: F401 registers its system check
+        from core.models import Ingredient, Recipe, Tag
+
+        post_delete.connect(authentication.invalidate_token, sender=Token)
+        post_save.connect(
+            authentication.invalidate_user_tokens,
+            sender=settings.AUTH_USER_MODEL,
+        )
+        setting_changed.connect(authentication.reset_token_cache)
+        setting_changed.connect(hashers.reset_slots)
+        setting_changed.connect(throttling.reset_buckets)
+        setting_changed.connect(health.reset_health)
+
+        for model in (Recipe, Tag, Ingredient):
+            post_save.connect(signals.bump_collection_version, sender=model)
+            post_delete.connect(signals.bump_collection_version, sender=model)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            m2m_changed.connect(
+                signals.bump_recipe_links_version, sender=through
+            )
+
+        post_save.connect(search.index_recipe, sender=Recipe)
+        post_delete.connect(search.unindex_recipe, sender=Recipe)
+        for through in (Recipe.tags.through, Recipe.ingredients.through):
+            m2m_changed.connect(search.index_recipe_links, sender=through)
+        for model in (Tag, Ingredient):
+            post_save.connect(search.index_linked_recipes, sender=model)
+            pre_delete.connect(search.remember_linked_recipes, sender=model)
+            post_delete.connect(search.index_linked_recipes, sender=model)
+
+        request_started.connect(signals.check_connections)
+        request_finished.connect(signals.mark_connections_idle)
+
+        post_save.connect(storage.count_image_references, sender=Recipe)
+        post_delete.connect(storage.release_image_reference, sender=Recipe)
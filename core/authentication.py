@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.authentication import TokenAuthentication
+
+from core import metrics
+
+DEFAULT_TOKEN_AUTH_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'BACKEND': None,
+}
+
+
+def snapshot(instance):
+    """Return the field values needed to rebuild a model instance"""
+    fields = instance._meta.concrete_fields
+    return (type(instance), tuple(field.attname for field in fields),
+            tuple(getattr(instance, field.attname) for field in fields))
+
+
+def restore(entry):
+    """Build a fresh instance from a snapshot, without a query"""
+    model, names, values = entry
+    return model.from_db(DEFAULT_DB_ALIAS, names, values)
+
+
+class TokenCache:
+    """Cache of token key -> (user, token) lookups
+
+    Entries hold field values, not model instances, so every request
+    gets its own user object to modify. Without BACKEND they live in a
+    per process LRU for at most TTL seconds and an invalidation only
+    reaches the process that made it: other workers may accept a
+    deleted token or a deactivated user until their entry expires. With
+    BACKEND, a django cache alias shared by all workers, the entries
+    are kept there only so every invalidation is seen at once.
+    """
+    key_prefix = 'token-auth:'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._configured = False
+        self.hits = 0
+        self.misses = 0
+
+    def _configure(self):
+        options = dict(DEFAULT_TOKEN_AUTH_CACHE)
+        options.update(getattr(settings, 'TOKEN_AUTH_CACHE', {}))
+        self.max_size = options['MAX_SIZE']
+        self.ttl = options['TTL']
+        backend = options['BACKEND']
+        self.backend = caches[backend] if backend else None
+        self._configured = True
+
+    def reset(self):
+        """Drop all entries and counters and reload the settings"""
+        with self._lock:
+            self._entries.clear()
+            self._configured = False
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the hit and miss counters"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._entries)}
+
+    def get(self, key):
+        """Return a fresh (user, token) for a cached key or None"""
+        if not self._configured:
+            self._configure()
+        if self.backend is not None:
+            entry = self.backend.get(self.key_prefix + key)
+        else:
+            entry = self._get_local(key)
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        user, token = map(restore, entry)
+        token.user = user
+        return user, token
+
+    def _get_local(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Cache the (user, token) pair for the key"""
+        if not self._configured:
+            self._configure()
+        entry = tuple(map(snapshot, value))
+        if self.backend is not None:
+            self.backend.set(self.key_prefix + key, entry, self.ttl)
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        """Invalidate the given token keys"""
+        if not self._configured:
+            self._configure()
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+        if self.backend is not None and keys:
+            self.backend.delete_many([self.key_prefix + key for key in keys])
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication that caches the token -> user lookup
+
+    A drop in replacement for TokenAuthentication that skips the token
+    and user query for tokens seen recently. Entries are invalidated when
+    the token is deleted or its user is saved, which covers deactivation
+    and password changes.
+    """
+    cache = token_cache
+
+    def authenticate_credentials(self, key):
+        cached = self.cache.get(key)
+        metrics.count_token_cache(cached is not None)
+        if cached is not None:
+            return cached
+
+        user, token = super().authenticate_credentials(key)
+        self.cache.set(key, (user, token))
+        return user, token
+
+
+def invalidate_token(sender, instance, **kwargs):
+    """Drop a deleted token from the cache"""
+    token_cache.delete(instance.key)
+
+
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Drop the cached tokens of a saved user"""
+    from rest_framework.authtoken.models import Token
+
+    keys = Token.objects.filter(user=instance).values_list('key', flat=True)
+    token_cache.delete(*keys)
+
+
+def reset_token_cache(setting, **kwargs):
+    """Reload the token cache when its settings change"""
+    if setting in ('TOKEN_AUTH_CACHE', 'CACHES'):
+        token_cache.reset()
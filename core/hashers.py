@@ -0,0 +1,121 @@
+"""Password hashing with a tunable cost and bounded concurrency
+
+`PBKDF2PasswordHasher` reads its iteration count from PASSWORD_HASHING,
+so the cost of a login can be tuned without a new hasher name. Django
+rehashes a password on the next successful login whenever its stored
+algorithm or iteration count differs from the preferred hasher.
+
+Its hashes run in one of at most `WORKERS` slots per process, by default
+the CPU cores shared between the WEB_CONCURRENCY worker processes. A
+login finding no free slot within `TIMEOUT` seconds, one by default,
+raises PasswordHashingBusy instead of holding its worker thread, which
+`exception_handler` and `PasswordHashingBusyMiddleware` answer with 503
+for the API and for every other login, such as the admin's.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.http import HttpResponse
+from rest_framework import status, views
+from rest_framework.exceptions import APIException
+
+BUSY_DETAIL = 'Too many logins at once, try again shortly.'
+RETRY_AFTER = '1'
+
+
+def default_workers():
+    """Return the CPU cores of one of the WEB_CONCURRENCY processes"""
+    processes = max(int(os.environ.get('WEB_CONCURRENCY') or 1), 1)
+    return max((os.cpu_count() or 1) // processes, 1)
+
+
+DEFAULT_PASSWORD_HASHING = {
+    'ITERATIONS': None,
+    'WORKERS': default_workers(),
+    'TIMEOUT': 1,
+}
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+class PasswordHashingBusy(Exception):
+    """Every password hashing slot is taken"""
+
+
+class PasswordHashingBusyError(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = BUSY_DETAIL
+    default_code = 'password_hashing_busy'
+
+
+def exception_handler(exc, context):
+    """DRF's exception handler, answering PasswordHashingBusy with 503"""
+    if isinstance(exc, PasswordHashingBusy):
+        exc = PasswordHashingBusyError()
+    response = views.exception_handler(exc, context)
+    if isinstance(exc, PasswordHashingBusyError):
+        response['Retry-After'] = RETRY_AFTER
+    return response
+
+
+class PasswordHashingBusyMiddleware:
+    """Answer PasswordHashingBusy raised outside the API with 503"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, PasswordHashingBusy):
+            response = HttpResponse(BUSY_DETAIL, content_type='text/plain',
+                                    status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            response['Retry-After'] = RETRY_AFTER
+            return response
+        return None
+
+
+def get_options():
+    options = dict(DEFAULT_PASSWORD_HASHING)
+    options.update(getattr(settings, 'PASSWORD_HASHING', {}))
+    return options
+
+
+def get_slots():
+    global _slots
+    with _slots_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(get_options()['WORKERS'])
+        return _slots
+
+
+def reset_slots(setting, **kwargs):
+    """Resize the hashing slots when their settings change"""
+    global _slots
+    if setting == 'PASSWORD_HASHING':
+        with _slots_lock:
+            _slots = None
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    """PBKDF2-SHA256 with the iterations of PASSWORD_HASHING"""
+
+    @property
+    def iterations(self):
+        return get_options()['ITERATIONS'] or super().iterations
+
+    def encode(self, password, salt, iterations=None):
+        slots = get_slots()
+        timeout = get_options()['TIMEOUT']
+        acquired = slots.acquire(timeout=timeout) if timeout > 0 \
+            else slots.acquire(blocking=False)
+        if not acquired:
+            raise PasswordHashingBusy()
+        try:
+            return super().encode(password, salt, iterations)
+        finally:
+            slots.release()
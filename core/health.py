@@ -0,0 +1,105 @@
+"""Readiness checks behind the /healthz endpoint
+
+Each check returns a dict with at least `ok`. The combined result is
+kept for HEALTH_CHECK['CACHE_SECONDS'] per process. Pending migrations
+are looked up until a check finds none, as the code of a running process
+does not gain migrations, so frequent load balancer probes then cost one
+database round trip and one small file write per window.
+"""
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.migrations.executor import MigrationExecutor
+
+DEFAULT_HEALTH_CHECK = {
+    'CACHE_SECONDS': 5,
+    'DATABASE': DEFAULT_DB_ALIAS,
+}
+
+_result = None
+_expires = 0
+# aliases found with every migration applied
+_migrated = set()
+_lock = threading.Lock()
+
+
+def get_options():
+    options = dict(DEFAULT_HEALTH_CHECK)
+    options.update(getattr(settings, 'HEALTH_CHECK', {}))
+    return options
+
+
+def check_database(alias):
+    """Time a round trip to the database"""
+    start = time.perf_counter()
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError as e:
+        return {'ok': False, 'error': str(e)}
+    latency = (time.perf_counter() - start) * 1000
+    return {'ok': True, 'latency_ms': round(latency, 2)}
+
+
+def check_migrations(alias):
+    """List the migrations not applied yet"""
+    if alias in _migrated:
+        return {'ok': True, 'pending': []}
+    try:
+        executor = MigrationExecutor(connections[alias])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+    except DatabaseError as e:
+        return {'ok': False, 'error': str(e)}
+    pending = [f'{migration.app_label}.{migration.name}'
+               for migration, backwards in plan]
+    if not pending:
+        _migrated.add(alias)
+    return {'ok': not pending, 'pending': pending}
+
+
+def check_media():
+    """Write and remove a small file in MEDIA_ROOT"""
+    try:
+        with tempfile.NamedTemporaryFile(dir=settings.MEDIA_ROOT,
+                                         prefix='.healthz-') as f:
+            f.write(b'ok')
+            f.flush()
+    except OSError as e:
+        return {'ok': False, 'error': str(e)}
+    return {'ok': True}
+
+
+def run_checks():
+    alias = get_options()['DATABASE']
+    checks = {'database': check_database(alias)}
+    if checks['database']['ok']:
+        checks['migrations'] = check_migrations(alias)
+    checks['media'] = check_media()
+    return {
+        'ok': all(check['ok'] for check in checks.values()),
+        'checks': checks,
+    }
+
+
+def get_health():
+    """Return the cached check results, running them when they expired"""
+    global _result, _expires
+    with _lock:
+        now = time.monotonic()
+        if _result is None or now >= _expires:
+            _result = run_checks()
+            _expires = now + get_options()['CACHE_SECONDS']
+        return _result
+
+
+def reset_health(setting, **kwargs):
+    """Forget the cached results when the settings they read change"""
+    global _result
+    if setting in ('HEALTH_CHECK', 'MEDIA_ROOT', 'DATABASES'):
+        with _lock:
+            _result = None
+            _migrated.clear()
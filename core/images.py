@@ -0,0 +1,153 @@
+"""Resized derivatives of recipe images
+
+Uploads are rendered into a few sizes and formats by a process pool so
+requests never wait for Pillow. Each derivative is stored next to the
+original as `<name>.<size>.<ext>` and `Recipe.image_derivatives` is set
+once all of them exist.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image
+
+DEFAULT_RECIPE_IMAGE_DERIVATIVES = {
+    'SIZES': {'thumb': 150, 'medium': 600, 'large': 1200},
+    'FORMATS': {'webp': 'WEBP', 'jpg': 'JPEG'},
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'ASYNC': True,
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_options():
+    options = dict(DEFAULT_RECIPE_IMAGE_DERIVATIVES)
+    options.update(getattr(settings, 'RECIPE_IMAGE_DERIVATIVES', {}))
+    return options
+
+
+def derivative_name(name, size, ext):
+    """Return the storage name of one derivative of an image"""
+    return f'{os.path.splitext(name)[0]}.{size}.{ext}'
+
+
+def get_formats():
+    """Return the configured {ext: Pillow format} this Pillow can write
+
+    Pillow built without libwebp cannot save WEBP, which would otherwise
+    fail every render before the other formats are written.
+    """
+    Image.init()
+    return {ext: image_format
+            for ext, image_format in get_options()['FORMATS'].items()
+            if image_format.upper() in Image.SAVE}
+
+
+def derivative_names(name):
+    """Return {size: {ext: storage name}} for an image"""
+    formats = get_formats()
+    return {
+        size: {ext: derivative_name(name, size, ext) for ext in formats}
+        for size in get_options()['SIZES']
+    }
+
+
+def render(source, targets, quality):
+    """Write resized copies of the source image
+
+    `targets` is a list of (path, max side in pixels, Pillow format).
+    Runs in the worker processes, so it only touches the filesystem.
+    """
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+        for path, max_side, image_format in targets:
+            resized = image.copy()
+            resized.thumbnail((max_side, max_side), Image.LANCZOS)
+            if image_format == 'JPEG' and resized.mode != 'RGB':
+                resized = resized.convert('RGB')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f'{path}.part'
+            resized.save(partial, image_format, quality=quality)
+            os.replace(partial, path)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=get_options()['WORKERS']
+            )
+        return _executor
+
+
+def render_args(name):
+    """Return the arguments of render for the derivatives of an image"""
+    options = get_options()
+    formats = get_formats()
+    targets = [
+        (default_storage.path(derivative_name(name, size, ext)), max_side,
+         image_format)
+        for size, max_side in options['SIZES'].items()
+        for ext, image_format in formats.items()
+    ]
+    return default_storage.path(name), targets, options['QUALITY']
+
+
+def submit(recipe_id, name):
+    """Render the derivatives of an image, in the pool unless ASYNC is off
+
+    Returns a future when rendering in the pool, otherwise None.
+    """
+    options = get_options()
+    args = render_args(name)
+    if not options['ASYNC']:
+        render(*args)
+        mark_ready(recipe_id, name)
+        return None
+
+    future = get_executor().submit(render, *args)
+    future.add_done_callback(lambda f: _finished(f, recipe_id, name))
+    return future
+
+
+def _finished(future, recipe_id, name):
+    error = future.exception()
+    if error is not None:
+        logger.error('Rendering the derivatives of %s of recipe %s failed',
+                     name, recipe_id, exc_info=error)
+        return
+    # runs in an executor thread with its own database connection
+    try:
+        mark_ready(recipe_id, name)
+    finally:
+        connections.close_all()
+
+
+def mark_ready(recipe_id, name):
+    """Flag the derivatives as ready unless the image changed meanwhile"""
+    from core.models import CollectionVersion, Recipe
+
+    recipes = Recipe.objects.filter(pk=recipe_id, image=name)
+    user_id = recipes.values_list('user_id', flat=True).first()
+    if user_id is not None:
+        recipes.update(image_derivatives=True)
+        CollectionVersion.objects.bump(user_id, 'recipe')
+
+
+def schedule(recipe):
+    """Render the derivatives of a newly saved image after commit"""
+    if recipe.image:
+        name = recipe.image.name
+        transaction.on_commit(lambda: submit(recipe.pk, name))
@@ -0,0 +1,216 @@
+"""Per request SQL timing, Server-Timing headers and a slow request log
+
+`QueryInstrumentationMiddleware` times every query of the requests under
+QUERY_INSTRUMENTATION['PATHS'] through a connection execute wrapper and
+reports, in milliseconds:
+
+- db: time spent executing SQL, with the number of queries
+- serialize: time in the view outside SQL, which for the API views is
+  mostly validation and serialization
+- render: time rendering the response
+- total: time through the middleware
+
+Requests slower than SLOW_REQUEST_MS are logged to `core.instrumentation`
+as one JSON object with the TOP_QUERIES statements that took longest and
+the line of project code that first ran each of them. A query costs two
+clock reads and a dict update, so it can stay on in production.
+
+Streamed responses, such as the recipe export, send their headers
+before the view's generator runs, so their Server-Timing only covers
+the time to the first byte. The queries run while streaming are still
+timed, and the slow request log waits for the end of the stream.
+"""
+import json
+import logging
+import os
+import sys
+import sysconfig
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERY_INSTRUMENTATION = {
+    'ENABLED': True,
+    'PATHS': ('/api/',),
+    'SLOW_REQUEST_MS': 500,
+    'TOP_QUERIES': 5,
+    # distinct statements tracked per request, later ones are only counted
+    'MAX_STATEMENTS': 1000,
+}
+STDLIB = sysconfig.get_paths()['stdlib']
+
+
+def get_options():
+    options = dict(DEFAULT_QUERY_INSTRUMENTATION)
+    options.update(getattr(settings, 'QUERY_INSTRUMENTATION', {}))
+    return options
+
+
+def call_site():
+    """Return 'file:line in function' of the project code running a query"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != __file__ and not filename.startswith(STDLIB) and \
+                'site-packages' not in filename:
+            path = os.path.relpath(filename, settings.BASE_DIR)
+            return f'{path}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def instrument_stream(iterator, wrapper):
+    """Run the queries producing each item of a stream through `wrapper`
+
+    Streamed content is produced after the middleware returned, so the
+    wrappers it installed around the view no longer apply.
+    """
+    iterator = iter(iterator)
+    while True:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(wrapper))
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class QueryStats:
+    """Execute wrapper adding up the queries of one request"""
+
+    def __init__(self, max_statements):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = {}
+        self.max_statements = max_statements
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            statement = self.statements.get(sql)
+            if statement is not None:
+                statement[0] += 1
+                statement[1] += elapsed
+            elif len(self.statements) < self.max_statements:
+                self.statements[sql] = [1, elapsed, call_site()]
+
+    def top(self, number):
+        """Return the statements that took longest, slowest first"""
+        statements = sorted(self.statements.items(),
+                            key=lambda item: item[1][1], reverse=True)
+        return [{
+            'sql': sql,
+            'count': count,
+            'ms': round(duration * 1000, 2),
+            'call_site': site,
+        } for sql, (count, duration, site) in statements[:number]]
+
+
+class RequestTimer:
+    """Timings of one request, kept as `request._timer`"""
+
+    def __init__(self, options):
+        self.start = time.perf_counter()
+        self.queries = QueryStats(options['MAX_STATEMENTS'])
+        self.view_start = self.view_queries = None
+        self.render_start = None
+        self.serialize = self.render = 0.0
+
+    def view_finished(self):
+        """Note the end of the view, and the start of rendering"""
+        if self.view_start is not None and self.render_start is None:
+            self.render_start = time.perf_counter()
+            db = self.queries.duration - self.view_queries
+            self.serialize = self.render_start - self.view_start - db
+
+    def server_timing(self, total):
+        metrics = (
+            ('db', self.queries.duration,
+             f'{self.queries.count} queries'),
+            ('serialize', self.serialize, None),
+            ('render', self.render, None),
+            ('total', total, None),
+        )
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f}' +
+            (f';desc="{desc}"' if desc else '')
+            for name, duration, desc in metrics
+        )
+
+
+class QueryInstrumentationMiddleware:
+    """Time the SQL, view and rendering of the instrumented requests"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        options = get_options()
+        if not options['ENABLED'] or \
+                not request.path.startswith(tuple(options['PATHS'])):
+            return self.get_response(request)
+
+        timer = request._timer = RequestTimer(options)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer.queries))
+            response = self.get_response(request)
+        end = time.perf_counter()
+        if timer.render_start is not None:
+            timer.render = end - timer.render_start
+        else:
+            # responses rendered by the view, such as streamed exports
+            timer.view_finished()
+        total = end - timer.start
+        response['Server-Timing'] = timer.server_timing(total)
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, response, response.streaming_content, timer, options
+            )
+        elif total * 1000 >= options['SLOW_REQUEST_MS']:
+            self.log_slow_request(request, response, timer, total, options)
+        return response
+
+    def stream(self, request, response, content, timer, options):
+        """Time the queries of streamed content, then log if slow"""
+        yield from instrument_stream(content, timer.queries)
+        total = time.perf_counter() - timer.start
+        if total * 1000 >= options['SLOW_REQUEST_MS']:
+            self.log_slow_request(request, response, timer, total, options)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timer = getattr(request, '_timer', None)
+        if timer is not None:
+            timer.view_start = time.perf_counter()
+            timer.view_queries = timer.queries.duration
+
+    def process_template_response(self, request, response):
+        timer = getattr(request, '_timer', None)
+        if timer is not None:
+            timer.view_finished()
+        return response
+
+    def log_slow_request(self, request, response, timer, total, options):
+        match = request.resolver_match
+        logger.warning(json.dumps({
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(timer.queries.duration * 1000, 2),
+            'queries': timer.queries.count,
+            'top_queries': timer.queries.top(options['TOP_QUERIES']),
+        }))
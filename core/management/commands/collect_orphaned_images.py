@@ -0,0 +1,90 @@
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from core import storage, uploads
+
+
+class Command(BaseCommand):
+    """Django command to delete uploaded images no recipe references"""
+    help = (
+        'Delete files of the recipe upload directory, and their resized '
+        'variants, that no recipe references, and chunked uploads that '
+        'stopped receiving chunks. With --interval the collection repeats '
+        'until interrupted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report the files to delete')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='seconds before a new file may be deleted')
+        parser.add_argument('--upload-max-age', type=int, default=86400,
+                            help='seconds after its last chunk before a '
+                                 'chunked upload is deleted')
+        parser.add_argument('--rate', type=float, default=0,
+                            help='maximum deletions per second, 0 for no '
+                                 'limit')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='file names checked per query')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='seconds between collections in periodic '
+                                 'mode')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['rate'] < 0:
+            raise CommandError('--rate must not be negative')
+
+        while True:
+            self.collect(options)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def collect(self, options):
+        """Run one collection and report the space reclaimed"""
+        deleted = 0
+        reclaimed = 0
+        start = time.monotonic()
+        orphans = storage.find_orphans(batch_size=options['batch_size'],
+                                       min_age=options['min_age'])
+        for name, size in orphans:
+            if options['dry_run']:
+                self.stdout.write(f'would delete {name}')
+            else:
+                if not default_storage.exists(name):
+                    continue
+                if options['rate']:
+                    delay = start + deleted / options['rate'] - \
+                        time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                default_storage.delete(name)
+            deleted += 1
+            reclaimed += size
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} orphaned files, {reclaimed} bytes reclaimed'
+        ))
+        self.collect_uploads(options, verb)
+
+    def collect_uploads(self, options, verb):
+        """Delete the chunked uploads that stopped receiving chunks"""
+        abandoned = 0
+        reclaimed = 0
+        for upload, size in uploads.find_abandoned(options['upload_max_age']):
+            if options['dry_run']:
+                self.stdout.write(f'would delete {upload.path}')
+            else:
+                upload.discard()
+            abandoned += 1
+            reclaimed += size
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {abandoned} abandoned uploads, {reclaimed} bytes '
+            f'reclaimed'
+        ))
@@ -0,0 +1,58 @@
+from concurrent.futures import wait
+
+from django.core.management.base import BaseCommand
+
+from core import images
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command to render the derivatives of existing images"""
+    help = 'Render resized variants of recipe images that have none yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='re-render images that already have them')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='images queued in the pool at once')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(image_derivatives=False)
+        recipes = recipes.order_by('pk').values_list('pk', 'image')
+
+        done = 0
+        failed = 0
+        last_pk = 0
+        while True:
+            batch = list(recipes.filter(pk__gt=last_pk)
+                         [:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            futures = {}
+            for pk, name in batch:
+                try:
+                    future = images.submit(pk, name)
+                except OSError as exc:
+                    self.stderr.write(f'{name}: {exc}')
+                    failed += 1
+                    continue
+                if future is None:
+                    done += 1
+                else:
+                    futures[future] = name
+            wait(futures)
+            for future, name in futures.items():
+                if future.exception() is None:
+                    done += 1
+                else:
+                    self.stderr.write(f'{name}: {future.exception()}')
+                    failed += 1
+            self.stdout.write(f'{done} images rendered, {failed} failed')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered derivatives of {done} images'
+        ))
@@ -0,0 +1,220 @@
+import csv
+import gzip
+import json
+import os
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from core.models import ImportProgress, Ingredient, Recipe, Tag
+
+
+class RowError(ValueError):
+    pass
+
+
+def open_text(path):
+    """Open a plain or gzip compressed file for streaming text reads"""
+    with open(path, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    if compressed:
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+
+    return open(path, encoding='utf-8', newline='')
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+
+    return 'ndjson'
+
+
+class Command(BaseCommand):
+    """Django command to bulk load recipes from NDJSON or CSV files"""
+    help = (
+        'Import recipes for a user from NDJSON or CSV files, optionally '
+        'gzip compressed. Progress is checkpointed in the transaction of '
+        'every chunk so an interrupted import can be continued with '
+        '--resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--user', required=True,
+                            help='email of the user owning the recipes')
+        parser.add_argument('--format', choices=('ndjson', 'csv'),
+                            help='input format, guessed from the extension')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='rows committed per transaction')
+        parser.add_argument('--list-separator', default='|',
+                            help='separator of tag and ingredient names '
+                                 'in CSV columns')
+        parser.add_argument('--resume', action='store_true',
+                            help='skip the rows committed by a previous run')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        try:
+            self.user = get_user_model().objects.get(email=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        self.options = options
+        self.name_ids = {'tags': {}, 'ingredients': {}}
+        total = 0
+        start = time.monotonic()
+        for path in options['files']:
+            total += self.import_file(path)
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} recipes in {elapsed:.1f}s '
+            f'({total / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+
+    def checkpoint(self, path):
+        source = os.path.abspath(path)
+        if len(source) > 255:
+            raise CommandError(f'{path}: path too long to checkpoint')
+        return ImportProgress.objects.filter(user=self.user, source=source)
+
+    def read_checkpoint(self, path):
+        """Return the number of rows committed by a previous run"""
+        if not self.options['resume']:
+            return 0
+        rows = self.checkpoint(path).values_list('rows', flat=True).first()
+        return rows or 0
+
+    def write_checkpoint(self, path, rows):
+        if not self.checkpoint(path).update(rows=rows):
+            ImportProgress.objects.create(user=self.user, rows=rows,
+                                          source=os.path.abspath(path))
+
+    def clear_checkpoint(self, path):
+        self.checkpoint(path).delete()
+
+    def import_file(self, path):
+        """Import one file and return the number of recipes created"""
+        committed = self.read_checkpoint(path)
+        if committed:
+            self.stdout.write(f'{path}: resuming after row {committed}')
+        file_format = self.options['format'] or detect_format(path)
+        chunk_size = self.options['chunk_size']
+        created = 0
+        start = time.monotonic()
+        with open_text(path) as f:
+            rows = self.read_rows(f, file_format, committed)
+            chunk = []
+            for number, row in enumerate(rows, committed + 1):
+                try:
+                    chunk.append(self.parse_row(row))
+                except RowError as exc:
+                    self.stderr.write(f'{path}:{number}: {exc}')
+                if number - committed == chunk_size:
+                    with transaction.atomic():
+                        created += self.save_chunk(chunk)
+                        self.write_checkpoint(path, number)
+                    committed = number
+                    self.report(path, created, start)
+                    chunk = []
+            with transaction.atomic():
+                created += self.save_chunk(chunk)
+                self.clear_checkpoint(path)
+            if chunk:
+                self.report(path, created, start)
+
+        return created
+
+    def report(self, path, created, start):
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f'{path}: {created} recipes '
+            f'({created / max(elapsed, 1e-9):.0f} rows/s)'
+        )
+
+    def read_rows(self, f, file_format, skip=0):
+        """Yield dicts from the file without loading it in memory"""
+        if file_format == 'csv':
+            separator = self.options['list_separator']
+            for number, row in enumerate(csv.DictReader(f), 1):
+                if number <= skip:
+                    continue
+                for name in ('tags', 'ingredients'):
+                    value = row.get(name) or ''
+                    row[name] = [item for item in value.split(separator)
+                                 if item.strip()]
+                yield row
+            return
+
+        lines = (line for line in f if line.strip())
+        for number, line in enumerate(lines, 1):
+            if number <= skip:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+    def parse_row(self, row):
+        """Return recipe fields and related names from an input row"""
+        if not isinstance(row, dict):
+            raise RowError('not a JSON object')
+        title = str(row.get('title') or '').strip()
+        if not title or len(title) > 255:
+            raise RowError('title must have 1 to 255 characters')
+        try:
+            time_minutes = int(row.get('time_minutes'))
+            price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+        except (TypeError, ValueError, InvalidOperation):
+            raise RowError('invalid time_minutes or price')
+        if not price.is_finite() or abs(price) >= 1000:
+            raise RowError('price must be less than 1000')
+        link = str(row.get('link') or '')[:255]
+
+        names = {}
+        for name in ('tags', 'ingredients'):
+            items = row.get(name) or []
+            if not isinstance(items, list):
+                raise RowError(f'{name} must be a list')
+            # accepts plain names as well as exported {"id", "name"} items
+            names[name] = [
+                str(item.get('name') if isinstance(item, dict) else item)
+                for item in items
+            ]
+            names[name] = [item.strip()[:255] for item in names[name]
+                           if item.strip()]
+
+        return Recipe(user=self.user, title=title, time_minutes=time_minutes,
+                      price=price, link=link), names
+
+    def resolve_names(self, chunk):
+        """Map the chunk's tag and ingredient names to ids"""
+        for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+            known = self.name_ids[name]
+            missing = {item for _, names in chunk for item in names[name]
+                       if item not in known}
+            if missing:
+                known.update(
+                    model.objects.get_or_create_many(self.user, missing)
+                )
+
+        return [{name: [self.name_ids[name][item] for item in names[name]]
+                 for name in names} for _, names in chunk]
+
+    def save_chunk(self, chunk):
+        """Insert one chunk of recipes in a single transaction"""
+        if not chunk:
+            return 0
+
+        links = self.resolve_names(chunk)
+        Recipe.objects.bulk_create_with_links(
+            [recipe for recipe, _ in chunk], links
+        )
+        return len(chunk)
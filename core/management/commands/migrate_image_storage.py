@@ -0,0 +1,78 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core import images
+from core.models import CollectionVersion, Recipe, StoredFile
+from core.storage import ContentAddressedStorage, is_content_addressed
+
+
+class Command(BaseCommand):
+    """Django command to move recipe images to content addressed names"""
+    help = (
+        'Rename existing recipe images to sharded content addressed '
+        'names, merging files with identical content.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report the images to migrate')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        storage = ContentAddressedStorage(location=settings.MEDIA_ROOT)
+        recipes = Recipe.objects.exclude(image='').exclude(image=None) \
+            .order_by('pk').values_list('pk', 'user_id', 'image')
+        migrated = duplicates = saved = 0
+        for pk, user_id, name in recipes.iterator():
+            if is_content_addressed(name):
+                continue
+            if not default_storage.exists(name):
+                self.stderr.write(f'{name}: missing, skipped')
+                continue
+            if options['dry_run']:
+                self.stdout.write(f'would migrate {name}')
+                migrated += 1
+                continue
+
+            size = default_storage.size(name)
+            with default_storage.open(name) as f:
+                new_name = storage.save(name, f)
+            if StoredFile.objects.filter(name=new_name).exists():
+                duplicates += 1
+                saved += size
+            self.move_derivatives(name, new_name)
+            with transaction.atomic():
+                updated = Recipe.objects.filter(pk=pk, image=name).update(
+                    image=new_name
+                )
+                if updated:
+                    StoredFile.objects.acquire(new_name)
+                    StoredFile.objects.release(name)
+                    # cached representations link the old image names
+                    CollectionVersion.objects.bump(user_id, 'recipe')
+            if updated:
+                migrated += 1
+
+        verb = 'Would migrate' if options['dry_run'] else 'Migrated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {migrated} images, {duplicates} duplicates merged, '
+            f'{saved} bytes reclaimed'
+        ))
+
+    def move_derivatives(self, name, new_name):
+        """Rename rendered derivatives so they need no re-rendering"""
+        new_names = images.derivative_names(new_name)
+        for size, formats in images.derivative_names(name).items():
+            for ext, derivative in formats.items():
+                source = default_storage.path(derivative)
+                target = default_storage.path(new_names[size][ext])
+                if not os.path.exists(source):
+                    continue
+                if os.path.exists(target):
+                    os.remove(source)
+                else:
+                    os.replace(source, target)
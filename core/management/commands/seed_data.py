@@ -0,0 +1,316 @@
+import io
+import itertools
+import os
+import random
+import time
+from collections import Counter
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from PIL import Image
+
+from core import images, search, storage
+from core.models import Ingredient, Recipe, StoredFile, Tag
+
+TAG_WORDS = (
+    'Vegan', 'Vegetarian', 'Quick', 'Dessert', 'Breakfast', 'Spicy',
+    'Healthy', 'Comfort', 'Gluten free', 'Dinner', 'Lunch', 'Snack',
+    'Baking', 'Grill', 'Soup', 'Salad', 'Budget', 'Party', 'Summer',
+    'Winter', 'Kids', 'Low carb', 'Seafood', 'Italian', 'Mexican',
+    'Indian', 'Thai', 'Japanese', 'French', 'One pot',
+)
+INGREDIENT_WORDS = (
+    'Salt', 'Pepper', 'Olive oil', 'Garlic', 'Onion', 'Butter', 'Flour',
+    'Sugar', 'Egg', 'Milk', 'Tomato', 'Lemon', 'Rice', 'Chicken',
+    'Potato', 'Carrot', 'Cheese', 'Basil', 'Parsley', 'Ginger', 'Beef',
+    'Pasta', 'Cream', 'Honey', 'Chili', 'Spinach', 'Mushroom', 'Bacon',
+    'Salmon', 'Lime', 'Coriander', 'Cumin', 'Yogurt', 'Beans', 'Tofu',
+)
+ADJECTIVES = (
+    'Easy', 'Classic', 'Crispy', 'Creamy', 'Roasted', 'Smoky', 'Fresh',
+    'Slow cooked', 'Grilled', 'Sticky', 'Spiced', 'Baked', 'Zesty',
+)
+DISHES = (
+    'Curry', 'Stew', 'Pie', 'Salad', 'Soup', 'Tacos', 'Risotto', 'Bowl',
+    'Traybake', 'Pasta', 'Burger', 'Stir fry', 'Tart', 'Cake', 'Wrap',
+)
+DISTRIBUTIONS = ('constant', 'uniform', 'exponential', 'zipf')
+# two parameters each, within SQLite's default limit of 999
+LINKS_PER_INSERT = 490
+
+
+def vocabulary_name(words, rank):
+    """Return the name of the rank-th most used tag or ingredient"""
+    cycle, index = divmod(rank, len(words))
+    return f'{words[index]} {cycle + 1}' if cycle else words[index]
+
+
+def zipf_cum_weights(size, exponent):
+    """Cumulative weights of ranks 0..size-1 with P(rank) ~ 1/(rank+1)^s"""
+    return list(itertools.accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)
+    ))
+
+
+def next_id(model):
+    return (model.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+
+class Command(BaseCommand):
+    """Django command to generate a synthetic dataset for load testing"""
+    help = (
+        'Create users with recipes, tags and ingredients drawn from Zipf '
+        'distributions, in bulk inserts of --batch-size recipes. The same '
+        '--seed always generates the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100,
+                            help='number of users to create')
+        parser.add_argument('--recipes-per-user', type=float, default=20,
+                            help='mean number of recipes of a user')
+        parser.add_argument('--distribution', choices=DISTRIBUTIONS,
+                            default='zipf',
+                            help='distribution of the recipes per user')
+        parser.add_argument('--zipf-exponent', type=float, default=1.1,
+                            help='skew of the zipf distributions')
+        parser.add_argument('--tags-per-recipe', type=int, default=3)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument('--vocabulary', type=int, default=500,
+                            help='distinct tag and ingredient names drawn '
+                                 'from')
+        parser.add_argument('--images', type=float, default=0,
+                            help='fraction of recipes with a placeholder '
+                                 'image')
+        parser.add_argument('--placeholders', type=int, default=8,
+                            help='distinct placeholder images')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='recipes inserted per transaction')
+        parser.add_argument('--password', default='password',
+                            help='password of every created user')
+
+    def handle(self, *args, **options):
+        """Handle the command"""
+        if options['users'] < 0 or options['recipes_per_user'] < 0:
+            raise CommandError('--users and --recipes-per-user must not be '
+                               'negative')
+        if options['batch_size'] < 1 or options['vocabulary'] < 1:
+            raise CommandError('--batch-size and --vocabulary must be '
+                               'positive')
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images must be between 0 and 1')
+
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.email = f"seed{options['seed']}-user{{}}@example.com"
+        User = get_user_model()
+        if User.objects.filter(email=self.email.format(0)).exists():
+            raise CommandError(f"Data of seed {options['seed']} exists "
+                               f"already, pick another --seed")
+
+        self.cum_weights = zipf_cum_weights(options['vocabulary'],
+                                            options['zipf_exponent'])
+        self.ids = {model: next_id(model)
+                    for model in (User, Tag, Ingredient, Recipe)}
+        self.password = make_password(options['password'])
+        self.placeholders = self.create_placeholders() \
+            if options['images'] else []
+        self.totals = Counter()
+
+        start = time.monotonic()
+        try:
+            self.generate()
+        finally:
+            self.reset_sequences()
+        elapsed = time.monotonic() - start
+        rows = sum(self.totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {self.totals['users']} users, "
+            f"{self.totals['recipes']} recipes, {self.totals['tags']} tags, "
+            f"{self.totals['ingredients']} ingredients and "
+            f"{self.totals['links']} links in {elapsed:.1f}s "
+            f'({rows / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
+
+    def take_id(self, model):
+        pk = self.ids[model]
+        self.ids[model] += 1
+        return pk
+
+    def recipe_counts(self):
+        """Yield the number of recipes of each user"""
+        users = self.options['users']
+        mean = self.options['recipes_per_user']
+        distribution = self.options['distribution']
+        if distribution == 'zipf':
+            # user n is the n-th most prolific
+            weights = zipf_cum_weights(users, self.options['zipf_exponent'])
+            scale = mean * users / weights[-1] if users else 0
+            previous = 0
+            for weight in weights:
+                yield round((weight - previous) * scale)
+                previous = weight
+            return
+        for _ in range(users):
+            if distribution == 'constant':
+                yield round(mean)
+            elif distribution == 'uniform':
+                yield self.rng.randint(0, round(2 * mean))
+            else:
+                yield int(self.rng.expovariate(1 / mean)) if mean else 0
+
+    def draw(self, k):
+        """Return up to k distinct vocabulary ranks drawn by popularity"""
+        if k < 1:
+            return []
+        ranks = self.rng.choices(range(len(self.cum_weights)),
+                                 cum_weights=self.cum_weights, k=k)
+        return list(dict.fromkeys(ranks))
+
+    def generate(self):
+        batch = Batch()
+        for number, count in enumerate(self.recipe_counts()):
+            self.add_user(batch, number, count)
+            if len(batch.recipes) >= self.options['batch_size'] or \
+                    len(batch.users) >= self.options['batch_size']:
+                self.save(batch)
+                batch = Batch()
+        self.save(batch)
+
+    def add_user(self, batch, number, count):
+        User = get_user_model()
+        user_id = self.take_id(User)
+        batch.users.append(User(
+            pk=user_id, email=self.email.format(number),
+            name=f'Seed user {number}', password=self.password,
+            is_staff=False,
+        ))
+
+        names = {Tag: {}, Ingredient: {}}
+        for _ in range(count):
+            recipe = Recipe(
+                pk=self.take_id(Recipe), user_id=user_id,
+                time_minutes=self.rng.randint(5, 180),
+                price=Decimal(self.rng.randrange(100, 5000)) / 100,
+            )
+            links = {}
+            for model, words, k in (
+                    (Tag, TAG_WORDS, self.options['tags_per_recipe']),
+                    (Ingredient, INGREDIENT_WORDS,
+                     self.options['ingredients_per_recipe'])):
+                ids = names[model]
+                links[model] = []
+                for rank in self.draw(k):
+                    if rank not in ids:
+                        ids[rank] = self.take_id(model)
+                        batch.attrs[model].append(model(
+                            pk=ids[rank], user_id=user_id,
+                            name=vocabulary_name(words, rank),
+                        ))
+                    links[model].append(ids[rank])
+            main = self.rng.choice(INGREDIENT_WORDS)
+            recipe.title = f'{self.rng.choice(ADJECTIVES)} {main} ' \
+                f'{self.rng.choice(DISHES)}'
+            if self.placeholders and \
+                    self.rng.random() < self.options['images']:
+                recipe.image = self.rng.choice(self.placeholders)
+                recipe.image_derivatives = True
+            batch.recipes.append(recipe)
+            batch.links.append(links)
+
+    def save(self, batch):
+        """Insert one batch of rows in a single transaction"""
+        if not batch.users:
+            return
+        with transaction.atomic():
+            get_user_model().objects.bulk_create(batch.users)
+            for model in (Tag, Ingredient):
+                model.objects.bulk_create(batch.attrs[model])
+            Recipe.objects.bulk_create(batch.recipes)
+            for name, model in (('tags', Tag), ('ingredients', Ingredient)):
+                rows = [
+                    (recipe.pk, pk)
+                    for recipe, links in zip(batch.recipes, batch.links)
+                    for pk in links[model]
+                ]
+                self.insert_links(Recipe._meta.get_field(name), rows)
+                self.totals['links'] += len(rows)
+            references = Counter(recipe.image.name for recipe in batch.recipes
+                                 if recipe.image)
+            for name, count in references.items():
+                StoredFile.objects.acquire(name, count)
+            search.update_index([recipe.pk for recipe in batch.recipes])
+
+        self.totals['users'] += len(batch.users)
+        self.totals['tags'] += len(batch.attrs[Tag])
+        self.totals['ingredients'] += len(batch.attrs[Ingredient])
+        self.totals['recipes'] += len(batch.recipes)
+        if self.options['verbosity'] > 1:
+            self.stdout.write(f"{self.totals['users']} users, "
+                              f"{self.totals['recipes']} recipes")
+
+    def insert_links(self, field, rows):
+        """Insert (recipe id, target id) rows into a through table
+
+        Plain parameter tuples in multi row statements cost far less than
+        a model instance and a compiled placeholder set per link.
+        """
+        through = field.remote_field.through._meta
+        quote = connection.ops.quote_name
+        columns = (through.get_field(field.m2m_field_name()).column,
+                   through.get_field(field.m2m_reverse_field_name()).column)
+        sql = 'INSERT INTO {} ({}, {}) VALUES '.format(
+            quote(through.db_table), *map(quote, columns)
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), LINKS_PER_INSERT):
+                chunk = rows[start:start + LINKS_PER_INSERT]
+                cursor.execute(sql + ', '.join(['(%s, %s)'] * len(chunk)),
+                               list(itertools.chain.from_iterable(chunk)))
+
+    def create_placeholders(self):
+        """Store the placeholder images and their derivatives
+
+        They are named by their content whatever the default storage, so
+        the same seed always references the same files.
+        """
+        placeholder_storage = storage.ContentAddressedStorage()
+        names = []
+        for _ in range(self.options['placeholders']):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            content = io.BytesIO()
+            Image.new('RGB', (1200, 900), color).save(content, 'JPEG')
+            name = placeholder_storage.save(
+                os.path.join(storage.UPLOAD_DIRECTORY, 'placeholder.jpg'),
+                ContentFile(content.getvalue()),
+            )
+            images.render(*images.render_args(name))
+            names.append(name)
+        return names
+
+    def reset_sequences(self):
+        """Move the id sequences past the ids assigned here"""
+        statements = connection.ops.sequence_reset_sql(
+            no_style(), [get_user_model(), Tag, Ingredient, Recipe]
+        )
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+
+class Batch:
+    """Rows of the users inserted together"""
+
+    def __init__(self):
+        self.users = []
+        self.attrs = {Tag: [], Ingredient: []}
+        self.recipes = []
+        self.links = []
@@ -1,21 +1,78 @@
+import math
+import random
 import time
 
-from django.db import connections
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+# backends whose driver takes a connect_timeout option in whole seconds
+CONNECT_TIMEOUT_VENDORS = ('postgresql', 'mysql')
 
 
 class Command(BaseCommand):
     """Django command to pause execution until database is available"""
+    help = (
+        'Connect to the database until it answers, waiting with '
+        'exponential backoff and jitter between attempts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='alias of the database to wait for')
+        parser.add_argument('--timeout', type=float, default=60,
+                            help='seconds before giving up')
+        parser.add_argument('--delay', type=float, default=0.5,
+                            help='seconds before the first retry')
+        parser.add_argument('--max-delay', type=float, default=10,
+                            help='longest wait between two attempts')
 
     def handle(self, *args, **options):
         """Handle the command"""
         self.stdout.write('Waiting for database...')
-        db_conn = None
-        while not db_conn:
+        deadline = time.monotonic() + options['timeout']
+        delay = options['delay']
+        while True:
             try:
-                db_conn = connections['default']
-            except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                self.ping(options['database'], deadline - time.monotonic())
+                break
+            except OperationalError as e:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(f'Database unavailable: {e}')
+                # full jitter keeps restarted containers from retrying
+                # in lockstep
+                wait = min(random.uniform(0, delay), remaining)
+                self.stdout.write(
+                    f'Database unavailable, waiting {wait:.1f} seconds...'
+                )
+                time.sleep(wait)
+                delay = min(delay * 2, options['max_delay'])
         self.stdout.write(self.style.SUCCESS('Database available!'))
+
+    def ping(self, alias, remaining):
+        """Run a query, giving up connecting once the deadline passed
+
+        A host that drops packets would otherwise hold the connect call
+        for the driver's own timeout, long past --timeout.
+        """
+        connection = connections[alias]
+        if connection.vendor not in CONNECT_TIMEOUT_VENDORS:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return
+
+        options = connection.settings_dict['OPTIONS']
+        configured = options.get('connect_timeout')
+        timeout = max(1, math.ceil(remaining))
+        if configured:
+            timeout = min(timeout, int(configured))
+        options['connect_timeout'] = timeout
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        finally:
+            if configured is None:
+                del options['connect_timeout']
+            else:
+                options['connect_timeout'] = configured
@@ -0,0 +1,183 @@
+"""Prometheus metrics of the API, served by core.views.metrics
+
+Requests are labelled by the resolved URL name, like `recipe:recipe-list`,
+so the number of series does not grow with ids in paths. Requests that
+resolve to no route share the `unresolved` label.
+
+With prometheus_client's multiprocess mode, enabled by pointing the
+PROMETHEUS_MULTIPROC_DIR environment variable at an empty directory
+before the workers start, every process writes its samples to memory
+mapped files there and the endpoint adds them up across workers. The
+directory must be emptied when the server restarts.
+
+Without prometheus_client installed the helpers do nothing and the
+endpoint answers 404.
+
+The endpoint answers clients from METRICS['ALLOWED_NETWORKS'] and, when
+METRICS['TOKEN'] is set, requests sending `Authorization: Bearer <token>`.
+Everyone else gets 403.
+"""
+import hmac
+import ipaddress
+import os
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core.instrumentation import QueryStats, instrument_stream
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Histogram, multiprocess
+except ImportError:
+    prometheus_client = None
+
+DEFAULT_METRICS = {
+    'ALLOWED_NETWORKS': ('127.0.0.1/32', '::1/128'),
+    'TOKEN': None,
+}
+UNRESOLVED = 'unresolved'
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+MULTIPROCESS_ENV = ('PROMETHEUS_MULTIPROC_DIR', 'prometheus_multiproc_dir')
+
+if prometheus_client is not None:
+    REQUESTS = Counter(
+        'http_requests_total', 'Requests answered',
+        ['route', 'method', 'status'],
+    )
+    ERRORS = Counter(
+        'http_request_errors_total',
+        'Requests answered with a server error',
+        ['route', 'method'],
+    )
+    LATENCY = Histogram(
+        'http_request_duration_seconds', 'Time to produce the response',
+        ['route', 'method'],
+    )
+    DB_QUERIES = Counter(
+        'db_queries_total', 'SQL queries run by requests', ['route'],
+    )
+    DB_DURATION = Counter(
+        'db_query_duration_seconds_total',
+        'Time spent in SQL queries run by requests', ['route'],
+    )
+    TOKEN_CACHE = Counter(
+        'auth_token_cache_requests_total',
+        'Token lookups answered by the token cache', ['result'],
+    )
+    UPLOAD_BYTES = Counter(
+        'recipe_image_upload_bytes_total',
+        'Bytes of recipe images received', ['kind'],
+    )
+
+
+def get_options():
+    options = dict(DEFAULT_METRICS)
+    options.update(getattr(settings, 'METRICS', {}))
+    return options
+
+
+def is_allowed(request):
+    """Check the client may read the metrics"""
+    options = get_options()
+    if options['TOKEN']:
+        expected = f"Bearer {options['TOKEN']}"
+        if hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''),
+                               expected):
+            return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR'))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network)
+               for network in options['ALLOWED_NETWORKS'])
+
+
+def is_multiprocess():
+    return any(os.environ.get(name) for name in MULTIPROCESS_ENV)
+
+
+def generate():
+    """Return the metrics in the Prometheus text format"""
+    if is_multiprocess():
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry)
+
+
+def content_type():
+    return prometheus_client.CONTENT_TYPE_LATEST
+
+
+def count_token_cache(hit):
+    if prometheus_client is not None:
+        TOKEN_CACHE.labels('hit' if hit else 'miss').inc()
+
+
+def count_upload_bytes(kind, size):
+    if prometheus_client is not None and size:
+        UPLOAD_BYTES.labels(kind).inc(size)
+
+
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or not match.view_name:
+        return UNRESOLVED
+    return match.view_name
+
+
+class MetricsMiddleware:
+    """Count, time and label every request with its route
+
+    Query counts come from core.instrumentation when it times the
+    request, otherwise they are added up here.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if prometheus_client is None:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        timer = getattr(request, '_timer', None)
+        queries = timer.queries if timer is not None else None
+        with ExitStack() as stack:
+            if queries is None:
+                # counts only, statements are not kept
+                queries = QueryStats(max_statements=0)
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+            count, duration = queries.count, queries.duration
+            response = self.get_response(request)
+        if response.streaming:
+            content = response.streaming_content
+            if timer is None:
+                content = instrument_stream(content, queries)
+            response.streaming_content = self.stream(
+                request, response, content, start, queries, count, duration
+            )
+        else:
+            self.observe(request, response, start, queries, count, duration)
+        return response
+
+    def stream(self, request, response, content, *args):
+        """Observe a streamed response once all of it was produced"""
+        yield from content
+        self.observe(request, response, *args)
+
+    def observe(self, request, response, start, queries, count, duration):
+        route = route_name(request)
+        method = request.method if request.method in METHODS else 'other'
+        LATENCY.labels(route, method).observe(time.perf_counter() - start)
+        REQUESTS.labels(route, method, response.status_code).inc()
+        if response.status_code >= 500:
+            ERRORS.labels(route, method).inc()
+        if queries.count > count:
+            DB_QUERIES.labels(route).inc(queries.count - count)
+            DB_DURATION.labels(route).inc(queries.duration - duration)
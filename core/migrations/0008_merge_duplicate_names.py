@@ -0,0 +1,45 @@
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """Relink recipes to the oldest of each user's same named rows"""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, relation in (('Tag', 'tags'), ('Ingredient',
+                                                    'ingredients')):
+        model = apps.get_model('core', model_name)
+        through = Recipe._meta.get_field(relation).remote_field.through
+        target = f'{model_name.lower()}_id'
+        duplicates = model.objects.values('user_id', 'name').annotate(
+            keep=Min('id'), rows=Count('id')
+        ).filter(rows__gt=1)
+        for group in duplicates:
+            others = model.objects.filter(
+                user_id=group['user_id'], name=group['name'],
+            ).exclude(id=group['keep'])
+            linked = through.objects.filter(
+                **{target: group['keep']}
+            ).values('recipe_id')
+            # a recipe may be linked to several of the copies
+            recipe_ids = through.objects.filter(
+                **{f'{target}__in': others}
+            ).exclude(recipe_id__in=linked).values_list(
+                'recipe_id', flat=True
+            ).distinct()
+            through.objects.bulk_create(
+                through(recipe_id=recipe_id, **{target: group['keep']})
+                for recipe_id in list(recipe_ids)
+            )
+            through.objects.filter(**{f'{target}__in': others}).delete()
+            others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_collection_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
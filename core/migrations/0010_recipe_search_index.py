@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# The search document as core.search builds it, frozen here so later
+# changes to that module do not change what this migration runs.
+POSTGRES_DOCUMENT = """
+    setweight(to_tsvector('english', coalesce(core_recipe.title, '')),
+              'A') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(t.name, ' ') FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = core_recipe.id), '')), 'B') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(i.name, ' ') FROM core_ingredient i
+        JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = core_recipe.id), '')), 'B')
+"""
+
+SQLITE_DOCUMENT = """
+    core_recipe.id, core_recipe.title,
+    coalesce((SELECT group_concat(t.name, ' ') FROM core_tag t
+              JOIN core_recipe_tags rt ON rt.tag_id = t.id
+              WHERE rt.recipe_id = core_recipe.id), ''),
+    coalesce((SELECT group_concat(i.name, ' ') FROM core_ingredient i
+              JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+              WHERE ri.recipe_id = core_recipe.id), '')
+"""
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE core_recipe ADD COLUMN search_vector tsvector'
+        )
+        schema_editor.execute(
+            'CREATE INDEX core_recipe_search_vector_gin ON core_recipe '
+            'USING gin (search_vector)'
+        )
+        schema_editor.execute(
+            'UPDATE core_recipe SET search_vector = ' + POSTGRES_DOCUMENT
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE core_recipe_fts USING fts5('
+            'title, tags, ingredients)'
+        )
+        schema_editor.execute(
+            'INSERT INTO core_recipe_fts (rowid, title, tags, ingredients) '
+            'SELECT ' + SQLITE_DOCUMENT + ' FROM core_recipe'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE core_recipe DROP COLUMN search_vector'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE core_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_unique_names'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
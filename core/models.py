@@ -1,9 +1,13 @@
 import uuid
 import os
-from django.db import models
+from django.db import IntegrityError, connections, models, router, \
+    transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
     PermissionsMixin
 from django.conf import settings
+from django.utils import timezone
+
+from core import storage
 
 
 def recipe_image_file_path(instance, filename):
@@ -45,12 +49,50 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
 
 
+class RecipeAttrManager(models.Manager):
+
+    def get_or_create_many(self, user, names):
+        """Return {name: id} for the names, creating the missing ones"""
+        names = list(dict.fromkeys(names))
+        ids = dict(self.filter(
+            user=user, name__in=names
+        ).values_list('name', 'id'))
+        missing = [name for name in names if name not in ids]
+        if not missing:
+            return ids
+
+        try:
+            with transaction.atomic():
+                created = self.bulk_create(
+                    self.model(user=user, name=name) for name in missing
+                )
+        except IntegrityError:
+            # a concurrent request created some of the names first
+            created = [self.get_or_create(user=user, name=name)[0]
+                       for name in missing]
+        if all(obj.pk is not None for obj in created):
+            ids.update((obj.name, obj.pk) for obj in created)
+        else:
+            ids.update(self.filter(
+                user=user, name__in=missing
+            ).values_list('name', 'id'))
+        CollectionVersion.objects.bump(user.pk, self.model._meta.model_name)
+
+        return ids
+
+
 class Tag(models.Model):
     name = models.CharField(max_length=255)
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        unique_together = ('user', 'name')
 
     def __str__(self):
         return self.name
@@ -63,11 +105,58 @@ class Ingredient(models.Model):
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
     )
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = RecipeAttrManager()
+
+    class Meta:
+        unique_together = ('user', 'name')
 
     def __str__(self):
         return self.name
 
 
+class RecipeManager(models.Manager):
+
+    def bulk_create_with_links(self, recipes, links):
+        """Insert recipes and their tag and ingredient links in bulk
+
+        `links` holds one {'tags': ids, 'ingredients': ids} dict per
+        recipe. Everything is written in one transaction with a multi
+        row insert per table where the backend can return the new ids.
+        """
+        from core import search
+
+        db = router.db_for_write(self.model)
+        with transaction.atomic(using=db):
+            self._insert(recipes, db)
+            for name in ('tags', 'ingredients'):
+                field = self.model._meta.get_field(name)
+                through = field.remote_field.through
+                target = f'{field.m2m_reverse_field_name()}_id'
+                through.objects.using(db).bulk_create(
+                    through(recipe_id=recipe.pk, **{target: pk})
+                    for recipe, link in zip(recipes, links)
+                    for pk in dict.fromkeys(link.get(name, ()))
+                )
+            for user_id in {recipe.user_id for recipe in recipes}:
+                CollectionVersion.objects.bump(user_id, 'recipe')
+            search.update_index([recipe.pk for recipe in recipes], using=db)
+
+        return recipes
+
+    def _insert(self, recipes, db):
+        features = connections[db].features
+        if getattr(features, 'can_return_ids_from_bulk_insert',
+                   getattr(features, 'can_return_rows_from_bulk_insert',
+                           False)):
+            self.using(db).bulk_create(recipes)
+            return
+        # the backend cannot report the ids of a multi row insert
+        for recipe in recipes:
+            recipe.save(force_insert=True, using=db)
+
+
 class Recipe(models.Model):
     """Recipe object"""
     user = models.ForeignKey(
@@ -81,6 +170,138 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_derivatives = models.BooleanField(default=False)
+    modified = models.DateTimeField(auto_now=True)
+
+    objects = RecipeManager()
+
+    class Meta:
+        # one per ordering of the recipe list, so keyset pages are read
+        # straight from an index whatever their depth
+        indexes = [
+            models.Index(fields=['user', 'id'],
+                         name='core_recipe_user_id_idx'),
+            models.Index(fields=['user', 'title', 'id'],
+                         name='core_recipe_user_title_idx'),
+            models.Index(fields=['user', 'price', 'id'],
+                         name='core_recipe_user_price_idx'),
+            models.Index(fields=['user', 'time_minutes', 'id'],
+                         name='core_recipe_user_time_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # the image the row holds, see core.storage.count_image_references
+        if 'image' in field_names:
+            instance._stored_image = \
+                values[field_names.index('image')] or None
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using, fields)
+        if 'image' not in self.get_deferred_fields():
+            self._stored_image = self.image.name or None
+
+
+class CollectionVersionManager(models.Manager):
+
+    def for_user(self, user_id, names):
+        """Return {name: (version, modified)} creating missing counters"""
+        versions = {
+            name: (version, modified)
+            for name, version, modified in self.filter(
+                user_id=user_id, name__in=names
+            ).values_list('name', 'version', 'modified')
+        }
+        for name in set(names) - set(versions):
+            counter, _ = self.get_or_create(user_id=user_id, name=name)
+            versions[name] = (counter.version, counter.modified)
+
+        return versions
+
+    def bump(self, user_id, name):
+        """Mark a user's collection as changed"""
+        self.filter(user_id=user_id, name=name).update(
+            version=models.F('version') + 1,
+            modified=timezone.now(),
+        )
+
+
+class CollectionVersion(models.Model):
+    """Change counter of a user's recipes, tags or ingredients
+
+    Counters are created the first time a collection is read, so a
+    client can only hold a version that later writes will bump.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(max_length=32)
+    version = models.PositiveIntegerField(default=0)
+    modified = models.DateTimeField(default=timezone.now)
+
+    objects = CollectionVersionManager()
+
+    class Meta:
+        unique_together = ('user', 'name')
+
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+
+class StoredFileManager(models.Manager):
+
+    def acquire(self, name, count=1):
+        """Count `count` more recipes referencing the file"""
+        references = models.F('references') + count
+        if self.filter(name=name).update(references=references):
+            return
+        try:
+            with transaction.atomic():
+                self.create(name=name, references=count)
+        except IntegrityError:
+            self.filter(name=name).update(references=references)
+
+    def release(self, name):
+        """Count one recipe less and delete the file once unreferenced"""
+        self.filter(name=name, references__gt=0).update(
+            references=models.F('references') - 1
+        )
+        if self.filter(name=name, references=0).delete()[0]:
+            storage.schedule_delete(name)
+
+
+class StoredFile(models.Model):
+    """Number of recipes referencing a stored image"""
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+
+    objects = StoredFileManager()
+
+    def __str__(self):
+        return self.name
+
+
+class ImportProgress(models.Model):
+    """Rows of an import file committed by the import_recipes command
+
+    Written in the transaction of each chunk, so a resumed import never
+    inserts a committed chunk twice.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+    )
+    source = models.CharField(max_length=255)
+    rows = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'source')
+
+    def __str__(self):
+        return f'{self.source}: {self.rows} rows'
@@ -0,0 +1,50 @@
+"""JSON rendering backed by orjson when it is installed
+
+`FastJSONRenderer` is a drop-in replacement for DRF's JSONRenderer,
+selected with DEFAULT_RENDERER_CLASSES. Without orjson, and for output
+orjson can not produce (indented, ASCII only or non compact JSON,
+integers beyond 64 bits), it runs DRF's stdlib implementation.
+
+Values orjson does not encode itself (Decimal, datetime, lazy strings,
+...) go through DRF's encoder, so the bytes equal DRF's for the data
+this API produces. Known differences: floats use the shortest
+round-trip form without a '+' in exponents (1e16, not 1e+16) and NaN
+and infinities render as null where DRF raises under STRICT_JSON.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | \
+        orjson.OPT_PASSTHROUGH_DATETIME
+# DRF escapes the line separators so the JSON is valid JavaScript too
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'),
+                   (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Render JSON with orjson, falling back to the stdlib"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or not self.compact or \
+                self.get_indent(accepted_media_type,
+                                renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default,
+                               option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
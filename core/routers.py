@@ -0,0 +1,161 @@
+"""Read replica routing for the recipe API
+
+Safe requests of views using `recipe.mixins.ReplicaReadMixin` read from
+one of the DATABASE_ROUTING['REPLICAS'] aliases, unless the user wrote
+through such a view in the last READ_YOUR_WRITES seconds. A replica that
+fails to connect is skipped for FAILOVER_SECONDS and reads move to the
+next one, or to the primary when none is left. Writes, migrations and
+everything outside those requests use 'default'.
+
+The read-your-writes window is kept in the CACHE alias, which must be
+shared by every worker (memcached, redis, database) so a write served by
+one worker pins the reads served by the others; the `core.E001` system
+check refuses replicas without one.
+"""
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+DEFAULT_DATABASE_ROUTING = {
+    'REPLICAS': (),
+    'READ_YOUR_WRITES': 5,
+    'FAILOVER_SECONDS': 30,
+    'CACHE': None,
+}
+# caches holding their entries in each worker process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+_read_alias = contextvars.ContextVar('read_alias', default=None)
+_down = {}
+_down_lock = threading.Lock()
+
+
+def get_options():
+    options = dict(DEFAULT_DATABASE_ROUTING)
+    options.update(getattr(settings, 'DATABASE_ROUTING', {}))
+    return options
+
+
+@checks.register()
+def check_routing(app_configs=None, **kwargs):
+    """Require a cache shared between workers when replicas are used"""
+    options = get_options()
+    if not options['REPLICAS']:
+        return []
+    alias = options['CACHE']
+    backend = settings.CACHES.get(alias, {}).get('BACKEND') if alias else None
+    if backend is None or backend in PROCESS_LOCAL_CACHES:
+        return [checks.Error(
+            "DATABASE_ROUTING['CACHE'] must name a cache shared by all "
+            "workers when REPLICAS are set",
+            hint='Without it a write served by one worker does not keep '
+                 "the user's next reads on the primary in the others.",
+            id='core.E001',
+        )]
+    return []
+
+
+def write_key(user_id):
+    return f'db-routing:write:{user_id}'
+
+
+def record_write(user_id):
+    """Pin the user's reads to the primary for a while"""
+    options = get_options()
+    if options['REPLICAS'] and options['CACHE']:
+        caches[options['CACHE']].set(write_key(user_id), True,
+                                     timeout=options['READ_YOUR_WRITES'])
+
+
+def recently_wrote(user_id):
+    options = get_options()
+    return caches[options['CACHE']].get(write_key(user_id)) is not None
+
+
+def is_available(alias):
+    """Connect to a replica unless it failed recently"""
+    now = time.monotonic()
+    with _down_lock:
+        if _down.get(alias, 0) > now:
+            return False
+    connection = connections[alias]
+    if connection.connection is not None:
+        # a persistent connection, checked by core.signals.check_connections
+        return True
+    try:
+        connection.ensure_connection()
+    except DatabaseError:
+        with _down_lock:
+            _down[alias] = now + get_options()['FAILOVER_SECONDS']
+        return False
+    with _down_lock:
+        _down.pop(alias, None)
+    return True
+
+
+def choose_replica(user_id=None):
+    """Return a replica alias for the user's reads, or None for primary"""
+    options = get_options()
+    replicas = list(options['REPLICAS'])
+    if not replicas or not options['CACHE'] or \
+            (user_id is not None and recently_wrote(user_id)):
+        return None
+    random.shuffle(replicas)
+    for alias in replicas:
+        if is_available(alias):
+            return alias
+    return None
+
+
+def set_read_alias(alias):
+    """Route reads to the alias, returns a token for reset_read_alias"""
+    return _read_alias.set(alias)
+
+
+def reset_read_alias(token):
+    _read_alias.reset(token)
+
+
+def keep_read_alias(iterator, alias):
+    """Read from `alias` while producing each item of a streamed response"""
+    iterator = iter(iterator)
+    while True:
+        token = _read_alias.set(alias)
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _read_alias.reset(token)
+        yield item
+
+
+class ReplicaRouter:
+    """Send the reads chosen with set_read_alias to their replica"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold copies of the primary's rows
+        aliases = {DEFAULT_DB_ALIAS, *get_options()['REPLICAS']}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in get_options()['REPLICAS']:
+            return False
+        return None
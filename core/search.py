@@ -0,0 +1,191 @@
+"""Full text search over recipe titles and tag and ingredient names
+
+PostgreSQL keeps a weighted `tsvector` in the `core_recipe.search_vector`
+column behind a GIN index; SQLite keeps the same text in the FTS5
+table `core_recipe_fts`. Both are created by migration 0010, which keeps
+its own copy of the SQL below, and kept up to date by `update_index`,
+which the signal handlers below and the bulk insert paths call. Other
+backends fall back to a title scan.
+"""
+import re
+
+from django.db import connections, router
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'core_recipe_fts'
+
+POSTGRES_DOCUMENT = f"""
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce({{recipe}}.title, '')),
+              'A') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+        SELECT string_agg(t.name, ' ') FROM {{tag}} t
+        JOIN {{recipe_tags}} rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = {{recipe}}.id), '')), 'B') ||
+    setweight(to_tsvector('{SEARCH_CONFIG}', coalesce((
+        SELECT string_agg(i.name, ' ') FROM {{ingredient}} i
+        JOIN {{recipe_ingredients}} ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = {{recipe}}.id), '')), 'B')
+"""
+
+SQLITE_DOCUMENT = """
+    {recipe}.id, {recipe}.title,
+    coalesce((SELECT group_concat(t.name, ' ') FROM {tag} t
+              JOIN {recipe_tags} rt ON rt.tag_id = t.id
+              WHERE rt.recipe_id = {recipe}.id), ''),
+    coalesce((SELECT group_concat(i.name, ' ') FROM {ingredient} i
+              JOIN {recipe_ingredients} ri ON ri.ingredient_id = i.id
+              WHERE ri.recipe_id = {recipe}.id), '')
+"""
+
+
+def table_names(recipe_model):
+    """Return the tables the search document is built from"""
+    return {
+        'recipe': recipe_model._meta.db_table,
+        'tag': recipe_model.tags.rel.model._meta.db_table,
+        'ingredient': recipe_model.ingredients.rel.model._meta.db_table,
+        'recipe_tags': recipe_model.tags.through._meta.db_table,
+        'recipe_ingredients':
+            recipe_model.ingredients.through._meta.db_table,
+    }
+
+
+def update_index(recipe_ids, using=None, batch_size=500):
+    """Rebuild the search document of the given recipes"""
+    from core.models import Recipe
+
+    recipe_ids = [pk for pk in recipe_ids if pk is not None]
+    connection = connections[using or router.db_for_write(Recipe)]
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    tables = table_names(Recipe)
+    with connection.cursor() as cursor:
+        for start in range(0, len(recipe_ids), batch_size):
+            batch = recipe_ids[start:start + batch_size]
+            placeholders = ', '.join(['%s'] * len(batch))
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    'UPDATE {recipe} SET search_vector = '.format(**tables) +
+                    POSTGRES_DOCUMENT.format(**tables) +
+                    f' WHERE id IN ({placeholders})',
+                    batch
+                )
+                continue
+            cursor.execute(
+                f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+                batch
+            )
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, tags, ingredients) '
+                'SELECT ' + SQLITE_DOCUMENT.format(**tables) +
+                ' FROM {recipe}'.format(**tables) +
+                f' WHERE id IN ({placeholders})',
+                batch
+            )
+
+
+def remove_from_index(recipe_ids, using=None):
+    """Drop deleted recipes from the SQLite search table"""
+    from core.models import Recipe
+
+    connection = connections[using or router.db_for_write(Recipe)]
+    if connection.vendor != 'sqlite' or not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})',
+            list(recipe_ids)
+        )
+
+
+def search(queryset, text):
+    """Filter a recipe queryset by text and annotate its `rank`
+
+    Higher ranks are better matches, so order by `-rank`.
+    """
+    terms = re.findall(r'\w+', text)
+    if not terms:
+        return queryset.none()
+
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+    if vendor == 'postgresql':
+        tsquery = f"plainto_tsquery('{SEARCH_CONFIG}', %s)"
+        query = ' '.join(terms)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT id FROM {table} WHERE search_vector @@ {tsquery}',
+            [query]
+        )).annotate(rank=RawSQL(
+            # ts_rank is a float4, which the float8 a cursor compares it
+            # with never equals; a rounded float8 survives the round trip
+            f'round(ts_rank({table}.search_vector, {tsquery})::numeric, 6)'
+            f'::float8', [query], output_field=FloatField()
+        ))
+    if vendor == 'sqlite':
+        query = ' '.join('"{}"'.format(term) for term in terms)
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [query]
+        )).annotate(rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0, 1.0) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+            [query], output_field=FloatField()
+        ))
+
+    for term in terms:
+        queryset = queryset.filter(title__icontains=term)
+    return queryset.annotate(rank=Value(1.0, output_field=FloatField()))
+
+
+def index_recipe(sender, instance, raw=False, using=None, **kwargs):
+    """Reindex a saved recipe"""
+    if not raw:
+        update_index([instance.pk], using=using)
+
+
+def unindex_recipe(sender, instance, using=None, **kwargs):
+    """Drop a deleted recipe from the index"""
+    remove_from_index([instance.pk], using=using)
+
+
+def index_recipe_links(sender, instance, action, reverse, pk_set,
+                       using=None, **kwargs):
+    """Reindex recipes whose tags or ingredients changed"""
+    if action == 'pre_clear' and reverse:
+        # remember the recipes losing this tag or ingredient
+        instance._search_recipe_ids = list(
+            sender.objects.filter(**{
+                f'{instance._meta.model_name}_id': instance.pk
+            }).values_list('recipe_id', flat=True)
+        )
+    elif action in ('post_add', 'post_remove'):
+        update_index(pk_set if reverse else [instance.pk], using=using)
+    elif action == 'post_clear':
+        update_index(
+            getattr(instance, '_search_recipe_ids', [])
+            if reverse else [instance.pk],
+            using=using
+        )
+
+
+def linked_recipe_ids(instance):
+    return list(instance.recipe_set.values_list('pk', flat=True))
+
+
+def remember_linked_recipes(sender, instance, **kwargs):
+    """Remember the recipes of a tag or ingredient about to be deleted"""
+    instance._search_recipe_ids = linked_recipe_ids(instance)
+
+
+def index_linked_recipes(sender, instance, using=None, created=False,
+                         **kwargs):
+    """Reindex the recipes of a renamed or deleted tag or ingredient"""
+    if created:
+        return
+    recipe_ids = getattr(instance, '_search_recipe_ids', None)
+    if recipe_ids is None:
+        recipe_ids = linked_recipe_ids(instance)
+    update_index(recipe_ids, using=using)
@@ -0,0 +1,47 @@
+import time
+
+from django.conf import settings
+from django.db import connections
+
+from core.models import CollectionVersion
+
+
+def bump_collection_version(sender, instance, **kwargs):
+    """Bump the version of the collection a saved or deleted row is in"""
+    CollectionVersion.objects.bump(
+        instance.user_id, sender._meta.model_name
+    )
+
+
+def bump_recipe_links_version(sender, instance, action, **kwargs):
+    """Bump the recipe collection when tags or ingredients are relinked"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        CollectionVersion.objects.bump(instance.user_id, 'recipe')
+
+
+def mark_connections_idle(**kwargs):
+    """Note when the connections kept open by CONN_MAX_AGE went idle"""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.idle_since = now
+
+
+def check_connections(**kwargs):
+    """Close persistent connections that stopped working while idle
+
+    Only connections idle for longer than CONN_HEALTH_CHECK_IDLE seconds
+    are tested, with one query each, so busy workers do not pay a round
+    trip per request. Connections failing while in use are closed by
+    Django at the end of the request.
+    """
+    idle = getattr(settings, 'CONN_HEALTH_CHECK_IDLE', None)
+    if idle is None:
+        return
+    cutoff = time.monotonic() - idle
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block or \
+                getattr(connection, 'idle_since', cutoff) >= cutoff:
+            continue
+        if not connection.is_usable():
+            connection.close()
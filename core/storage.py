@@ -0,0 +1,256 @@
+"""Content addressed storage and reference counting of recipe images
+
+With `DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'`
+uploads are hashed while they are streamed to disk and stored once per
+content as `<upload dir>/ab/cd/<sha256>.<ext>`, so re-uploading a photo
+costs no space and no directory grows past 65536 entries.
+
+Whatever the storage, `StoredFile` counts the recipes referencing each
+image name and the file and its derivatives are deleted when the last
+reference goes away.
+"""
+import glob
+import hashlib
+import itertools
+import os
+import re
+import tempfile
+import time
+
+from django.core.files import locks
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+
+UPLOAD_DIRECTORY = 'uploads/recipe'
+# seconds a reused file is protected from deletion by its old references
+REUSE_GRACE = 600
+CONTENT_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+def is_content_addressed(name):
+    """Return True for names produced by ContentAddressedStorage"""
+    return bool(name and CONTENT_NAME.search(name))
+
+
+def content_name(directory, digest, ext):
+    return os.path.join(directory, digest[:2], digest[2:4],
+                        f'{digest}{ext}').replace('\\', '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage naming files by the SHA-256 of their content"""
+
+    def _save(self, name, content):
+        directory = os.path.dirname(name)
+        ext = os.path.splitext(name)[1].lower()
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=full_directory, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                locks.lock(f, locks.LOCK_EX)
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+            name = content_name(directory, digest.hexdigest(), ext)
+            full_path = self.path(name)
+            if self._reuse(full_path):
+                os.remove(temp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                file_move_safe(temp_path, full_path, allow_overwrite=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(full_path, self.file_permissions_mode)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return name
+
+    def _reuse(self, full_path):
+        """Claim the stored copy of an upload unless it is being deleted
+
+        The file is touched under its lock so delete_unreferenced, which
+        takes the same lock, leaves it to a later orphan collection.
+        """
+        try:
+            f = open(full_path, 'rb')
+        except FileNotFoundError:
+            return False
+        with f:
+            locks.lock(f, locks.LOCK_EX)
+            if not os.path.exists(full_path):
+                return False
+            os.utime(full_path)
+            return True
+
+    def get_available_name(self, name, max_length=None):
+        # the final name only depends on the content
+        return name
+
+    def delete(self, name):
+        """Delete the file unless a recipe still references it"""
+        from core.models import StoredFile
+
+        if StoredFile.objects.filter(name=name, references__gt=0).exists():
+            return
+        super().delete(name)
+
+
+def delete_unreferenced(name, grace=0):
+    """Delete an image and its derivatives if nothing references it
+
+    The references are checked with the file locked and inside the
+    transaction deleting it. A file modified in the last `grace` seconds
+    may have been reused by an upload whose recipe is not committed yet
+    and is kept for collect_orphaned_images.
+    """
+    from core import images
+    from core.models import StoredFile
+
+    try:
+        f = open(default_storage.path(name), 'rb')
+    except FileNotFoundError:
+        f = None
+    try:
+        with transaction.atomic():
+            if StoredFile.objects.select_for_update().filter(
+                    name=name).exists():
+                return
+            if f is not None:
+                locks.lock(f, locks.LOCK_EX)
+                modified = os.fstat(f.fileno()).st_mtime
+                if grace and time.time() - modified < grace:
+                    return
+            for formats in images.derivative_names(name).values():
+                for derivative in formats.values():
+                    default_storage.delete(derivative)
+            default_storage.delete(name)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def count_image_references(sender, instance, created, raw=False,
+                           **kwargs):
+    """Move the reference of a recipe whose image changed"""
+    from core.models import StoredFile
+
+    if raw or 'image' in instance.get_deferred_fields():
+        return
+    # Recipe.from_db remembers the image a row was loaded with
+    old = None if created else getattr(instance, '_stored_image', None)
+    new = instance.image.name or None
+    if old == new:
+        return
+    if new:
+        StoredFile.objects.acquire(new)
+    if old:
+        StoredFile.objects.release(old)
+    instance._stored_image = new
+
+
+def release_image_reference(sender, instance, **kwargs):
+    """Drop the reference of a deleted recipe"""
+    from core.models import StoredFile
+
+    name = getattr(instance, '_stored_image', None)
+    if name:
+        StoredFile.objects.release(name)
+
+
+def schedule_delete(name):
+    transaction.on_commit(lambda: delete_unreferenced(name, REUSE_GRACE))
+
+
+def walk_files(directory):
+    """Yield the files below a directory without listing it in memory"""
+    pending = [directory]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def derivative_pattern():
+    from core import images
+
+    options = images.get_options()
+    return re.compile(r'\.({})\.({})$'.format(
+        '|'.join(map(re.escape, options['SIZES'])),
+        '|'.join(map(re.escape, options['FORMATS'])),
+    ))
+
+
+def old_files(directory, min_age):
+    """Yield (path, size) of the files not modified for `min_age` seconds"""
+    cutoff = time.time() - min_age
+    for entry in walk_files(directory):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        if stat.st_mtime < cutoff:
+            yield entry.path, stat.st_size
+
+
+def find_orphans(directory=UPLOAD_DIRECTORY, batch_size=1000, min_age=3600):
+    """Yield (name, size) of the stored files no recipe references
+
+    The directory is streamed and checked against the database one batch
+    of names at a time, so memory does not grow with the number of files.
+    Files younger than `min_age` seconds are skipped as the recipe of an
+    upload in flight may not be committed yet. Derivatives are orphaned
+    with their original image.
+    """
+    from core import images
+    from core.models import Recipe, StoredFile
+
+    root = default_storage.path('')
+    derivative = derivative_pattern()
+    files = old_files(default_storage.path(directory), min_age)
+    while True:
+        batch = {
+            os.path.relpath(path, root).replace(os.sep, '/'): size
+            for path, size in itertools.islice(files, batch_size)
+        }
+        if not batch:
+            return
+        originals = [name for name in batch if not derivative.search(name)]
+        referenced = set(Recipe.objects.filter(image__in=originals)
+                         .values_list('image', flat=True))
+        referenced.update(StoredFile.objects.filter(
+            name__in=originals, references__gt=0
+        ).values_list('name', flat=True))
+
+        orphaned = set()
+        for name in originals:
+            if name in referenced:
+                continue
+            yield name, batch[name]
+            for formats in images.derivative_names(name).values():
+                for other in formats.values():
+                    if default_storage.exists(other):
+                        orphaned.add(other)
+                        yield other, default_storage.size(other)
+
+        for name, size in batch.items():
+            match = derivative.search(name)
+            if match is None or name in orphaned:
+                continue
+            # a derivative is kept while any file with its root exists
+            prefix = glob.escape(default_storage.path(name[:match.start()]))
+            if not any(derivative.search(path) is None
+                       for path in glob.iglob(prefix + '.*')):
+                yield name, size
@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import TokenCache, token_cache
+
+TAGS_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """test the cached token authentication backend"""
+
+    def setUp(self):
+        token_cache.reset()
+        self.user = get_user_model().objects.create_user(
+            'token@gmail.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def tearDown(self):
+        token_cache.reset()
+
+    def test_token_lookup_cached(self):
+        """test that the second request skips the token query"""
+        self.client.get(TAGS_URL)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(token_cache.hits, 1)
+        self.assertEqual(token_cache.misses, 1)
+
+    def test_invalid_token_rejected(self):
+        """test that unknown tokens are not cached as valid"""
+        self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+    def test_token_deletion_invalidates(self):
+        """test that a deleted token stops authenticating"""
+        self.client.get(TAGS_URL)
+        self.token.delete()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_user_deactivation_invalidates(self):
+        """test that a deactivated user stops authenticating"""
+        self.client.get(TAGS_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_invalidates(self):
+        """test that changing the password refreshes the cached user"""
+        self.client.get(ME_URL)
+
+        self.client.patch(ME_URL, {'password': 'newpass123'})
+        self.client.get(ME_URL)
+
+        self.assertEqual(token_cache.misses, 2)
+
+    def test_cached_user_not_shared(self):
+        """test every hit returns its own user instance"""
+        token_cache.set(self.token.key, (self.user, self.token))
+
+        first, _ = token_cache.get(self.token.key)
+        first.name = 'changed in place'
+        second, token = token_cache.get(self.token.key)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.name, self.user.name)
+        self.assertEqual(second.pk, self.user.pk)
+        self.assertIs(token.user, second)
+
+    @override_settings(
+        CACHES={'tokens': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+        TOKEN_AUTH_CACHE={'BACKEND': 'tokens'},
+    )
+    def test_shared_invalidation(self):
+        """test an invalidation in one worker reaches the others"""
+        first = TokenCache()
+        second = TokenCache()
+        first.set(self.token.key, (self.user, self.token))
+        self.assertIsNotNone(second.get(self.token.key))
+
+        first.delete(self.token.key)
+
+        self.assertIsNone(second.get(self.token.key))
+
+    @override_settings(
+        CACHES={'tokens': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }},
+        TOKEN_AUTH_CACHE={'BACKEND': 'tokens'},
+    )
+    def test_shared_backend(self):
+        """test that entries are shared through the cache backend"""
+        self.client.get(TAGS_URL)
+        token_cache._entries.clear()
+
+        self.client.get(TAGS_URL)
+        self.token.delete()
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(token_cache.hits, 1)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -1,9 +1,22 @@
-from unittest.mock import patch
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import MagicMock, patch
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.db.utils import OperationalError
 from django.test import TestCase
 
+from core import search, storage
+from core.management.commands.import_recipes import Command as ImportCommand
+from core.models import ImportProgress, Recipe, StoredFile, Tag
+
 
 class CommandsTest(TestCase):
 
@@ -11,15 +24,279 @@ class CommandsTest(TestCase):
         """Test waiting for db when db is available"""
 
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.return_value = True
-            call_command('wait_for_db')
+            gi.return_value = MagicMock()
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 1)
+            gi.return_value.cursor.assert_called_once_with()
 
     @patch('time.sleep', return_value=None)
     def test_wait_for_db(self, ts):
         """Test waiting for db"""
 
         with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            gi.side_effect = [OperationalError] * 5 + [True]
-            call_command('wait_for_db')
+            gi.side_effect = [OperationalError] * 5 + [MagicMock()]
+            call_command('wait_for_db', stdout=StringIO())
             self.assertEqual(gi.call_count, 6, )
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_backoff(self, ts):
+        """Test retries wait longer each time up to the maximum delay"""
+
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi, \
+                patch('random.uniform', side_effect=lambda a, b: b):
+            gi.side_effect = [OperationalError] * 5 + [MagicMock()]
+            call_command('wait_for_db', delay=1, max_delay=4,
+                         stdout=StringIO())
+
+        self.assertEqual([c[0][0] for c in ts.call_args_list],
+                         [1, 2, 4, 4, 4])
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_timeout(self, ts):
+        """Test giving up once the timeout passed"""
+
+        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+            gi.side_effect = OperationalError('refused')
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0, stdout=StringIO())
+        ts.assert_not_called()
+
+    @patch('time.sleep', return_value=None)
+    def test_wait_for_db_connect_timeout(self, ts):
+        """Test connecting gives up within the remaining time"""
+        connection = MagicMock(vendor='postgresql',
+                               settings_dict={'OPTIONS': {}})
+        timeouts = []
+
+        def cursor():
+            timeouts.append(connection.settings_dict['OPTIONS']
+                            ['connect_timeout'])
+            if len(timeouts) < 3:
+                raise OperationalError('timeout expired')
+            return MagicMock()
+        connection.cursor.side_effect = cursor
+
+        with patch('django.db.utils.ConnectionHandler.__getitem__',
+                   return_value=connection), \
+                patch('time.monotonic', side_effect=[0, 0, 2, 3.5, 3.5, 7]):
+            call_command('wait_for_db', timeout=10, stdout=StringIO())
+
+        self.assertEqual(timeouts, [10, 7, 3])
+        self.assertEqual(connection.settings_dict['OPTIONS'], {})
+
+
+class ImportRecipesCommandTests(TestCase):
+    """test the import_recipes command"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'importer@gmail.com',
+            'testpass'
+        )
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, content, compress=False):
+        path = os.path.join(self.directory.name, name)
+        opener = gzip.open if compress else open
+        with opener(path, 'wt') as f:
+            f.write(content)
+        return path
+
+    def call(self, *args, **options):
+        out = StringIO()
+        call_command('import_recipes', *args, user=self.user.email,
+                     stdout=out, stderr=StringIO(), **options)
+        return out.getvalue()
+
+    def test_import_ndjson(self):
+        """test importing gzip compressed NDJSON with related names"""
+        lines = [
+            {'title': 'Curry', 'time_minutes': 30, 'price': '5.50',
+             'tags': ['Vegan', 'Spicy'], 'ingredients': ['Rice']},
+            {'title': 'Salad', 'time_minutes': 5, 'price': 3,
+             'tags': [{'id': 9, 'name': 'Vegan'}]},
+        ]
+        path = self.write('recipes.ndjson.gz', '\n'.join(
+            json.dumps(line) for line in lines
+        ), compress=True)
+
+        out = self.call(path, chunk_size=1)
+
+        self.assertIn('rows/s', out)
+        curry = Recipe.objects.get(user=self.user, title='Curry')
+        self.assertEqual(curry.price, Decimal('5.50'))
+        self.assertEqual(
+            sorted(curry.tags.values_list('name', flat=True)),
+            ['Spicy', 'Vegan']
+        )
+        salad = Recipe.objects.get(user=self.user, title='Salad')
+        self.assertEqual(list(salad.tags.all()),
+                         [Tag.objects.get(user=self.user, name='Vegan')])
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 2)
+
+    def test_import_csv_skips_invalid_rows(self):
+        """test importing CSV reports and skips invalid rows"""
+        path = self.write('recipes.csv', (
+            'title,time_minutes,price,link,tags,ingredients\n'
+            'Soup,20,4.00,,Warm|Quick,Leek\n'
+            ',20,4.00,,,\n'
+            'Toast,2,1.00,http://x.com,,Bread\n'
+        ))
+
+        self.call(path)
+
+        titles = Recipe.objects.values_list('title', flat=True)
+        self.assertEqual(sorted(titles), ['Soup', 'Toast'])
+        soup = Recipe.objects.get(title='Soup')
+        self.assertEqual(soup.tags.count(), 2)
+
+    def test_import_resume(self):
+        """test an interrupted import continues after the last chunk"""
+        path = self.write('recipes.ndjson', '\n'.join(json.dumps(
+            {'title': f'recipe {i}', 'time_minutes': 1, 'price': 1}
+        ) for i in range(5)))
+        ImportProgress.objects.create(user=self.user, source=path, rows=3)
+
+        self.call(path, resume=True)
+
+        titles = Recipe.objects.values_list('title', flat=True)
+        self.assertEqual(sorted(titles), ['recipe 3', 'recipe 4'])
+        self.assertFalse(ImportProgress.objects.exists())
+
+    def test_checkpoint_committed_with_chunk(self):
+        """test a chunk is rolled back when its checkpoint is not written"""
+        path = self.write('recipes.ndjson', '\n'.join(json.dumps(
+            {'title': f'recipe {i}', 'time_minutes': 1, 'price': 1}
+        ) for i in range(6)))
+        write_checkpoint = ImportCommand.write_checkpoint
+
+        def crash_on_second_chunk(command, p, rows):
+            write_checkpoint(command, p, rows)
+            if rows == 4:
+                raise KeyboardInterrupt
+        with patch.object(ImportCommand, 'write_checkpoint',
+                          crash_on_second_chunk), \
+                self.assertRaises(KeyboardInterrupt):
+            self.call(path, chunk_size=2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        self.call(path, chunk_size=2, resume=True)
+
+        titles = Recipe.objects.values_list('title', flat=True)
+        self.assertEqual(sorted(titles), [f'recipe {i}' for i in range(6)])
+
+    def test_checkpoint_written_per_chunk(self):
+        """test progress is checkpointed after each committed chunk"""
+        path = self.write('recipes.ndjson', '\n'.join(json.dumps(
+            {'title': f'recipe {i}', 'time_minutes': 1, 'price': 1}
+        ) for i in range(4)))
+        checkpoints = []
+
+        with patch.object(ImportCommand, 'write_checkpoint',
+                          lambda self, p, rows: checkpoints.append(rows)):
+            self.call(path, chunk_size=2)
+
+        self.assertEqual(checkpoints, [2, 4])
+
+    def test_unknown_user(self):
+        """test importing for a missing user fails"""
+        with self.assertRaises(CommandError):
+            call_command('import_recipes', 'missing.ndjson',
+                         user='nobody@gmail.com')
+
+
+class SeedDataCommandTests(TestCase):
+    """test the seed_data command"""
+
+    def call(self, **options):
+        out = StringIO()
+        call_command('seed_data', stdout=out, **options)
+        return out.getvalue()
+
+    def snapshot(self):
+        return [
+            (recipe.user.email, recipe.title, recipe.time_minutes,
+             recipe.price,
+             sorted(recipe.tags.values_list('name', flat=True)),
+             sorted(recipe.ingredients.values_list('name', flat=True)))
+            for recipe in Recipe.objects.order_by('pk')
+        ]
+
+    def test_seed_data(self):
+        """test users, recipes and their links are created in batches"""
+        out = self.call(users=10, recipes_per_user=5, batch_size=7,
+                        distribution='constant')
+
+        self.assertIn('rows/s', out)
+        self.assertEqual(get_user_model().objects.filter(
+            email__endswith='@example.com').count(), 10)
+        self.assertEqual(Recipe.objects.count(), 50)
+        recipe = Recipe.objects.first()
+        self.assertTrue(1 <= recipe.tags.count() <= 3)
+        self.assertEqual(set(recipe.tags.values_list('user', flat=True)),
+                         {recipe.user_id})
+        word = recipe.title.split()[0]
+        self.assertIn(recipe, search.search(Recipe.objects.all(), word))
+
+    def test_deterministic(self):
+        """test the same seed generates the same data"""
+        self.call(users=5, recipes_per_user=4, seed=3)
+        first = self.snapshot()
+        Recipe.objects.all().delete()
+        Tag.objects.all().delete()
+        get_user_model().objects.filter(
+            email__startswith='seed3-').delete()
+
+        self.call(users=5, recipes_per_user=4, seed=3)
+
+        self.assertEqual(self.snapshot(), first)
+
+    def test_zipf_reuse(self):
+        """test popular tags are reused far more than rare ones"""
+        self.call(users=1, recipes_per_user=300, distribution='constant',
+                  vocabulary=100)
+
+        counts = sorted(
+            (Recipe.tags.through.objects.filter(tag=tag).count()
+             for tag in Tag.objects.all()), reverse=True
+        )
+        self.assertGreater(counts[0], 10 * counts[-1])
+
+    def test_zipf_recipes_per_user(self):
+        """test the first users get most recipes"""
+        self.call(users=20, recipes_per_user=10)
+
+        counts = [user.recipe_set.count() for user in
+                  get_user_model().objects.filter(
+                      email__startswith='seed0-').order_by('pk')]
+        self.assertGreater(counts[0], counts[-1])
+        self.assertAlmostEqual(sum(counts), 200, delta=20)
+
+    def test_placeholder_images(self):
+        """test recipes share placeholder images with their references"""
+        file_system = 'django.core.files.storage.FileSystemStorage'
+        with tempfile.TemporaryDirectory() as media, \
+                self.settings(MEDIA_ROOT=media,
+                              DEFAULT_FILE_STORAGE=file_system):
+            self.call(users=2, recipes_per_user=3, distribution='constant',
+                      images=1, placeholders=1)
+
+            name = Recipe.objects.values_list('image', flat=True).first()
+            with open(os.path.join(media, name), 'rb') as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(name, storage.content_name(
+            storage.UPLOAD_DIRECTORY, digest, '.jpg'
+        ))
+        self.assertEqual(StoredFile.objects.get(name=name).references, 6)
+        self.assertFalse(Recipe.objects.filter(
+            image_derivatives=False).exists())
+
+    def test_existing_seed(self):
+        """test seeding the same seed twice fails"""
+        self.call(users=1, recipes_per_user=1)
+
+        with self.assertRaises(CommandError):
+            self.call(users=1, recipes_per_user=1)
@@ -0,0 +1,91 @@
+import threading
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import hashers
+
+TOKEN_URL = reverse('user:token')
+ADMIN_LOGIN_URL = reverse('admin:login')
+HASHERS = ['core.hashers.PBKDF2PasswordHasher']
+
+
+@override_settings(PASSWORD_HASHERS=HASHERS,
+                   PASSWORD_HASHING={'ITERATIONS': 1000})
+class PasswordHashingTests(TestCase):
+    """test the tunable and bounded password hasher"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'hash@gmail.com',
+            'testpass'
+        )
+
+    def test_iterations_from_settings(self):
+        """test the configured iteration count is used"""
+        self.assertTrue(make_password('secret').startswith(
+            'pbkdf2_sha256$1000$'
+        ))
+
+    def test_rehash_on_login(self):
+        """test a login rehashes passwords with another cost"""
+        with self.settings(PASSWORD_HASHING={'ITERATIONS': 2000}):
+            res = self.client.post(TOKEN_URL, {'email': 'hash@gmail.com',
+                                               'password': 'testpass'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$2000$'))
+
+    def post_while_busy(self, url, data, client, timeout=0, busy_for=None):
+        options = {'ITERATIONS': 1000, 'WORKERS': 1, 'TIMEOUT': timeout}
+        with self.settings(PASSWORD_HASHING=options):
+            slots = hashers.get_slots()
+            slots.acquire()
+            if busy_for is not None:
+                release = threading.Timer(busy_for, slots.release)
+                release.start()
+            try:
+                return client.post(url, data)
+            finally:
+                if busy_for is None:
+                    slots.release()
+                else:
+                    release.join()
+
+    def test_login_waits_for_slot(self):
+        """test logins wait for a slot freed within the timeout"""
+        res = self.post_while_busy(TOKEN_URL, {
+            'email': 'hash@gmail.com', 'password': 'testpass'
+        }, self.client, timeout=5, busy_for=0.1)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_default_timeout_waits(self):
+        """test logins wait briefly for a slot by default"""
+        self.assertGreater(hashers.DEFAULT_PASSWORD_HASHING['TIMEOUT'], 0)
+
+    def test_busy_hashing_refused(self):
+        """test API logins finding no free slot are refused at once"""
+        res = self.post_while_busy(TOKEN_URL, {
+            'email': 'hash@gmail.com', 'password': 'testpass'
+        }, self.client)
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(res['Retry-After'], '1')
+        self.assertEqual(res.data['detail'].code, 'password_hashing_busy')
+
+    def test_busy_admin_login_refused(self):
+        """test logins outside the API are refused with 503 too"""
+        res = self.post_while_busy(ADMIN_LOGIN_URL, {
+            'username': 'hash@gmail.com', 'password': 'testpass'
+        }, Client())
+
+        self.assertEqual(res.status_code,
+                         status.HTTP_503_SERVICE_UNAVAILABLE)
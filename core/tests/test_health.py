@@ -0,0 +1,90 @@
+import tempfile
+from unittest.mock import patch
+
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import health
+
+HEALTHZ_URL = reverse('healthz')
+MEDIA_DIR = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_DIR,
+                   HEALTH_CHECK={'CACHE_SECONDS': 60})
+class HealthzTests(TestCase):
+    """test the readiness endpoint"""
+
+    def setUp(self):
+        health.reset_health('HEALTH_CHECK')
+
+    def test_healthy(self):
+        """test a ready process reports its checks"""
+        res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('no-cache', res['Cache-Control'])
+        body = res.json()
+        self.assertTrue(body['ok'])
+        self.assertGreaterEqual(body['checks']['database']['latency_ms'], 0)
+        self.assertEqual(body['checks']['migrations']['pending'], [])
+        self.assertTrue(body['checks']['media']['ok'])
+
+    def test_result_cached(self):
+        """test probes within the cache window do not query again"""
+        self.client.get(HEALTHZ_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(HEALTHZ_URL)
+        self.assertEqual(res.status_code, 200)
+
+    def test_applied_migrations_not_checked_again(self):
+        """test expired results only query the database once migrated"""
+        self.client.get(HEALTHZ_URL)
+        health._expires = 0
+
+        with self.assertNumQueries(1):
+            res = self.client.get(HEALTHZ_URL)
+        self.assertEqual(res.json()['checks']['migrations']['pending'], [])
+
+    @override_settings(MEDIA_ROOT='/nonexistent/media')
+    def test_media_not_writable(self):
+        """test an unwritable media volume fails the probe"""
+        res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertFalse(res.json()['checks']['media']['ok'])
+
+    def test_pending_migrations(self):
+        """test unapplied migrations fail the probe"""
+        with patch('core.health.MigrationExecutor') as executor:
+            migration = executor.return_value.migration_plan.return_value
+            migration.__iter__.return_value = [
+                (type('Migration', (), {'app_label': 'core',
+                                        'name': '0099_next'}), False)
+            ]
+            res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.json()['checks']['migrations']['pending'],
+                         ['core.0099_next'])
+
+    def test_database_down(self):
+        """test a database error fails the probe without migrations"""
+        with patch('core.health.connections') as connections:
+            connections.__getitem__.return_value.cursor.side_effect = \
+                OperationalError('refused')
+            res = self.client.get(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 503)
+        body = res.json()
+        self.assertEqual(body['checks']['database'],
+                         {'ok': False, 'error': 'refused'})
+        self.assertNotIn('migrations', body['checks'])
+
+    def test_post_not_allowed(self):
+        """test the probe only answers safe methods"""
+        res = self.client.post(HEALTHZ_URL)
+
+        self.assertEqual(res.status_code, 405)
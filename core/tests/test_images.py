@@ -0,0 +1,140 @@
+import os
+import tempfile
+from concurrent.futures import Future
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+
+from PIL import Image
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import images
+from core.models import Recipe
+from recipe.serializers import RecipeSerializer
+
+MEDIA_DIR = tempfile.mkdtemp()
+Image.init()
+WEBP = 'WEBP' in Image.SAVE
+
+
+def image_file(size=(800, 400), mode='RGB', image_format='PNG'):
+    """return the bytes of a generated image"""
+    buffer = BytesIO()
+    Image.new(mode, size).save(buffer, format=image_format)
+    return ContentFile(buffer.getvalue())
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_DIR,
+    RECIPE_IMAGE_DERIVATIVES={'ASYNC': False},
+)
+class ImageDerivativeTests(TestCase):
+    """test rendering resized variants of recipe images"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'images@gmail.com',
+            'testpass'
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Soup', time_minutes=5, price=5
+        )
+        self.recipe.image.save('soup.png', image_file(mode='RGBA'))
+
+    def tearDown(self):
+        for formats in images.derivative_names(
+                self.recipe.image.name).values():
+            for name in formats.values():
+                default_storage.delete(name)
+        self.recipe.image.delete()
+
+    def test_render_derivatives(self):
+        """test every size and format is rendered and flagged ready"""
+        images.submit(self.recipe.pk, self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_derivatives)
+        thumb = images.derivative_name(self.recipe.image.name, 'thumb', 'jpg')
+        with Image.open(default_storage.path(thumb)) as image:
+            self.assertEqual(image.size, (150, 75))
+            self.assertEqual(image.format, 'JPEG')
+        large = images.derivative_name(self.recipe.image.name, 'large',
+                                       'jpg')
+        with Image.open(default_storage.path(large)) as image:
+            self.assertEqual(image.size, (800, 400))
+
+    @skipUnless(WEBP, 'Pillow was built without WEBP support')
+    def test_render_webp(self):
+        """test WEBP variants are rendered when Pillow can write them"""
+        images.submit(self.recipe.pk, self.recipe.image.name)
+
+        large = images.derivative_name(self.recipe.image.name, 'large',
+                                       'webp')
+        with Image.open(default_storage.path(large)) as image:
+            self.assertEqual(image.size, (800, 400))
+            self.assertEqual(image.format, 'WEBP')
+
+    def test_unavailable_format_skipped(self):
+        """test formats Pillow cannot write do not stop the others"""
+        with patch.dict(Image.SAVE):
+            Image.SAVE.pop('WEBP', None)
+            images.submit(self.recipe.pk, self.recipe.image.name)
+            names = images.derivative_names(self.recipe.image.name)
+
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_derivatives)
+        self.assertEqual(set(names['thumb']), {'jpg'})
+        self.assertTrue(default_storage.exists(names['thumb']['jpg']))
+
+    def test_replaced_image_not_flagged(self):
+        """test a stale render does not flag a newer image as ready"""
+        old_name = self.recipe.image.name
+        images.submit(self.recipe.pk, old_name)
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            image='uploads/recipe/other.png', image_derivatives=False
+        )
+
+        images.mark_ready(self.recipe.pk, old_name)
+
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image_derivatives)
+        self.recipe.image.name = old_name
+
+    def test_serializer_variant_urls(self):
+        """test variant URLs are exposed once rendered"""
+        self.assertIsNone(RecipeSerializer(self.recipe).data['image_variants'])
+
+        images.submit(self.recipe.pk, self.recipe.image.name)
+        self.recipe.refresh_from_db()
+
+        variants = RecipeSerializer(self.recipe).data['image_variants']
+        self.assertEqual(set(variants), {'thumb', 'medium', 'large'})
+        self.assertTrue(variants['thumb']['jpg'].endswith('.thumb.jpg'))
+
+    def test_backfill_command(self):
+        """test the command renders images without derivatives"""
+        call_command('generate_image_derivatives', stdout=StringIO())
+
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_derivatives)
+        medium = images.derivative_name(self.recipe.image.name, 'medium',
+                                        'jpg')
+        self.assertTrue(os.path.exists(default_storage.path(medium)))
+
+    def test_failed_render_logged(self):
+        """test a failed render is logged with its recipe"""
+        future = Future()
+        future.set_exception(OSError('truncated image'))
+
+        with self.assertLogs('core.images', 'ERROR') as logs:
+            images._finished(future, self.recipe.pk, self.recipe.image.name)
+
+        self.assertIn(f'recipe {self.recipe.pk}', logs.output[0])
+        self.assertIn('OSError: truncated image', logs.output[0])
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image_derivatives)
@@ -0,0 +1,150 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import instrumentation
+from core.models import Recipe, Tag
+
+TAGS_URL = reverse('recipe:tag-list')
+EXPORT_URL = reverse('recipe:recipe-export')
+ME_URL = reverse('user:me')
+
+
+def timings(response):
+    """Return the Server-Timing header as {name: (duration, desc)}"""
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name, *params = metric.split(';')
+        params = dict(param.split('=', 1) for param in params)
+        metrics[name] = (float(params['dur']), params.get('desc'))
+    return metrics
+
+
+class QueryStatsTests(TestCase):
+    """test adding up the queries of a request"""
+
+    def test_statements_grouped(self):
+        """test repeated statements are counted with their first call site"""
+        stats = instrumentation.QueryStats(max_statements=10)
+
+        with connection.execute_wrapper(stats):
+            for name in ('a', 'b', 'c'):
+                list(Tag.objects.filter(name=name))
+            Tag.objects.count()
+
+        self.assertEqual(stats.count, 4)
+        top = stats.top(5)
+        self.assertEqual(len(top), 2)
+        tags = next(entry for entry in top if entry['count'] == 3)
+        self.assertIn('core/tests/test_instrumentation.py', tags['call_site'])
+        self.assertIn('test_statements_grouped', tags['call_site'])
+
+    def test_max_statements(self):
+        """test statements past the limit are only counted"""
+        stats = instrumentation.QueryStats(max_statements=1)
+
+        with connection.execute_wrapper(stats):
+            Tag.objects.count()
+            Tag.objects.exists()
+
+        self.assertEqual(stats.count, 2)
+        self.assertEqual(len(stats.statements), 1)
+
+    def test_top_slowest_first(self):
+        """test top returns the statements that took longest"""
+        stats = instrumentation.QueryStats(max_statements=10)
+        stats.statements = {'fast': [3, 0.001, None],
+                            'slow': [1, 0.5, 'a.py:1 in f'],
+                            'medium': [2, 0.01, None]}
+
+        self.assertEqual(stats.top(2), [
+            {'sql': 'slow', 'count': 1, 'ms': 500.0,
+             'call_site': 'a.py:1 in f'},
+            {'sql': 'medium', 'count': 2, 'ms': 10.0, 'call_site': None},
+        ])
+
+
+class QueryInstrumentationMiddlewareTests(TestCase):
+    """test timing the API requests"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing(self):
+        """test API responses report their db, view and render times"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        metrics = timings(res)
+        self.assertEqual(list(metrics),
+                         ['db', 'serialize', 'render', 'total'])
+        self.assertRegex(metrics['db'][1], r'^"\d+ queries"$')
+        self.assertGreaterEqual(metrics['total'][0], metrics['db'][0])
+
+    def test_user_api_instrumented(self):
+        """test the user API is timed"""
+        res = self.client.get(ME_URL)
+
+        self.assertIn('total', timings(res))
+
+    def test_other_paths_not_instrumented(self):
+        """test requests outside PATHS are left alone"""
+        res = self.client.get(reverse('healthz'))
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(QUERY_INSTRUMENTATION={'ENABLED': False})
+    def test_disabled(self):
+        """test the middleware can be switched off"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(QUERY_INSTRUMENTATION={'SLOW_REQUEST_MS': 0,
+                                              'TOP_QUERIES': 100})
+    def test_slow_request_logged(self):
+        """test slow requests are logged with their queries"""
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            self.client.get(TAGS_URL)
+
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['event'], 'slow_request')
+        self.assertEqual(entry['path'], TAGS_URL)
+        self.assertEqual(entry['view'], 'recipe:tag-list')
+        self.assertEqual(entry['status'], 200)
+        self.assertEqual(sum(query['count'] for query in entry['top_queries']),
+                         entry['queries'])
+        tag_list = [query for query in entry['top_queries']
+                    if query['sql'].startswith('SELECT')
+                    and 'FROM "core_tag"' in query['sql']]
+        self.assertEqual(len(tag_list), 1)
+        self.assertEqual(tag_list[0]['count'], 1)
+
+    @override_settings(QUERY_INSTRUMENTATION={'SLOW_REQUEST_MS': 0})
+    def test_streamed_queries_timed(self):
+        """test queries run while streaming are counted and logged"""
+        Recipe.objects.create(user=self.user, title='Soup', time_minutes=5,
+                              price=5)
+        res = self.client.get(EXPORT_URL)
+        timer = res.wsgi_request._timer
+        before = timer.queries.count
+
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            b''.join(res.streaming_content)
+
+        self.assertGreater(timer.queries.count, before)
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['queries'], timer.queries.count)
+        self.assertTrue(any('FROM "core_recipe"' in query['sql']
+                            for query in entry['top_queries']))
@@ -0,0 +1,99 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+MEDIA_DIR = tempfile.mkdtemp()
+DIGEST = 'ab' * 32
+CONTENT_NAME = f'uploads/recipe/ab/ab/{DIGEST}.jpg'
+
+
+def media_url(name):
+    return reverse('media', args=[name])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_DIR)
+class ServeMediaTests(TestCase):
+    """test serving uploaded files"""
+
+    def setUp(self):
+        for name in ('uploads/recipe/plain.jpg', CONTENT_NAME):
+            path = os.path.join(MEDIA_DIR, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(b'0123456789')
+
+    def test_serve_file(self):
+        """test the whole file is sent with validators"""
+        res = self.client.get(media_url('uploads/recipe/plain.jpg'))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'0123456789')
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('no-cache', res['Cache-Control'])
+        self.assertIn('ETag', res)
+        self.assertIn('Last-Modified', res)
+
+    def test_content_addressed_immutable(self):
+        """test content addressed files are cached for a year"""
+        res = self.client.get(media_url(CONTENT_NAME))
+
+        self.assertEqual(res['ETag'], f'"{DIGEST}"')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('max-age=31536000', res['Cache-Control'])
+
+    def test_range(self):
+        """test a byte range is answered with partial content"""
+        url = media_url('uploads/recipe/plain.jpg')
+
+        res = self.client.get(url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b''.join(res.streaming_content), b'234')
+        self.assertEqual(res['Content-Range'], 'bytes 2-4/10')
+
+        res = self.client.get(url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(res.streaming_content), b'789')
+
+        res = self.client.get(url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_sends_whole_file(self):
+        """test a range of a changed file is ignored"""
+        res = self.client.get(media_url('uploads/recipe/plain.jpg'),
+                              HTTP_RANGE='bytes=2-4',
+                              HTTP_IF_RANGE='"old"')
+
+        self.assertEqual(res.status_code, 200)
+
+    def test_not_modified(self):
+        """test unchanged files are answered with 304"""
+        url = media_url('uploads/recipe/plain.jpg')
+        res = self.client.get(url)
+
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(res.status_code, 304)
+
+        res = self.client.get(url,
+                              HTTP_IF_MODIFIED_SINCE=res['Last-Modified'])
+        self.assertEqual(res.status_code, 304)
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_accel_redirect(self):
+        """test the web server can be asked to send the bytes"""
+        res = self.client.get(media_url(CONTENT_NAME))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res['X-Accel-Redirect'],
+                         f'/protected-media/{CONTENT_NAME}')
+        self.assertEqual(res.content, b'')
+
+    def test_missing_or_outside_file(self):
+        """test files outside the media root are not served"""
+        res = self.client.get(media_url('uploads/recipe/missing.jpg'))
+        self.assertEqual(res.status_code, 404)
+
+        res = self.client.get(media_url('../etc/passwd'))
+        self.assertEqual(res.status_code, 404)
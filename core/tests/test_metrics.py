@@ -0,0 +1,171 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Recipe
+
+TAGS_URL = reverse('recipe:tag-list')
+METRICS_URL = reverse('metrics')
+
+
+def sample(name, **labels):
+    from prometheus_client import REGISTRY
+
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@skipIf(metrics.prometheus_client is None, 'prometheus_client not installed')
+class MetricsTests(TestCase):
+    """test the request metrics"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_requests_labelled_by_route(self):
+        """test requests are counted and timed per URL name"""
+        requests = sample('http_requests_total', route='recipe:tag-list',
+                          method='GET', status='200')
+        timed = sample('http_request_duration_seconds_count',
+                       route='recipe:tag-list', method='GET')
+        queries = sample('db_queries_total', route='recipe:tag-list')
+
+        self.client.get(TAGS_URL)
+
+        self.assertEqual(sample('http_requests_total',
+                                route='recipe:tag-list', method='GET',
+                                status='200'), requests + 1)
+        self.assertEqual(sample('http_request_duration_seconds_count',
+                                route='recipe:tag-list', method='GET'),
+                         timed + 1)
+        self.assertGreater(sample('db_queries_total',
+                                  route='recipe:tag-list'), queries)
+
+    def test_unresolved_route(self):
+        """test paths without a route share one label"""
+        before = sample('http_requests_total', route='unresolved',
+                        method='GET', status='404')
+
+        self.client.get('/api/recipe/no/such/path/123/')
+
+        self.assertEqual(sample('http_requests_total', route='unresolved',
+                                method='GET', status='404'), before + 1)
+
+    def test_token_cache_hits(self):
+        """test token lookups are counted as cache hits and misses"""
+        token = Token.objects.create(user=self.user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        hits = sample('auth_token_cache_requests_total', result='hit')
+        misses = sample('auth_token_cache_requests_total', result='miss')
+
+        client.get(TAGS_URL)
+        client.get(TAGS_URL)
+
+        self.assertEqual(sample('auth_token_cache_requests_total',
+                                result='miss'), misses + 1)
+        self.assertEqual(sample('auth_token_cache_requests_total',
+                                result='hit'), hits + 1)
+
+    def test_upload_bytes(self):
+        """test received image bytes are counted"""
+        recipe = Recipe.objects.create(user=self.user, title='Soup',
+                                       time_minutes=5, price=1)
+        url = reverse('recipe:recipe-upload-image', args=[recipe.id])
+        before = sample('recipe_image_upload_bytes_total', kind='chunked')
+
+        self.client.put(url, b'0123', content_type='image/jpeg',
+                        HTTP_CONTENT_RANGE='bytes 0-3/10',
+                        HTTP_CONTENT_DISPOSITION='attachment; '
+                                                 'filename="soup.jpg"')
+
+        self.assertEqual(sample('recipe_image_upload_bytes_total',
+                                kind='chunked'), before + 4)
+
+        before = sample('recipe_image_upload_bytes_total', kind='multipart')
+        image = SimpleUploadedFile('soup.jpg', b'not an image',
+                                   content_type='image/jpeg')
+        self.client.post(url, {'image': image}, format='multipart')
+
+        self.assertEqual(sample('recipe_image_upload_bytes_total',
+                                kind='multipart'), before + 12)
+
+    def test_endpoint(self):
+        """test the metrics are served in the Prometheus text format"""
+        self.client.get(TAGS_URL)
+
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        self.assertIn(b'http_requests_total{', res.content)
+
+    def test_endpoint_refused_to_other_networks(self):
+        """test clients outside ALLOWED_NETWORKS are refused"""
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.7')
+
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        with self.settings(METRICS={'ALLOWED_NETWORKS': ('203.0.113.0/24',)}):
+            res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_endpoint_token(self):
+        """test a bearer token opens the endpoint to any address"""
+        with self.settings(METRICS={'ALLOWED_NETWORKS': (),
+                                    'TOKEN': 'scrape'}):
+            refused = self.client.get(METRICS_URL,
+                                      HTTP_AUTHORIZATION='Bearer wrong')
+            res = self.client.get(METRICS_URL, REMOTE_ADDR='203.0.113.7',
+                                  HTTP_AUTHORIZATION='Bearer scrape')
+
+        self.assertEqual(refused.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_streamed_queries_counted(self):
+        """test queries run while streaming count towards the route"""
+        Recipe.objects.create(user=self.user, title='Soup', time_minutes=5,
+                              price=5)
+        route = 'recipe:recipe-export'
+        before = sample('db_queries_total', route=route)
+
+        with self.settings(QUERY_INSTRUMENTATION={'ENABLED': False}):
+            res = self.client.get(reverse(route))
+            started = sample('db_queries_total', route=route)
+            b''.join(res.streaming_content)
+
+        self.assertEqual(started, before)
+        self.assertGreater(sample('db_queries_total', route=route), before)
+
+    def test_multiprocess(self):
+        """test samples written by several processes are added up"""
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+            for _ in range(2):
+                subprocess.run([
+                    sys.executable, '-c',
+                    'from core import metrics; '
+                    'metrics.count_upload_bytes("chunked", 10)',
+                ], check=True, cwd=settings.BASE_DIR, env=env)
+
+            with patch.dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory):
+                res = self.client.get(METRICS_URL)
+
+        self.assertIn(b'recipe_image_upload_bytes_total{kind="chunked"} '
+                      b'20.0', res.content)
@@ -0,0 +1,48 @@
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+
+class MergeDuplicateNamesMigrationTests(TransactionTestCase):
+    """test the migration merging same named tags and ingredients"""
+
+    before = [('core', '0007_collection_version')]
+    after = [('core', '0008_merge_duplicate_names')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.executor.loader.build_graph()
+
+    def tearDown(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+    def test_recipe_linked_to_several_duplicates(self):
+        """test a recipe tagged with many copies keeps a single link"""
+        apps = self.executor.loader.project_state(self.before).apps
+        User = apps.get_model('core', 'User')
+        Tag = apps.get_model('core', 'Tag')
+        Recipe = apps.get_model('core', 'Recipe')
+        user = User.objects.create(email='merge@gmail.com', password='x')
+        keep, *copies = [Tag.objects.create(user=user, name='Vegan')
+                         for _ in range(4)]
+        both = Recipe.objects.create(user=user, title='Soup',
+                                     time_minutes=5, price=5)
+        both.tags.add(keep, *copies)
+        extra = Recipe.objects.create(user=user, title='Stew',
+                                      time_minutes=5, price=5)
+        extra.tags.add(*copies[1:])
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.after)
+
+        apps = self.executor.loader.project_state(self.after).apps
+        Tag = apps.get_model('core', 'Tag')
+        through = apps.get_model('core', 'Recipe').tags.through
+        self.assertEqual(list(Tag.objects.values_list('id', flat=True)),
+                         [keep.id])
+        self.assertEqual(
+            sorted(through.objects.values_list('recipe_id', 'tag_id')),
+            [(both.id, keep.id), (extra.id, keep.id)]
+        )
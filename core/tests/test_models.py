@@ -1,4 +1,7 @@
+from unittest import skipUnless
+
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
 
 from core import models
@@ -69,3 +72,15 @@ class ModelTests(TestCase):
             price=5.00,
         )
         self.assertEqual(str(recipe), recipe.title)
+
+    @skipUnless(connection.vendor == 'sqlite', 'reads the SQLite plan')
+    def test_recipe_keyset_orderings_indexed(self):
+        """test recipe list pages are read in index order"""
+        user = sample_user()
+        recipes = models.Recipe.objects.filter(user=user)
+
+        for field in ('pk', 'title', 'price', 'time_minutes'):
+            plan = recipes.filter(**{f'{field}__lt': 1}).order_by(
+                f'-{field}', '-pk'
+            )[:10].explain()
+            self.assertNotIn('TEMP B-TREE', plan)
@@ -0,0 +1,87 @@
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+from io import BytesIO
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core import parsers, renderers
+from core.parsers import FastJSONParser
+from core.renderers import FastJSONRenderer
+
+PAYLOAD = OrderedDict([
+    ('id', 1),
+    ('title', 'Crème brûlée   ☕'),
+    ('price', Decimal('5.10')),
+    ('tags', [1, 2, 3]),
+    ('created', datetime.datetime(2020, 1, 2, 3, 4, 5, 678901,
+                                  tzinfo=timezone.utc)),
+    ('day', datetime.date(2020, 1, 2)),
+    ('message', gettext_lazy('This field is required.')),
+    ('counts', {1: 'one', 'two': 2.5}),
+    ('image', None),
+    ('nested', [OrderedDict([('ready', True)])]),
+])
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    """test the orjson renderer matches DRF's output"""
+
+    @skipIf(renderers.orjson is None, 'orjson is not installed')
+    def test_same_bytes(self):
+        """test the rendered bytes equal the stdlib renderer's"""
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD),
+                         JSONRenderer().render(PAYLOAD))
+
+    def test_indent_falls_back(self):
+        """test indented output is rendered by the stdlib"""
+        context = {'indent': 2}
+
+        self.assertEqual(FastJSONRenderer().render(PAYLOAD, None, context),
+                         JSONRenderer().render(PAYLOAD, None, context))
+
+    def test_without_orjson(self):
+        """test the stdlib renderer is used when orjson is missing"""
+        with patch.object(renderers, 'orjson', None):
+            self.assertEqual(FastJSONRenderer().render(PAYLOAD),
+                             JSONRenderer().render(PAYLOAD))
+
+    def test_large_integers(self):
+        """test integers beyond 64 bits are still rendered"""
+        self.assertEqual(FastJSONRenderer().render({'id': 2 ** 70}),
+                         b'{"id":1180591620717411303424}')
+
+
+class FastJSONParserTests(SimpleTestCase):
+    """test the orjson parser matches DRF's results"""
+
+    def parse(self, parser, body):
+        return parser.parse(BytesIO(body), 'application/json', {})
+
+    def test_same_data(self):
+        """test parsed bodies equal the stdlib parser's"""
+        body = '{"title": "Crème", "price": "5.10", "tags": [1, 2], ' \
+               '"time": 1.5, "big": 123456789012345678901234567890}'
+        body = body.encode('utf-8')
+
+        self.assertEqual(self.parse(FastJSONParser(), body),
+                         self.parse(JSONParser(), body))
+
+    def test_invalid_json(self):
+        """test invalid bodies raise DRF's parse error"""
+        for body in (b'{"title": ', b'{"price": NaN}'):
+            with self.assertRaises(ParseError):
+                self.parse(FastJSONParser(), body)
+
+    def test_without_orjson(self):
+        """test the stdlib parser is used when orjson is missing"""
+        with patch.object(parsers, 'orjson', None):
+            self.assertEqual(self.parse(FastJSONParser(), b'{"a": [1]}'),
+                             {'a': [1]})
@@ -0,0 +1,247 @@
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import routers
+from core.models import Tag
+from core.signals import check_connections, mark_connections_idle
+
+TAGS_URL = reverse('recipe:tag-list')
+REPLICAS = {'REPLICAS': ['replica-1', 'replica-2'], 'CACHE': 'default'}
+EXPORT_URL = reverse('recipe:recipe-export')
+
+
+class BrokenConnection:
+    connection = None
+
+    def ensure_connection(self):
+        raise OperationalError('connection refused')
+
+
+@override_settings(DATABASE_ROUTING=REPLICAS)
+class ReplicaRouterTests(TestCase):
+    """test choosing the database of reads"""
+
+    def setUp(self):
+        cache.clear()
+        routers._down.clear()
+
+    def test_reads_default_outside_requests(self):
+        """test reads without a chosen replica use the primary"""
+        router = routers.ReplicaRouter()
+
+        self.assertIsNone(router.db_for_read(Tag))
+        token = routers.set_read_alias('replica-1')
+        self.assertEqual(router.db_for_read(Tag), 'replica-1')
+        routers.reset_read_alias(token)
+        self.assertIsNone(router.db_for_read(Tag))
+        self.assertEqual(router.db_for_write(Tag), 'default')
+
+    def test_no_migrations_on_replicas(self):
+        """test replicas are left to replication"""
+        router = routers.ReplicaRouter()
+
+        self.assertFalse(router.allow_migrate('replica-1', 'core'))
+        self.assertIsNone(router.allow_migrate('default', 'core'))
+
+    @patch('core.routers.is_available', return_value=True)
+    def test_read_your_writes(self, available):
+        """test a user reads the primary right after a write"""
+        self.assertIn(routers.choose_replica(1), REPLICAS['REPLICAS'])
+
+        routers.record_write(1)
+
+        self.assertIsNone(routers.choose_replica(1))
+        self.assertIn(routers.choose_replica(2), REPLICAS['REPLICAS'])
+
+    def test_failover(self):
+        """test a failing replica is skipped until FAILOVER_SECONDS pass"""
+        with patch.dict('django.db.connections._connections.__dict__',
+                        {'replica-1': BrokenConnection(),
+                         'replica-2': BrokenConnection()}):
+            self.assertIsNone(routers.choose_replica(1))
+        self.assertEqual(set(routers._down), {'replica-1', 'replica-2'})
+
+        with patch('core.routers.connections') as connections:
+            self.assertIsNone(routers.choose_replica(1))
+        connections.__getitem__.assert_not_called()
+
+    @patch('core.routers.is_available', return_value=True)
+    @override_settings(DATABASE_ROUTING={'REPLICAS': ['replica-1']})
+    def test_without_cache(self, available):
+        """test replicas are not used without a read-your-writes cache"""
+        self.assertIsNone(routers.choose_replica(1))
+
+    def test_check_requires_shared_cache(self):
+        """test the system check refuses caches local to a worker"""
+        errors = routers.check_routing()
+        self.assertEqual([error.id for error in errors], ['core.E001'])
+
+        shared = {'BACKEND': 'django.core.cache.backends.memcached.'
+                             'PyMemcacheCache'}
+        with self.settings(CACHES={'default': shared}):
+            self.assertEqual(routers.check_routing(), [])
+
+    def test_keep_read_alias(self):
+        """test streamed items are produced reading the chosen alias"""
+        def items():
+            for _ in range(2):
+                yield routers.ReplicaRouter().db_for_read(Tag)
+
+        streamed = list(routers.keep_read_alias(items(), 'replica-1'))
+
+        self.assertEqual(streamed, ['replica-1', 'replica-1'])
+        self.assertIsNone(routers._read_alias.get())
+
+    @override_settings(DATABASE_ROUTING={'REPLICAS': []})
+    def test_without_replicas(self):
+        """test every read uses the primary when there is no replica"""
+        self.assertIsNone(routers.choose_replica(1))
+
+
+@override_settings(DATABASE_ROUTING=REPLICAS)
+class ReplicaReadApiTests(TestCase):
+    """test the recipe API routes its reads"""
+
+    def setUp(self):
+        cache.clear()
+        routers._down.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@londonappdev.com', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @patch('core.routers.choose_replica', return_value=None)
+    def test_reads_choose_replica(self, choose_replica):
+        """test safe requests pick a replica for the user"""
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        choose_replica.assert_called_once_with(self.user.pk)
+        self.assertIsNone(routers._read_alias.get())
+
+    @patch('core.routers.choose_replica', return_value='default')
+    def test_stream_reads_replica(self, choose_replica):
+        """test an export reads the chosen database while it streams"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        aliases = []
+        db_for_read = routers.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            aliases.append(db_for_read(router, model, **hints))
+            return aliases[-1]
+
+        res = self.client.get(EXPORT_URL)
+        with patch.object(routers.ReplicaRouter, 'db_for_read', record):
+            b''.join(res.streaming_content)
+
+        self.assertTrue(aliases)
+        self.assertEqual(set(aliases), {'default'})
+
+    def test_write_pins_reads_to_primary(self):
+        """test a successful write starts the read-your-writes window"""
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(routers.recently_wrote(self.user.pk))
+
+    def test_failed_write_does_not_pin(self):
+        """test a rejected write keeps reading replicas"""
+        res = self.client.post(TAGS_URL, {'name': ''})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(routers.recently_wrote(self.user.pk))
+
+
+MIRROR = 'replica-mirror'
+# a second connection to the test database, standing in for a replica;
+# registered on import so the test runner sets it up as a mirror
+connections.databases.setdefault(MIRROR, dict(
+    connections.databases['default'], TEST={'MIRROR': 'default'}
+))
+
+
+@override_settings(DATABASE_ROUTING={'REPLICAS': [MIRROR], 'CACHE': 'default'})
+class ReplicaAliasTests(TransactionTestCase):
+    """test routing over a real second alias of the test database"""
+    databases = {'default', MIRROR}
+
+    def setUp(self):
+        cache.clear()
+        routers._down.clear()
+        self.user = get_user_model().objects.create_user(
+            'aliases@gmail.com', 'testpass'
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def request(self, method, *args, **kwargs):
+        """return the response and the SQL run on each alias"""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[MIRROR]) as replica:
+            res = getattr(self.client, method)(*args, **kwargs)
+        return res, [q['sql'] for q in primary], [q['sql'] for q in replica]
+
+    def test_reads_replica_writes_primary(self):
+        """test list reads run on the replica and inserts on the primary"""
+        res, primary, replica = self.request('post', TAGS_URL,
+                                             {'name': 'Vegan'})
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(any(sql.startswith('INSERT INTO "core_tag"')
+                            for sql in primary))
+        self.assertFalse(any('core_tag' in sql for sql in replica))
+
+        cache.clear()
+        res, primary, replica = self.request('get', TAGS_URL)
+        self.assertEqual([tag['name'] for tag in res.data['results']],
+                         ['Vegan'])
+        self.assertTrue(any(sql.startswith('SELECT') and
+                            'FROM "core_tag"' in sql for sql in replica))
+        self.assertFalse(any('FROM "core_tag"' in sql for sql in primary))
+
+
+@override_settings(CONN_HEALTH_CHECK_IDLE=30)
+class ConnectionHealthTests(TestCase):
+    """test persistent connections are checked before reuse"""
+
+    def check(self, idle_for, usable=False):
+        connection.ensure_connection()
+        idle_since = time.monotonic() - idle_for
+        with patch.object(connection, 'idle_since', idle_since,
+                          create=True), \
+                patch.object(connection, 'in_atomic_block', False), \
+                patch.object(connection, 'is_usable',
+                             return_value=usable) as is_usable, \
+                patch.object(connection, 'close') as close:
+            check_connections()
+        return is_usable, close
+
+    def test_unusable_connection_closed(self):
+        """test a connection the server dropped while idle is closed"""
+        is_usable, close = self.check(idle_for=60)
+
+        is_usable.assert_called_once_with()
+        close.assert_called_once_with()
+
+    def test_recent_connection_not_checked(self):
+        """test connections used recently cost no extra query"""
+        is_usable, close = self.check(idle_for=1)
+
+        is_usable.assert_not_called()
+        close.assert_not_called()
+
+    def test_idle_marked(self):
+        """test finished requests mark their open connections idle"""
+        connection.ensure_connection()
+        with patch.object(connection, 'idle_since', 0, create=True):
+            mark_connections_idle()
+            self.assertGreater(connection.idle_since, 0)
@@ -0,0 +1,258 @@
+import os
+import tempfile
+from io import BytesIO, StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import images, storage, uploads
+from core.models import CollectionVersion, Recipe, StoredFile
+
+MEDIA_DIR = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_DIR)
+class ContentAddressedStorageTests(TestCase):
+    """test storing images by the hash of their content"""
+
+    def setUp(self):
+        self.storage = storage.ContentAddressedStorage(location=MEDIA_DIR)
+
+    def test_name_from_content(self):
+        """test files are named and sharded by their sha256"""
+        name = self.storage.save('uploads/recipe/a.JPG', ContentFile(b'x'))
+
+        digest = ('2d711642b726b04401627ca9fbac32f5'
+                  'c8530fb1903cc4db02258717921a4881')
+        self.assertEqual(name, f'uploads/recipe/2d/71/{digest}.jpg')
+        self.assertTrue(storage.is_content_addressed(name))
+        self.assertTrue(os.path.exists(self.storage.path(name)))
+        self.storage.delete(name)
+
+    def test_identical_content_stored_once(self):
+        """test uploading the same bytes twice returns the same name"""
+        first = self.storage.save('uploads/recipe/a.png', ContentFile(b'y'))
+        second = self.storage.save('uploads/recipe/b.png', ContentFile(b'y'))
+
+        self.assertEqual(first, second)
+        directory = os.path.dirname(self.storage.path(first))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first)])
+        self.storage.delete(first)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_DIR)
+class ImageReferenceTests(TestCase):
+    """test counting the recipes referencing each image"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'storage@gmail.com',
+            'testpass'
+        )
+
+    def sample_recipe(self, image):
+        return Recipe.objects.create(user=self.user, title='Soup',
+                                     time_minutes=5, price=5, image=image)
+
+    def test_references_counted(self):
+        """test saving and deleting recipes updates the count"""
+        first = self.sample_recipe('uploads/recipe/shared.png')
+        second = self.sample_recipe('uploads/recipe/shared.png')
+        self.assertEqual(StoredFile.objects.get().references, 2)
+
+        first.delete()
+        self.assertEqual(StoredFile.objects.get().references, 1)
+
+        second.image = 'uploads/recipe/other.png'
+        second.save()
+        self.assertEqual(
+            list(StoredFile.objects.values_list('name', 'references')),
+            [('uploads/recipe/other.png', 1)]
+        )
+
+    def test_file_kept_while_referenced(self):
+        """test the file is only deleted with its last reference"""
+        name = default_storage.save('uploads/recipe/kept.png',
+                                    ContentFile(b'z'))
+        first = self.sample_recipe(name)
+        self.sample_recipe(name)
+
+        first.delete()
+        storage.delete_unreferenced(name)
+        self.assertTrue(default_storage.exists(name))
+
+        Recipe.objects.get().delete()
+        storage.delete_unreferenced(name)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_reused_file_kept(self):
+        """test a file stored again within the grace period is kept"""
+        name = self.storage_save(b'reused')
+        self.sample_recipe(name).delete()
+
+        self.assertEqual(self.storage_save(b'reused'), name)
+        storage.delete_unreferenced(name, grace=storage.REUSE_GRACE)
+        self.assertTrue(default_storage.exists(name))
+
+        storage.delete_unreferenced(name)
+        self.assertFalse(default_storage.exists(name))
+
+    def test_loaded_recipe_tracks_image(self):
+        """test recipes loaded from the database remember their image"""
+        self.sample_recipe('uploads/recipe/loaded.png')
+
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe._stored_image, 'uploads/recipe/loaded.png')
+        recipe.image = 'uploads/recipe/replaced.png'
+        recipe.save()
+        self.assertEqual(
+            list(StoredFile.objects.values_list('name', 'references')),
+            [('uploads/recipe/replaced.png', 1)]
+        )
+
+    def storage_save(self, content):
+        return storage.ContentAddressedStorage(location=MEDIA_DIR).save(
+            'uploads/recipe/upload.png', ContentFile(content)
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_DIR)
+class MigrateImageStorageTests(TestCase):
+    """test moving existing images to content addressed names"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'migrate@gmail.com',
+            'testpass'
+        )
+        legacy = FileSystemStorage(location=MEDIA_DIR)
+        self.names = [
+            legacy.save(f'uploads/recipe/{n}.png', ContentFile(b'same'))
+            for n in ('one', 'two')
+        ]
+        self.recipes = [
+            Recipe.objects.create(user=self.user, title='Soup',
+                                  time_minutes=5, price=5, image=name)
+            for name in self.names
+        ]
+
+    def test_dry_run(self):
+        """test a dry run leaves the images alone"""
+        out = StringIO()
+        call_command('migrate_image_storage', '--dry-run', stdout=out)
+
+        self.assertIn('Would migrate 2 images', out.getvalue())
+        for recipe, name in zip(self.recipes, self.names):
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.image.name, name)
+
+    def test_migrate_merges_duplicates(self):
+        """test identical images end up as one referenced file"""
+        thumb = images.derivative_name(self.names[0], 'thumb', 'jpg')
+        with open(default_storage.path(thumb), 'wb') as f:
+            f.write(b'thumb')
+        out = StringIO()
+
+        call_command('migrate_image_storage', stdout=out)
+
+        for recipe in self.recipes:
+            recipe.refresh_from_db()
+        name = self.recipes[0].image.name
+        self.assertTrue(storage.is_content_addressed(name))
+        self.assertEqual(self.recipes[1].image.name, name)
+        self.assertEqual(
+            list(StoredFile.objects.values_list('name', 'references')),
+            [(name, 2)]
+        )
+        self.assertTrue(default_storage.exists(
+            images.derivative_name(name, 'thumb', 'jpg')
+        ))
+        self.assertIn('1 duplicates merged, 4 bytes', out.getvalue())
+        default_storage.delete(name)
+
+    def test_migrate_bumps_recipe_version(self):
+        """test cached recipe lists are invalidated by the new names"""
+        CollectionVersion.objects.for_user(self.user.pk, ['recipe'])
+
+        call_command('migrate_image_storage', stdout=StringIO())
+
+        self.assertEqual(CollectionVersion.objects.get(
+            user=self.user, name='recipe').version, 2)
+        default_storage.delete(Recipe.objects.first().image.name)
+
+
+ORPHAN_DIR = tempfile.mkdtemp()
+UPLOAD_TEMP_DIR = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=ORPHAN_DIR, FILE_UPLOAD_TEMP_DIR=UPLOAD_TEMP_DIR)
+class CollectOrphanedImagesTests(TestCase):
+    """test deleting uploaded files no recipe references"""
+
+    def setUp(self):
+        user = get_user_model().objects.create_user(
+            'orphans@gmail.com',
+            'testpass'
+        )
+        Recipe.objects.create(user=user, title='Soup', time_minutes=5,
+                              price=5, image='uploads/recipe/kept.png')
+        for name in ('kept.png', 'kept.thumb.jpg', 'gone.png',
+                     'gone.thumb.jpg', 'lost.medium.webp', 'young.png'):
+            self.write(f'uploads/recipe/{name}', age=0 if 'young' in name
+                       else 7200)
+
+    def tearDown(self):
+        for name in os.listdir(default_storage.path('uploads/recipe')):
+            default_storage.delete(f'uploads/recipe/{name}')
+
+    def write(self, name, age):
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'1234')
+        mtime = os.path.getmtime(path) - age
+        os.utime(path, (mtime, mtime))
+
+    def remaining(self):
+        return sorted(os.listdir(default_storage.path('uploads/recipe')))
+
+    def test_dry_run(self):
+        """test a dry run reports the orphans without deleting them"""
+        out = StringIO()
+        call_command('collect_orphaned_images', '--dry-run', stdout=out)
+
+        self.assertIn('Would delete 3 orphaned files, 12 bytes',
+                      out.getvalue())
+        self.assertEqual(len(self.remaining()), 6)
+
+    def test_collect_orphans(self):
+        """test orphans and their derivatives are deleted"""
+        out = StringIO()
+        call_command('collect_orphaned_images', '--batch-size', '2',
+                     '--rate', '1000', stdout=out)
+
+        self.assertIn('Deleted 3 orphaned files, 12 bytes', out.getvalue())
+        self.assertEqual(self.remaining(),
+                         ['kept.png', 'kept.thumb.jpg', 'young.png'])
+
+    def test_collect_abandoned_uploads(self):
+        """test chunked uploads without recent chunks are deleted"""
+        stale = uploads.ChunkedUpload('stale')
+        stale.write(BytesIO(b'1234'), 0, 3, 8, name='stale.png')
+        active = uploads.ChunkedUpload('active')
+        active.write(BytesIO(b'1234'), 0, 3, 8, name='active.png')
+        mtime = os.path.getmtime(stale.path) - 2 * 86400
+        for path in (stale.path, stale.info_path):
+            os.utime(path, (mtime, mtime))
+
+        out = StringIO()
+        call_command('collect_orphaned_images', stdout=out)
+
+        self.assertIn('Deleted 1 abandoned uploads', out.getvalue())
+        self.assertIsNone(stale.info())
+        self.assertFalse(os.path.exists(stale.path))
+        self.assertEqual(active.offset, 4)
+        active.discard()
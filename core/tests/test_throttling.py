@@ -0,0 +1,110 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import throttling
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TOKEN_URL = reverse('user:token')
+
+
+def rates(**scopes):
+    return dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=scopes)
+
+
+class TokenBucketTests(TestCase):
+    """test the token bucket store"""
+
+    def test_refill(self):
+        """test tokens are spent and refilled over time"""
+        buckets = throttling.TokenBuckets()
+        buckets._configure()
+
+        self.assertEqual(buckets._spend(1, 0, 0, 2, 1), (0, 0))
+        self.assertEqual(buckets._spend(0, 0, 0.5, 2, 1), (0.5, 0.5))
+        self.assertEqual(buckets._spend(0, 0, 10, 2, 1), (1, 0))
+
+    @override_settings(TOKEN_BUCKET_THROTTLE={'BACKEND': 'default'})
+    def test_shared_backend(self):
+        """test limits kept in a cache are shared by every process"""
+        first = throttling.TokenBuckets()
+        second = throttling.TokenBuckets()
+
+        self.assertEqual(first.take('read:user:1', 1, 0.001), 0)
+        self.assertGreater(second.take('read:user:1', 1, 0.001), 0)
+
+    @override_settings(TOKEN_BUCKET_THROTTLE={'BACKEND': 'default'})
+    def test_shared_backend_concurrent(self):
+        """test concurrent takes never exceed the shared capacity"""
+        workers = [throttling.TokenBuckets() for _ in range(4)]
+        barrier = threading.Barrier(len(workers))
+        allowed = []
+
+        def take(buckets):
+            barrier.wait()
+            for _ in range(25):
+                if not buckets.take('write:user:1', 10, 0.001):
+                    allowed.append(1)
+
+        threads = [threading.Thread(target=take, args=(buckets,))
+                   for buckets in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(allowed), 10)
+
+
+class ThrottleApiTests(TestCase):
+    """test requests are limited per user and scope"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'throttle@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    @override_settings(REST_FRAMEWORK=rates(read='2/min', write='1/min'))
+    def test_read_limit(self):
+        """test reads beyond the rate are refused with Retry-After"""
+        for _ in range(2):
+            res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(res['Retry-After'], '30')
+
+        res = self.client.post(RECIPES_URL, {})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(REST_FRAMEWORK=rates(read='1/min'))
+    def test_limits_per_user(self):
+        """test one user's requests do not limit another"""
+        self.client.get(RECIPES_URL)
+        other = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK=rates(token='1/min'))
+    def test_token_limit(self):
+        """test token requests are limited per address"""
+        client = APIClient()
+        payload = {'email': 'throttle@gmail.com', 'password': 'wrong'}
+        client.post(TOKEN_URL, payload)
+
+        res = client.post(TOKEN_URL, payload)
+        self.assertEqual(res.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_TOKEN_BUCKET_THROTTLE = {
+    'MAX_SIZE': 100000,
+    'BACKEND': None,
+}
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return (capacity, tokens per second) of a DRF rate like '60/min'"""
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period[0]]
+
+
+class TokenBuckets:
+    """LRU map of bucket key -> (tokens, updated at)
+
+    A bucket holds up to `capacity` tokens, refills continuously at
+    `rate` tokens per second and every request takes one, so each check
+    is a constant time update of two numbers. Buckets live in a per
+    process LRU of MAX_SIZE entries.
+
+    When BACKEND names a django cache alias the limit is shared by all
+    workers through an atomic counter per key and window of
+    `capacity / rate` seconds instead, as a bucket can not be updated
+    atomically through the cache API. A client may then spend up to
+    twice its capacity around a window boundary.
+    """
+    key_prefix = 'throttle:'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()
+        self._configured = False
+
+    def _configure(self):
+        options = dict(DEFAULT_TOKEN_BUCKET_THROTTLE)
+        options.update(getattr(settings, 'TOKEN_BUCKET_THROTTLE', {}))
+        self.max_size = options['MAX_SIZE']
+        backend = options['BACKEND']
+        self.backend = caches[backend] if backend else None
+        self._configured = True
+
+    def reset(self):
+        """Refill every bucket and reload the settings"""
+        with self._lock:
+            self._buckets.clear()
+            self._configured = False
+
+    def take(self, key, capacity, rate):
+        """Take a token and return 0, or the seconds until one is free"""
+        if not self._configured:
+            self._configure()
+        if self.backend is not None:
+            # wall clock time, comparable between processes
+            return self._take_shared(key, capacity, rate, time.time())
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (capacity, now))
+            tokens, wait = self._spend(tokens, updated, now, capacity, rate)
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def _take_shared(self, key, capacity, rate, now):
+        period = capacity / rate
+        window = int(now // period)
+        key = f'{self.key_prefix}{key}:{window}'
+        # add and incr are atomic in every cache backend django ships
+        self.backend.add(key, 0, timeout=period + 1)
+        try:
+            count = self.backend.incr(key)
+        except ValueError:
+            # the counter expired in between
+            self.backend.add(key, 1, timeout=period + 1)
+            count = 1
+        if count <= capacity:
+            return 0
+        return (window + 1) * period - now
+
+    def _spend(self, tokens, updated, now, capacity, rate):
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        if tokens >= 1:
+            return tokens - 1, 0
+        return tokens, (1 - tokens) / rate
+
+
+buckets = TokenBuckets()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Limit requests per user, or per address when anonymous, and scope
+
+    The scope is the view's `throttle_scopes` entry for the current
+    action, else its `throttle_scope`, else 'read' for safe methods and
+    'write' for the others. Rates come from DEFAULT_THROTTLE_RATES; a
+    scope without one is not limited. Refused requests get a Retry-After
+    header with the time until the next token.
+    """
+
+    def get_scope(self, request, view):
+        action = getattr(view, 'action', None)
+        scopes = getattr(view, 'throttle_scopes', {})
+        if action in scopes:
+            return scopes[action]
+        scope = getattr(view, 'throttle_scope', None)
+        if scope:
+            return scope
+        return 'read' if request.method in SAFE_METHODS else 'write'
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(request, view)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope)
+        if rate is None:
+            return True
+
+        if request.user and request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        self.wait_time = buckets.take(f'{scope}:{ident}', *parse_rate(rate))
+        return not self.wait_time
+
+    def wait(self):
+        return self.wait_time
+
+
+def reset_buckets(setting, **kwargs):
+    """Refill the buckets when the throttle settings change"""
+    if setting in ('TOKEN_BUCKET_THROTTLE', 'REST_FRAMEWORK', 'CACHES'):
+        buckets.reset()
@@ -0,0 +1,168 @@
+"""Resumable chunked uploads of recipe images
+
+A client sends the image in `PUT` requests carrying
+`Content-Range: bytes <first>-<last>/<total>`. Each chunk is copied at its
+offset into a temp file in FILE_UPLOAD_TEMP_DIR through a small buffer,
+`GET` reports how many bytes arrived so an interrupted upload resumes
+where it stopped, and the chunk completing the file hands it to the
+recipe's image field as a single save. Uploads that stop receiving chunks
+are deleted by the collect_orphaned_images command.
+"""
+import json
+import os
+import re
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.files import locks
+from django.core.files.uploadedfile import UploadedFile
+
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+UPLOAD_FILE = re.compile(r'^recipe-image-(.+)\.part(?:\.json)?$')
+COPY_BUFFER_SIZE = 64 * 1024
+DEFAULT_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+
+
+class UploadError(Exception):
+    """A chunk that can not be written at the offset it names"""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+def parse_content_range(header):
+    """Return (first, last, total) of a `Content-Range: bytes` header"""
+    match = CONTENT_RANGE.match(header or '')
+    if match is None:
+        raise ValueError('expected "Content-Range: bytes first-last/total"')
+    first, last, total = map(int, match.groups())
+    max_size = getattr(settings, 'RECIPE_IMAGE_MAX_UPLOAD_SIZE',
+                       DEFAULT_MAX_UPLOAD_SIZE)
+    if first > last or last >= total:
+        raise ValueError('invalid byte range')
+    if total > max_size:
+        raise ValueError(f'images are limited to {max_size} bytes')
+    return first, last, total
+
+
+class ChunkedUploadedFile(UploadedFile):
+    """An assembled upload validated and stored straight from disk"""
+
+    def __init__(self, path, name, content_type, size):
+        super().__init__(open(path, 'rb'), name, content_type, size)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+class ChunkedUpload:
+    """The partial image upload of one recipe"""
+
+    def __init__(self, key):
+        self.path = os.path.join(upload_directory(),
+                                 f'recipe-image-{key}.part')
+        self.info_path = f'{self.path}.json'
+
+    def info(self):
+        """Return the name, content type and size of the upload"""
+        try:
+            with open(self.info_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @property
+    def offset(self):
+        """Number of bytes received so far"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def write(self, stream, first, last, total, name=None,
+              content_type=None):
+        """Copy one chunk from a stream and return the new offset
+
+        A chunk starting at 0 begins a new upload. Later chunks may resend
+        bytes already received but must not leave a gap, and the stream
+        must hold the whole range, otherwise UploadError reports the
+        offset to resume from. Invalid chunks raise ValueError.
+        """
+        if first == 0 and not name:
+            raise ValueError('the first chunk needs a file name')
+
+        descriptor = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(descriptor, 'r+b') as f:
+            locks.lock(f, locks.LOCK_EX)
+            if first == 0:
+                f.truncate(0)
+                with open(self.info_path, 'w') as info_file:
+                    json.dump({'name': name, 'content_type': content_type,
+                               'size': total}, info_file)
+            info = self.info()
+            if info is None:
+                raise UploadError('no upload in progress', offset=0)
+            if info['size'] != total:
+                raise ValueError('the total size changed')
+
+            f.seek(0, os.SEEK_END)
+            if first > f.tell():
+                raise UploadError('chunk does not start at the offset',
+                                  offset=f.tell())
+            f.seek(first)
+            remaining = last - first + 1
+            while remaining:
+                chunk = stream.read(min(remaining, COPY_BUFFER_SIZE))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+            f.flush()
+            offset = f.seek(0, os.SEEK_END)
+            if remaining:
+                raise UploadError(
+                    f'the body ended {remaining} bytes before the range',
+                    offset=offset
+                )
+            return offset
+
+    @property
+    def complete(self):
+        info = self.info()
+        return info is not None and self.offset == info['size']
+
+    def file(self):
+        """Return the assembled upload as an uploaded file"""
+        info = self.info()
+        return ChunkedUploadedFile(self.path, info['name'],
+                                   info['content_type'], info['size'])
+
+    def discard(self):
+        for path in (self.path, self.info_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def upload_directory():
+    return settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()
+
+
+def find_abandoned(max_age):
+    """Yield (upload, size) of uploads without a chunk for max_age seconds"""
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(upload_directory()))
+    except FileNotFoundError:
+        return
+    keys = {match.group(1) for match in map(UPLOAD_FILE.match,
+                                            (entry.name for entry in entries))
+            if match is not None}
+    for key in sorted(keys):
+        upload = ChunkedUpload(key)
+        stats = [os.stat(path) for path in (upload.path, upload.info_path)
+                 if os.path.exists(path)]
+        if stats and max(stat.st_mtime for stat in stats) <= cutoff:
+            yield upload, sum(stat.st_size for stat in stats)
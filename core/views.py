@@ -0,0 +1,181 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, \
+    SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, \
+    JsonResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, \
+    patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.cache import never_cache
+from django.views.decorators.http import require_safe
+
+from core import health, metrics as app_metrics, storage
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def parse_range(header, size):
+    """Return (start, end) of a single `Range: bytes` request
+
+    Returns None when the header should be ignored and raises ValueError
+    when no byte of the file is requested.
+    """
+    match = RANGE.match(header.strip())
+    if match is None:
+        # multiple or other unit ranges may be answered with the whole file
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError('unsatisfiable range')
+    return start, end
+
+
+def read_range(f, start, length):
+    """Yield `length` bytes of an open file from `start` in small blocks"""
+    with f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(length, STREAM_BLOCK_SIZE))
+            if not block:
+                return
+            length -= len(block)
+            yield block
+
+
+def media_etag(name, stat):
+    """Return the content hash of content addressed files, else mtime-size"""
+    if storage.is_content_addressed(name):
+        digest = os.path.splitext(os.path.basename(name))[0]
+        return quote_etag(digest)
+    return quote_etag(f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+
+
+def range_applies(request, etag, last_modified):
+    """Check `If-Range` so a changed file is sent whole"""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+@require_safe
+def serve_media(request, path):
+    """Serve an uploaded file with range, conditional and cache support
+
+    With MEDIA_SENDFILE_HEADER set to 'X-Sendfile' or 'X-Accel-Redirect'
+    only the headers are produced here and the web server sends the
+    bytes, resolving ranges itself.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('file not found')
+    if not os.path.isfile(full_path):
+        raise Http404('file not found')
+
+    name = path.replace(os.sep, '/')
+    etag = media_etag(name, stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        response = file_response(request, name, full_path, stat, etag,
+                                 last_modified)
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        if storage.is_content_addressed(name):
+            patch_cache_control(response, public=True, immutable=True,
+                                max_age=IMMUTABLE_MAX_AGE)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+
+    return response
+
+
+def file_response(request, name, full_path, stat, etag, last_modified):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    sendfile = getattr(settings, 'MEDIA_SENDFILE_HEADER', None)
+    if sendfile:
+        response = HttpResponse(content_type=content_type)
+        if sendfile.lower() == 'x-accel-redirect':
+            location = getattr(settings, 'MEDIA_ACCEL_REDIRECT_LOCATION',
+                               '/protected-media/')
+            response['X-Accel-Redirect'] = location.rstrip('/') + '/' + name
+        else:
+            response[sendfile] = full_path
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    header = request.META.get('HTTP_RANGE')
+    if header and range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(header, size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'),
+                                content_type=content_type)
+        response['Content-Length'] = str(size)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            read_range(open(full_path, 'rb'), start, end - start + 1),
+            status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+@never_cache
+@require_safe
+def healthz(request):
+    """Report database latency, pending migrations and media writability
+
+    Answers 503 when a check fails so a load balancer stops routing to
+    the process. Results are cached for a few seconds by core.health.
+    """
+    result = health.get_health()
+    return JsonResponse(result, status=200 if result['ok'] else 503)
+
+
+@never_cache
+@require_safe
+def metrics(request):
+    """Expose core.metrics in the Prometheus text format"""
+    if app_metrics.prometheus_client is None:
+        raise Http404('prometheus_client is not installed')
+    if not app_metrics.is_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(app_metrics.generate(),
+                        content_type=app_metrics.content_type())
@@ -0,0 +1,134 @@
+import hashlib
+from calendar import timegm
+
+from django.utils.cache import get_conditional_response, \
+    patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from core import routers
+from core.models import CollectionVersion
+from recipe.serializers import ValuesSerializer, sparse_fields
+
+
+class ConditionalGetMixin:
+    """Answer unchanged list and detail requests with 304 Not Modified
+
+    Responses are tagged with the versions of the user's collections
+    they are built from, so `If-None-Match`/`If-Modified-Since` are
+    resolved with one small lookup before the main query or the
+    serializers run.
+    """
+    version_collections = ()
+
+    def get_validators(self, request):
+        """Return the ETag and Last-Modified timestamp of the response"""
+        versions = CollectionVersion.objects.for_user(
+            request.user.pk, self.version_collections
+        )
+        source = ':'.join([
+            str(request.user.pk),
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+        ] + [f'{name}={versions[name][0]}'
+             for name in sorted(versions)])
+        etag = quote_etag(hashlib.md5(source.encode('utf-8')).hexdigest())
+        last_modified = max(modified for _, modified in versions.values())
+
+        return etag, timegm(last_modified.utctimetuple())
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        """Run the handler unless the client copy is still current"""
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Accept', 'Authorization'))
+
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+
+class SparseFieldsMixin:
+    """Load only what the fields requested with ?fields=/?omit= read
+
+    `sparse_field_columns` maps serializer fields that are not a model
+    column of the same name to the columns they read; relations map to
+    no columns and are prefetched by the view only when requested.
+    """
+    sparse_field_columns = {}
+
+    def get_sparse_fields(self):
+        """Return the requested serializer fields, or None for all"""
+        return sparse_fields(self.request,
+                             self.get_serializer_class().Meta.fields)
+
+    def sparse_queryset(self, queryset, fields):
+        columns = []
+        for name in fields:
+            columns.extend(self.sparse_field_columns.get(name, (name,)))
+        return queryset.only('pk', *columns)
+
+
+class ValuesListMixin:
+    """List through ValuesSerializer where the serializer allows it
+
+    Pages are read with values() and serialized without model instances
+    or per row field calls. Serializers with fields ValuesSerializer can
+    not read are listed the usual way.
+    """
+
+    def list(self, request, *args, **kwargs):
+        try:
+            values = ValuesSerializer(self.get_serializer(many=True))
+        except ValueError:
+            return super().list(request, *args, **kwargs)
+
+        queryset = values.get_queryset(
+            self.filter_queryset(self.get_queryset())
+        )
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(values.to_representation(queryset))
+        return self.get_paginated_response(values.to_representation(page))
+
+
+class ReplicaReadMixin:
+    """Read safe requests from a replica chosen by core.routers
+
+    Authentication still reads the primary. Streamed responses keep
+    reading the chosen replica while they are sent. A successful write
+    starts the user's read-your-writes window so the next reads see it.
+    """
+    _read_alias_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            self.read_alias = routers.choose_replica(request.user.pk)
+            self._read_alias_token = routers.set_read_alias(self.read_alias)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._read_alias_token is not None:
+            routers.reset_read_alias(self._read_alias_token)
+            self._read_alias_token = None
+            if getattr(response, 'streaming', False) and self.read_alias:
+                response.streaming_content = routers.keep_read_alias(
+                    response.streaming_content, self.read_alias
+                )
+        elif request.method not in SAFE_METHODS and \
+                response.status_code < 400 and \
+                request.user and request.user.is_authenticated:
+            routers.record_write(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
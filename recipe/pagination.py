@@ -0,0 +1,233 @@
+import base64
+import json
+from collections import OrderedDict, namedtuple
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+Cursor = namedtuple('Cursor', ['ordering', 'position', 'reverse'])
+
+
+class KeysetPagination(BasePagination):
+    """Opaque cursor pagination seeking on (ordering field, pk).
+
+    Each page is fetched with a `WHERE (field, pk) > (last_field, last_pk)`
+    style predicate instead of an OFFSET, so every page costs the same no
+    matter how deep the client scrolls and rows inserted concurrently never
+    shift or duplicate results across pages.
+
+    Views declare the orderings they support with `ordering_fields` and
+    the default one with `ordering`, clients pick one with `?ordering=`.
+    """
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    default_ordering = '-pk'
+    invalid_cursor_message = _('Invalid cursor')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        cursor = self.decode_cursor(request, view)
+        if cursor is None:
+            self.ordering = self.get_ordering(request, view)
+            position, reverse = None, False
+        else:
+            self.ordering, position, reverse = cursor
+
+        fields = self.get_key_fields(self.ordering)
+        if position is not None:
+            position = self.parse_position(queryset, fields, position)
+        descending = self.ordering.startswith('-')
+        # previous pages are read backwards from the cursor then flipped
+        scan_descending = descending != reverse
+        prefix = '-' if scan_descending else ''
+        queryset = self.load_key_fields(queryset, fields)
+        queryset = queryset.order_by(*[prefix + f for f in fields])
+        if position is not None:
+            queryset = queryset.filter(
+                self.seek_filter(fields, position, scan_descending)
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+
+        return self.page_size
+
+    def get_ordering(self, request, view):
+        """Return the requested ordering if the view supports it"""
+        default = getattr(view, 'ordering', None) or self.default_ordering
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering and ordering.lstrip('-') in self.get_ordering_fields(view):
+            return ordering
+
+        return default
+
+    def get_ordering_fields(self, view):
+        return getattr(view, 'ordering_fields', ('pk', 'id'))
+
+    def get_key_fields(self, ordering):
+        """Return the unique key the keyset seeks on"""
+        field = ordering.lstrip('-')
+        if field in ('pk', 'id'):
+            return ('pk',)
+
+        return (field, 'pk')
+
+    def load_key_fields(self, queryset, fields):
+        """Keep the key fields of a queryset limited with only() or values()"""
+        if queryset._fields:
+            missing = [field for field in fields
+                       if field not in queryset._fields]
+            if missing:
+                queryset = queryset.values(*queryset._fields, *missing)
+            return queryset
+
+        names, defer = queryset.query.deferred_loading
+        if defer or not names:
+            return queryset
+        missing = [field for field in fields if field != 'pk' and
+                   field not in names and
+                   field not in queryset.query.annotations]
+        if missing:
+            queryset = queryset.only(*names, *missing)
+        return queryset
+
+    def seek_filter(self, fields, position, descending):
+        """Build the row comparison `fields > position` as a Q object"""
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        for index in reversed(range(len(fields))):
+            step = Q(**{f'{fields[index]}__{lookup}': position[index]})
+            if index < len(fields) - 1:
+                step |= Q(**{fields[index]: position[index]}) & condition
+            condition = step
+
+        return condition
+
+    def get_position(self, instance):
+        if isinstance(instance, dict):
+            return [instance[field]
+                    for field in self.get_key_fields(self.ordering)]
+        return [getattr(instance, field)
+                for field in self.get_key_fields(self.ordering)]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return None
+
+        cursor = Cursor(self.ordering, self.get_position(self.page[-1]), False)
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            url = self.request.build_absolute_uri()
+            return remove_query_param(url, self.cursor_query_param)
+
+        cursor = Cursor(self.ordering, self.get_position(self.page[0]), True)
+        return self.encode_cursor(cursor)
+
+    def decode_cursor(self, request, view=None):
+        """Return the Cursor from the request or None for the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            data = json.loads(
+                base64.urlsafe_b64decode(encoded.encode('ascii'))
+            )
+            cursor = Cursor(
+                str(data['o']), list(data['p']), bool(data.get('r'))
+            )
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+        field = cursor.ordering.lstrip('-')
+        if field not in self.get_ordering_fields(view) and \
+                cursor.ordering != self.default_ordering:
+            raise NotFound(self.invalid_cursor_message)
+        if len(cursor.position) != len(self.get_key_fields(cursor.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+
+        return cursor
+
+    def parse_position(self, queryset, fields, position):
+        """Convert the cursor's key values to the key fields' types"""
+        values = []
+        for name, value in zip(fields, position):
+            if name in queryset.query.annotations:
+                field = queryset.query.annotations[name].output_field
+            elif name == 'pk':
+                field = queryset.model._meta.pk
+            else:
+                try:
+                    field = queryset.model._meta.get_field(name)
+                except FieldDoesNotExist:
+                    raise NotFound(self.invalid_cursor_message)
+            try:
+                value = field.to_python(value)
+            except (ValidationError, TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            values.append(value)
+
+        return values
+
+    def encode_cursor(self, cursor):
+        """Return the absolute URL for the given cursor"""
+        data = {'o': cursor.ordering, 'p': cursor.position}
+        if cursor.reverse:
+            data['r'] = 1
+        encoded = base64.urlsafe_b64encode(
+            json.dumps(data, cls=DjangoJSONEncoder,
+                       separators=(',', ':')).encode('utf-8')
+        ).decode('ascii')
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def to_html(self):
+        return ''
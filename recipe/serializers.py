@@ -1,9 +1,81 @@
+from collections import OrderedDict
+
+from django.core.files.storage import default_storage
+from django.db.models import CharField, Value
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
 
+from core import images
 from core.models import Tag, Ingredient, Recipe
 
 
-class TagSerializer(serializers.ModelSerializer):
+def sparse_fields(request, available):
+    """Return the fields kept by ?fields= and ?omit=, or None for all
+
+    Both take comma separated field names. Only reads are trimmed, so
+    writes still validate every field.
+    """
+    if request is None or request.method not in SAFE_METHODS:
+        return None
+    fields = request.query_params.get('fields')
+    omit = request.query_params.get('omit')
+    if not fields and not omit:
+        return None
+
+    names = list(available)
+    if fields:
+        wanted = {name.strip() for name in fields.split(',')}
+        names = [name for name in names if name in wanted]
+    if omit:
+        unwanted = {name.strip() for name in omit.split(',')}
+        names = [name for name in names if name not in unwanted]
+    return names
+
+
+class SparseFieldsMixin:
+    """serialize only the fields requested with ?fields= or ?omit="""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        names = sparse_fields(self.context.get('request'), self.fields)
+        if names is not None:
+            for name in set(self.fields) - set(names):
+                self.fields.pop(name)
+
+
+class RecipeAttrSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """base serializer for user owned recipe attributes"""
+    unique_name_message = _('You already have an item with this name.')
+
+    def validate_name(self, value):
+        """Reject names the user already has"""
+        request = self.context.get('request')
+        if request is None:
+            return value
+
+        queryset = self.Meta.model.objects.filter(
+            user=request.user, name=value
+        )
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError(self.unique_name_message)
+
+        return value
+
+
+class RecipeAttrBulkSerializer(serializers.Serializer):
+    """serializer for a list of tag or ingredient names"""
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False,
+        max_length=1000,
+    )
+
+
+class TagSerializer(RecipeAttrSerializer):
     """serializer for tag  objects"""
 
     class Meta:
@@ -12,7 +84,7 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(RecipeAttrSerializer):
     """ serializer for tag objects """
 
     class Meta:
@@ -21,7 +93,32 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id',)
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class ImageVariantsMixin(serializers.Serializer):
+    """adds the URLs of the resized recipe images"""
+    image_variants = serializers.SerializerMethodField()
+    image_variants_columns = ('image', 'image_derivatives')
+
+    def get_image_variants(self, recipe):
+        """Return {size: {format: url}} once the derivatives exist"""
+        return self.image_variants_from_values(recipe.image.name,
+                                               recipe.image_derivatives)
+
+    def image_variants_from_values(self, name, derivatives):
+        if not name or not derivatives:
+            return None
+
+        request = self.context.get('request')
+        variants = images.derivative_names(name)
+        for formats in variants.values():
+            for ext, derivative in formats.items():
+                url = default_storage.url(derivative)
+                formats[ext] = request.build_absolute_uri(url) \
+                    if request is not None else url
+        return variants
+
+
+class RecipeSerializer(SparseFieldsMixin, ImageVariantsMixin,
+                       serializers.ModelSerializer):
     """"serializer for the recipe object """
     ingredients = serializers.PrimaryKeyRelatedField(
         many=True,
@@ -35,7 +132,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'title', 'ingredients', 'tags',
-                  'time_minutes', 'price', 'link'
+                  'time_minutes', 'price', 'link', 'image_variants'
                   )
         read_only_fields = ('id',)
 
@@ -46,10 +143,188 @@ class RecipeDetailSerializer(RecipeSerializer):
     tags = TagSerializer(read_only=True, many=True)
 
 
-class RecipeImageSerializer(serializers.ModelSerializer):
+class RecipeImageSerializer(SparseFieldsMixin, ImageVariantsMixin,
+                            serializers.ModelSerializer):
     """"serializer for uploaing image to recipe"""
 
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'image_variants')
         read_only_fields = ('id',)
+
+
+class RecipeBulkListSerializer(serializers.ListSerializer):
+    """create many recipes with a constant number of queries"""
+    max_items = 1000
+    relations = {'tags': Tag, 'ingredients': Ingredient}
+    does_not_exist_message = _('Invalid pk "{pk}" - object does not exist.')
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) > self.max_items:
+            msg = _('Ensure this list has at most {max_items} items.')
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    msg.format(max_items=self.max_items)
+                ]
+            })
+
+        validated = super().to_internal_value(data)
+        self.validate_related(validated)
+        return validated
+
+    def validate_related(self, items):
+        """Check every referenced id belongs to the user in one query"""
+        user = self.context['request'].user
+        lookups = []
+        for name, model in self.relations.items():
+            ids = {pk for item in items for pk in item.get(name, ())}
+            if ids:
+                lookups.append(model.objects.filter(
+                    user=user, pk__in=ids
+                ).annotate(
+                    kind=Value(name, output_field=CharField())
+                ).values_list('pk', 'kind'))
+        if not lookups:
+            return
+
+        found = set(lookups[0].union(*lookups[1:], all=True))
+        errors = []
+        for item in items:
+            error = {}
+            for name in self.relations:
+                missing = [pk for pk in item.get(name, ())
+                           if (pk, name) not in found]
+                if missing:
+                    error[name] = [
+                        self.does_not_exist_message.format(pk=pk)
+                        for pk in missing
+                    ]
+            errors.append(error)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+    def create(self, validated_data):
+        links = [
+            {name: item.pop(name, []) for name in self.relations}
+            for item in validated_data
+        ]
+        recipes = [Recipe(**item) for item in validated_data]
+
+        return Recipe.objects.bulk_create_with_links(recipes, links)
+
+
+class RecipeBulkSerializer(RecipeSerializer):
+    """serializer for one recipe of a bulk create"""
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False,
+    )
+
+    class Meta(RecipeSerializer.Meta):
+        list_serializer_class = RecipeBulkListSerializer
+
+
+class ValuesSerializer:
+    """Read-only serialization of values() rows
+
+    Compiled once from a serializer: model fields read one column through
+    a converter taken from the serializer field, skipped where the column
+    is already JSON ready, primary key relations are read from the m2m
+    through table and method fields declare the columns they read with
+    `<name>_columns` and a `<name>_from_values` method. The data equals
+    the serializer's, without building a model instance per row.
+    """
+    passthrough_fields = (serializers.BooleanField, serializers.CharField,
+                          serializers.IntegerField)
+    batch_size = 500
+
+    def __init__(self, serializer):
+        if isinstance(serializer, serializers.ListSerializer):
+            serializer = serializer.child
+        self.model = serializer.Meta.model
+        self.columns = ['pk']
+        self.fields = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            self.fields.append((name,) + self.compile(serializer, field))
+
+    def compile(self, serializer, field):
+        """Return (kind, spec) reading one field from values() rows"""
+        name = field.field_name
+        if isinstance(field, serializers.ManyRelatedField) and \
+                type(field.child_relation) is \
+                serializers.PrimaryKeyRelatedField and \
+                field.child_relation.pk_field is None:
+            return 'relation', self.model._meta.get_field(field.source)
+        if isinstance(field, serializers.SerializerMethodField):
+            columns = getattr(serializer, f'{name}_columns', None)
+            if columns is None:
+                raise ValueError(f'{name} does not declare its columns')
+            self.columns.extend(columns)
+            return 'method', (columns,
+                              getattr(serializer, f'{name}_from_values'))
+        if not isinstance(field, (serializers.BaseSerializer,
+                                  serializers.FileField,
+                                  serializers.RelatedField)) and \
+                field.source in self.concrete_fields():
+            self.columns.append(field.source)
+            if type(field) in self.passthrough_fields:
+                return 'column', (field.source, None)
+            return 'column', (field.source, field.to_representation)
+
+        raise ValueError(f'{name} can not be read from values()')
+
+    def concrete_fields(self):
+        return {field.name for field in self.model._meta.concrete_fields}
+
+    def get_queryset(self, queryset):
+        """Return the queryset reading the rows as dicts"""
+        # annotations stay selectable, e.g. for ordering the pages
+        return queryset.prefetch_related(None).values(
+            *self.columns, *queryset.query.annotations
+        )
+
+    def related_ids(self, relation, pks):
+        """Map primary keys to the ids of their related objects"""
+        through = relation.remote_field.through
+        source = f'{relation.m2m_field_name()}_id'
+        target = f'{relation.m2m_reverse_field_name()}_id'
+        related = {pk: [] for pk in pks}
+        for start in range(0, len(pks), self.batch_size):
+            links = through.objects.filter(**{
+                f'{source}__in': pks[start:start + self.batch_size]
+            }).order_by(source, target).values_list(source, target)
+            for pk, related_pk in links:
+                related[pk].append(related_pk)
+        return related
+
+    def to_representation(self, rows):
+        """Return the serialized list of values() rows"""
+        rows = list(rows)
+        pks = [row['pk'] for row in rows]
+        related = {name: self.related_ids(spec, pks)
+                   for name, kind, spec in self.fields
+                   if kind == 'relation'}
+
+        data = []
+        for row in rows:
+            item = OrderedDict()
+            for name, kind, spec in self.fields:
+                if kind == 'column':
+                    column, convert = spec
+                    value = row[column]
+                    if convert is not None and value is not None:
+                        value = convert(value)
+                    item[name] = value
+                elif kind == 'relation':
+                    item[name] = related[name][row['pk']]
+                else:
+                    columns, method = spec
+                    item[name] = method(*[row[column] for column in columns])
+            data.append(item)
+        return data
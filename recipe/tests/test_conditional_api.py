@@ -0,0 +1,137 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from core.models import Recipe, Tag, Ingredient
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+
+def detail_url(recipe_id):
+    """return recipe detail url"""
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_recipe(user, **params):
+    """create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ConditionalGetTests(TestCase):
+    """test ETag and Last-Modified handling of the recipe api"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'etag@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_list_not_modified(self):
+        """test an unchanged list is answered without running queries"""
+        res = self.client.get(RECIPES_URL)
+        self.assertIn('Last-Modified', res)
+
+        with self.assertNumQueries(1):
+            res = self.revalidate(RECIPES_URL, res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b'')
+
+    def test_unchanged_detail_not_modified(self):
+        """test an unchanged recipe detail returns 304"""
+        url = detail_url(self.recipe.id)
+        res = self.client.get(url)
+
+        res = self.revalidate(url, res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_recipe_save_changes_etag(self):
+        """test saving a recipe invalidates the recipe list"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        self.recipe.title = 'new title'
+        self.recipe.save()
+
+        res = self.revalidate(RECIPES_URL, etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res['ETag'], etag)
+
+    def test_recipe_delete_changes_etag(self):
+        """test deleting a recipe invalidates the recipe list"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        self.client.delete(detail_url(self.recipe.id))
+
+        res = self.revalidate(RECIPES_URL, etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_m2m_change_changes_etag(self):
+        """test linking a tag invalidates recipes and assigned tags"""
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipes_etag = self.client.get(RECIPES_URL)['ETag']
+        tags_etag = self.client.get(TAGS_URL, {'assigned_only': 1})['ETag']
+        self.recipe.tags.add(tag)
+
+        recipes = self.revalidate(RECIPES_URL, recipes_etag)
+        tags = self.client.get(
+            TAGS_URL, {'assigned_only': 1}, HTTP_IF_NONE_MATCH=tags_etag
+        )
+
+        self.assertEqual(recipes.status_code, status.HTTP_200_OK)
+        self.assertEqual(tags.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(tags.data['results']), 1)
+
+    def test_ingredient_rename_changes_detail_etag(self):
+        """test renaming an ingredient invalidates nested recipe detail"""
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        self.recipe.ingredients.add(ingredient)
+        url = detail_url(self.recipe.id)
+        etag = self.client.get(url)['ETag']
+        ingredient.name = 'Sea salt'
+        ingredient.save()
+
+        res = self.revalidate(url, etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_versions_are_per_user(self):
+        """test other users' writes do not invalidate the list"""
+        etag = self.client.get(RECIPES_URL)['ETag']
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        client2 = APIClient()
+        client2.force_authenticate(user2)
+        client2.get(RECIPES_URL)
+        sample_recipe(user=user2)
+
+        res = self.revalidate(RECIPES_URL, etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_query_params_change_etag(self):
+        """test different list queries get different etags"""
+        first = self.client.get(RECIPES_URL)['ETag']
+        second = self.client.get(RECIPES_URL, {'ordering': 'title'})['ETag']
+
+        self.assertNotEqual(first, second)
@@ -0,0 +1,124 @@
+import base64
+import json
+
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from django.test import TestCase
+
+from core.models import Recipe, Tag
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAGS_URL = reverse('recipe:tag-list')
+
+
+def sample_recipe(user, **params):
+    """create and return a sample recipe"""
+    defaults = {
+        'title': 'sample recipe',
+        'time_minutes': 10,
+        'price': 5.00,
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class KeysetPaginationTests(TestCase):
+    """test cursor pagination of the recipe api lists"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'pager@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, params):
+        """follow next links and return the ids of every page"""
+        pages = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            pages.append([item['id'] for item in res.data['results']])
+            if not res.data['next']:
+                return pages
+            res = self.client.get(res.data['next'])
+
+    def test_recipes_paginated_by_id(self):
+        """test that recipes are split in pages newest first"""
+        recipes = [sample_recipe(self.user) for _ in range(5)]
+
+        pages = self.walk(RECIPES_URL, {'page_size': 2})
+
+        ids = [recipe.id for recipe in reversed(recipes)]
+        self.assertEqual(pages, [ids[0:2], ids[2:4], ids[4:]])
+
+    def test_pagination_stable_under_inserts(self):
+        """test that rows inserted between pages are not repeated"""
+        recipes = [sample_recipe(self.user) for _ in range(4)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        sample_recipe(self.user)
+        res = self.client.get(res.data['next'])
+
+        ids = [item['id'] for item in res.data['results']]
+        self.assertEqual(ids, [recipes[1].id, recipes[0].id])
+        self.assertIsNone(res.data['next'])
+
+    def test_pagination_by_non_unique_field(self):
+        """test that ties on the ordering field are broken by id"""
+        for price in (3, 1, 3, 2, 3, 1):
+            sample_recipe(self.user, price=price)
+
+        pages = self.walk(RECIPES_URL, {'page_size': 2, 'ordering': 'price'})
+
+        ids = [item for page in pages for item in page]
+        expected = Recipe.objects.order_by('price', 'id')
+        self.assertEqual(ids, [recipe.id for recipe in expected])
+
+    def test_previous_link(self):
+        """test that the previous link returns the earlier page"""
+        for _ in range(5):
+            sample_recipe(self.user)
+
+        first = self.client.get(RECIPES_URL, {'page_size': 2})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNotNone(back.data['next'])
+
+    def test_invalid_cursor(self):
+        """test that a malformed cursor is rejected"""
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_cursor_position_of_wrong_type(self):
+        """test that cursor values not matching their field are rejected"""
+        sample_recipe(self.user)
+
+        for data in ({'o': 'price', 'p': ['abc', 1]}, {'o': '-id', 'p': ['x']},
+                     {'o': 'title', 'p': ['soup', None]}):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(data).encode('utf-8')
+            ).decode('ascii')
+            res = self.client.get(RECIPES_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_tags_paginated_by_name(self):
+        """test that tags keep their name ordering across pages"""
+        for name in ('b', 'a', 'c', 'd'):
+            Tag.objects.create(user=self.user, name=name)
+
+        pages = self.walk(TAGS_URL, {'page_size': 3})
+
+        ids = [item for page in pages for item in page]
+        expected = Tag.objects.order_by('-name', '-id')
+        self.assertEqual(ids, [tag.id for tag in expected])
+        self.assertEqual(len(pages), 2)
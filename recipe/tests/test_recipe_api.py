@@ -1,5 +1,7 @@
+import json
 import tempfile
 import os
+from io import BytesIO
 
 from PIL import Image
 
@@ -8,7 +10,9 @@ from django.urls import reverse
 from core import models
 
 from unittest.mock import patch
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
 from core.models import Recipe, Ingredient, Tag
 
@@ -16,8 +20,11 @@ from rest_framework import status
 from rest_framework.test import APIClient
 
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.views import RecipeViewSet
 
 RECIPES_URL = reverse('recipe:recipe-list')
+BULK_RECIPES_URL = reverse('recipe:recipe-bulk-create')
+EXPORT_RECIPES_URL = reverse('recipe:recipe-export')
 
 
 def image_upload_url(recipe_id):
@@ -85,7 +92,7 @@ class PrivateApiTests(TestCase):
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         """tags that tags are returned for authenticated user"""
@@ -101,8 +108,8 @@ class PrivateApiTests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         """test viewing recipe detail"""
@@ -265,9 +272,9 @@ class RecipeUploadImageTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipes_by_ingredients(self):
         """Test returning recipes with specific ingredients"""
@@ -287,6 +294,497 @@ class RecipeUploadImageTests(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
+
+
+class RecipeQueryCountTests(TestCase):
+    """test that serializing recipes costs a constant number of queries"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'queries@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+        # creates the collection version counters read by every request
+        self.client.get(RECIPES_URL)
+
+    def create_recipes(self, count):
+        """create recipes each linked to a tag and an ingredient"""
+        for _ in range(count):
+            recipe = sample_recipe(user=self.user)
+            recipe.tags.add(
+                self.tag,
+                sample_tag(user=self.user, name=f'tag {recipe.id}'),
+            )
+            recipe.ingredients.add(self.ingredient)
+        return recipe
+
+    def test_list_query_count(self):
+        """test listing recipes does not query per recipe"""
+        for count in (1, 10):
+            self.create_recipes(count)
+            with self.assertNumQueries(4):
+                res = self.client.get(RECIPES_URL)
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(res.data['results'][0]['tags']), 2)
+
+    def test_retrieve_query_count(self):
+        """test recipe detail loads nested objects in constant queries"""
+        recipe = self.create_recipes(1)
+
+        with self.assertNumQueries(4):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(len(res.data['tags']), 2)
+        self.assertEqual(res.data['ingredients'][0]['name'],
+                         self.ingredient.name)
+
+    def test_filtered_list_query_count(self):
+        """test filtering recipes does not query per recipe"""
+        for count in (1, 10):
+            self.create_recipes(count)
+            with self.assertNumQueries(4):
+                self.client.get(RECIPES_URL, {
+                    'tags': str(self.tag.id),
+                    'ingredients': str(self.ingredient.id),
+                })
+
+
+class RecipeFilterMatchTests(TestCase):
+    """test matching any or all of the tags and ingredients"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'matcher@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.vegan = sample_tag(user=self.user, name='Vegan')
+        self.quick = sample_tag(user=self.user, name='Quick')
+        self.both = sample_recipe(user=self.user, title='Salad')
+        self.both.tags.add(self.vegan, self.quick)
+        self.one = sample_recipe(user=self.user, title='Stew')
+        self.one.tags.add(self.vegan)
+        sample_recipe(user=self.user, title='Toast')
+
+    def filter_ids(self, **params):
+        res = self.client.get(RECIPES_URL, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in res.data['results']]
+
+    def test_match_any_returns_unique_recipes(self):
+        """test recipes matching several tags are returned once"""
+        ids = self.filter_ids(tags=f'{self.vegan.id},{self.quick.id}')
+
+        self.assertEqual(ids, [self.one.id, self.both.id])
+
+    def test_match_all_tags(self):
+        """test only recipes with every requested tag are returned"""
+        ids = self.filter_ids(
+            tags=f'{self.vegan.id},{self.quick.id}',
+            match='all',
+        )
+
+        self.assertEqual(ids, [self.both.id])
+
+    def test_match_all_tags_and_ingredients(self):
+        """test match all applies to tags and ingredients together"""
+        salt = sample_ingredient(user=self.user, name='Salt')
+        self.one.ingredients.add(salt)
+
+        ids = self.filter_ids(
+            tags=str(self.vegan.id),
+            ingredients=str(salt.id),
+            match='all',
+        )
+
+        self.assertEqual(ids, [self.one.id])
+
+    def test_invalid_match(self):
+        """test an unknown match mode is rejected"""
+        res = self.client.get(RECIPES_URL, {'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkCreateRecipeTests(TestCase):
+    """test creating many recipes in one request"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'bulk@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = sample_tag(user=self.user)
+        self.ingredient = sample_ingredient(user=self.user)
+
+    def payload(self, count):
+        return [{
+            'title': f'recipe {i}',
+            'time_minutes': 10,
+            'price': '5.00',
+            'tags': [self.tag.id],
+            'ingredients': [self.ingredient.id],
+        } for i in range(count)]
+
+    def test_bulk_create_recipes(self):
+        """test that every recipe is created with its relations"""
+        res = self.client.post(BULK_RECIPES_URL, self.payload(3),
+                               format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(res.data), 3)
+        recipes = Recipe.objects.filter(user=self.user).order_by('id')
+        self.assertEqual(res.data, RecipeSerializer(recipes, many=True).data)
+        for recipe in recipes:
+            self.assertEqual(list(recipe.tags.all()), [self.tag])
+            self.assertEqual(list(recipe.ingredients.all()),
+                             [self.ingredient])
+
+    def test_bulk_create_reports_errors_per_item(self):
+        """test that invalid items are reported and nothing is created"""
+        payload = self.payload(3)
+        del payload[2]['title']
+
+        res = self.client.post(BULK_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertIn('title', res.data[2])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_rejects_foreign_ids(self):
+        """test that tags of other users are rejected per item"""
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        )
+        payload = self.payload(2)
+        payload[1]['tags'] = [sample_tag(user=user2).id]
+
+        res = self.client.post(BULK_RECIPES_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data[0], {})
+        self.assertEqual(list(res.data[1]), ['tags'])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_create_query_count_constant(self):
+        """test that the number of queries does not grow with the batch"""
+        features = connection.features
+        if not getattr(features, 'can_return_ids_from_bulk_insert',
+                       getattr(features, 'can_return_rows_from_bulk_insert',
+                               False)):
+            self.skipTest('backend cannot return ids from bulk inserts')
+        counts = []
+        for size in (2, 50):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.post(BULK_RECIPES_URL, self.payload(size),
+                                 format='json')
+            counts.append(len(queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+
+class ExportRecipeTests(TestCase):
+    """test streaming the recipes as newline delimited JSON"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'export@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_export_recipes(self):
+        """test every recipe is exported with its tags and ingredients"""
+        recipes = [sample_recipe(user=self.user, title=f'recipe {i}')
+                   for i in range(5)]
+        recipes[0].tags.add(sample_tag(user=self.user))
+        recipes[4].ingredients.add(sample_ingredient(user=self.user))
+        sample_recipe(user=get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        ))
+
+        with patch.object(RecipeViewSet, 'export_chunk_size', 2):
+            res = self.client.get(EXPORT_RECIPES_URL)
+            with self.assertNumQueries(9):
+                content = b''.join(res.streaming_content)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in content.splitlines()]
+        serializer = RecipeDetailSerializer(recipes, many=True)
+        self.assertEqual(lines, json.loads(json.dumps(serializer.data)))
+
+    def test_export_empty(self):
+        """test exporting without recipes returns an empty body"""
+        res = self.client.get(EXPORT_RECIPES_URL)
+
+        self.assertEqual(b''.join(res.streaming_content), b'')
+
+
+class RecipeSearchTests(TestCase):
+    """test full text search over recipes"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'search@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def search_ids(self, text, **params):
+        res = self.client.get(RECIPES_URL, {'search': text, **params})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in res.data['results']]
+
+    def test_search_title(self):
+        """test recipes are matched by words of their title"""
+        curry = sample_recipe(user=self.user, title='Thai green curry')
+        sample_recipe(user=self.user, title='Fish and chips')
+
+        self.assertEqual(self.search_ids('curry'), [curry.id])
+        self.assertEqual(self.search_ids('green thai'), [curry.id])
+        self.assertEqual(self.search_ids('pizza'), [])
+
+    def test_search_related_names(self):
+        """test recipes are matched by tag and ingredient names"""
+        soup = sample_recipe(user=self.user, title='Soup')
+        tag = sample_tag(user=self.user, name='Vegan')
+        soup.tags.add(tag)
+        stew = sample_recipe(user=self.user, title='Stew')
+        stew.ingredients.add(sample_ingredient(user=self.user, name='Leek'))
+
+        self.assertEqual(self.search_ids('vegan'), [soup.id])
+        self.assertEqual(self.search_ids('leek'), [stew.id])
+
+        tag.name = 'Plant based'
+        tag.save()
+        soup.ingredients.add(sample_ingredient(user=self.user, name='Kale'))
+
+        self.assertEqual(self.search_ids('vegan'), [])
+        self.assertEqual(self.search_ids('plant'), [soup.id])
+        self.assertEqual(self.search_ids('kale'), [soup.id])
+
+    def test_search_ranked_and_paginated(self):
+        """test title matches rank above tag matches across pages"""
+        tagged = sample_recipe(user=self.user, title='Stew')
+        tagged.tags.add(sample_tag(user=self.user, name='Curry'))
+        titled = sample_recipe(user=self.user, title='Curry')
+        sample_recipe(user=get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass'
+        ), title='Curry')
+
+        res = self.client.get(RECIPES_URL, {'search': 'curry',
+                                            'page_size': 1})
+        second = self.client.get(res.data['next'])
+
+        self.assertEqual(res.data['results'][0]['id'], titled.id)
+        self.assertEqual(second.data['results'][0]['id'], tagged.id)
+        self.assertIsNone(second.data['next'])
+
+    def test_search_tied_ranks_paginated(self):
+        """test every page of equally ranked matches is reached once
+
+        On PostgreSQL this checks the rank survives the cursor round trip.
+        """
+        ids = [sample_recipe(user=self.user, title='Chicken soup').id
+               for _ in range(5)]
+
+        seen = []
+        url, params = RECIPES_URL, {'search': 'chicken soup', 'page_size': 2}
+        while url and len(seen) <= len(ids):
+            res = self.client.get(url, params)
+            seen += [item['id'] for item in res.data['results']]
+            url, params = res.data['next'], None
+
+        self.assertEqual(seen, sorted(ids, reverse=True))
+
+    def test_search_deleted_recipe(self):
+        """test deleted recipes are no longer found"""
+        recipe = sample_recipe(user=self.user, title='Curry')
+        recipe.delete()
+
+        self.assertEqual(self.search_ids('curry'), [])
+
+    def test_search_bulk_created_recipes(self):
+        """test recipes created in bulk are indexed"""
+        res = self.client.post(BULK_RECIPES_URL, [
+            {'title': 'Lentil dahl', 'time_minutes': 30, 'price': '3.00'},
+        ], format='json')
+
+        self.assertEqual(self.search_ids('dahl'), [res.data[0]['id']])
+
+
+@override_settings(FILE_UPLOAD_TEMP_DIR=tempfile.mkdtemp())
+class ChunkedUploadImageTests(TestCase):
+    """test resumable uploads of recipe images"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'chunks@gmail.com',
+            'TestPass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+        self.url = image_upload_url(self.recipe.id)
+        buffer = BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+        self.image = buffer.getvalue()
+
+    def tearDown(self):
+        self.recipe.image.delete()
+
+    def put_chunk(self, first, last, **headers):
+        headers.setdefault('HTTP_CONTENT_DISPOSITION',
+                           'attachment; filename="photo.jpg"')
+        return self.client.put(
+            self.url,
+            self.image[first:last + 1],
+            content_type='image/jpeg',
+            HTTP_CONTENT_RANGE=f'bytes {first}-{last}/{len(self.image)}',
+            **headers
+        )
+
+    def test_upload_in_chunks(self):
+        """test the image is saved once the last chunk arrives"""
+        middle = len(self.image) // 2
+
+        res = self.put_chunk(0, middle - 1)
+        self.assertEqual(res.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(res['Upload-Offset'], str(middle))
+
+        res = self.client.get(self.url)
+        self.assertEqual(res.data, {'offset': middle,
+                                    'size': len(self.image)})
+
+        res = self.put_chunk(middle, len(self.image) - 1)
+        self.recipe.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('image', res.data)
+        with open(self.recipe.image.path, 'rb') as f:
+            self.assertEqual(f.read(), self.image)
+        self.assertEqual(self.client.get(self.url).data['offset'], 0)
+
+    def test_chunk_after_gap_rejected(self):
+        """test a chunk past the received bytes reports the offset"""
+        self.put_chunk(0, 9)
+
+        res = self.put_chunk(20, len(self.image) - 1)
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['offset'], 10)
+
+    def test_short_body_rejected(self):
+        """test a body shorter than its range reports the offset"""
+        res = self.client.put(
+            self.url, self.image[:5], content_type='image/jpeg',
+            HTTP_CONTENT_RANGE=f'bytes 0-9/{len(self.image)}',
+            HTTP_CONTENT_DISPOSITION='attachment; filename="photo.jpg"'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['offset'], 5)
+
+    def test_invalid_content_range(self):
+        """test a chunk without a valid range is rejected"""
+        res = self.client.put(self.url, self.image,
+                              content_type='image/jpeg',
+                              HTTP_CONTENT_RANGE='bytes 5-1/10')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_image_discarded(self):
+        """test a completed upload that is not an image is rejected"""
+        self.image = b'not an image'
+
+        res = self.put_chunk(0, len(self.image) - 1)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url).data['offset'], 0)
+
+
+class SparseFieldsTests(TestCase):
+    """test limiting the serialized fields with ?fields= and ?omit="""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'sparse@gmail.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user, link='http://a.b')
+        self.recipe.tags.add(sample_tag(user=self.user))
+        self.recipe.ingredients.add(sample_ingredient(user=self.user))
+        # creates the collection version counters read by every request
+        self.client.get(RECIPES_URL)
+
+    def test_list_fields(self):
+        """test only the requested fields are loaded and returned"""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {'fields': 'id,title'})
+
+        self.assertEqual(res.data['results'],
+                         [{'id': self.recipe.id, 'title': 'sample Recipe'}])
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('"link"', queries[-1]['sql'])
+
+    def test_list_omit(self):
+        """test omitted relations are neither returned nor prefetched"""
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL,
+                                  {'omit': 'tags,ingredients'})
+
+        self.assertNotIn('tags', res.data['results'][0])
+        self.assertEqual(res.data['results'][0]['link'], 'http://a.b')
+
+    def test_sparse_ordering_field_loaded(self):
+        """test paging on a field left out of the response"""
+        sample_recipe(user=self.user, price=1)
+
+        with self.assertNumQueries(2):
+            res = self.client.get(RECIPES_URL, {
+                'fields': 'id', 'ordering': 'price', 'page_size': 1
+            })
+
+        self.assertIsNotNone(res.data['next'])
+        self.assertEqual(list(res.data['results'][0]), ['id'])
+
+    def test_detail_fields(self):
+        """test the detail endpoint returns the requested fields"""
+        res = self.client.get(detail_url(self.recipe.id),
+                              {'fields': 'title,tags'})
+
+        self.assertEqual(set(res.data), {'title', 'tags'})
+        self.assertEqual(res.data['tags'][0]['name'], 'recipe course')
+
+    def test_writes_not_trimmed(self):
+        """test creating a recipe still validates every field"""
+        res = self.client.post(f'{RECIPES_URL}?fields=id',
+                               {'title': 'Cake', 'time_minutes': 5,
+                                'price': '1.00'})
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertIn('title', res.data)
+
+    def test_tag_fields(self):
+        """test tag lists accept the same parameters"""
+        res = self.client.get(reverse('recipe:tag-list'), {'omit': 'id'})
+
+        self.assertEqual(res.data['results'], [{'name': 'recipe course'}])
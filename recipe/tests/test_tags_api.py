@@ -10,6 +10,7 @@ from rest_framework.test import APIClient
 from recipe.serializers import TagSerializer
 
 TAGS_URL = reverse('recipe:tag-list')
+BULK_TAGS_URL = reverse('recipe:tag-bulk-get-or-create')
 
 
 class PublicTagsApiTests(TestCase):
@@ -46,7 +47,7 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_tags_limited_to_user(self):
         """tags that tags are returned for authenticated user"""
@@ -60,8 +61,8 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
 
     def test_tag_created_successfully(self):
         """test that tag is created successfully"""
@@ -97,8 +98,8 @@ class PrivateTagsApiTests(TestCase):
 
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
 
     def test_retrieve_tags_assigned_unique(self):
         """test filtering tags by assigned returns unique items"""
@@ -122,4 +123,51 @@ class PrivateTagsApiTests(TestCase):
 
         res = self.client.get(TAGS_URL, {'assigned_only': 1})
 
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_create_duplicate_tag(self):
+        """test that a user cannot create two tags with the same name"""
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_get_or_create_tags(self):
+        """test that existing tags are reused and missing ones created"""
+        existing = Tag.objects.create(user=self.user, name='Vegan')
+        user2 = get_user_model().objects.create_user(
+            'other@gmail.com',
+            'testpass',
+        )
+        Tag.objects.create(user=user2, name='Dessert')
+        payload = {'names': ['Dessert', 'Vegan', 'Dessert', 'Quick']}
+
+        res = self.client.post(BULK_TAGS_URL, payload, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([tag['name'] for tag in res.data],
+                         ['Dessert', 'Vegan', 'Quick'])
+        self.assertEqual(res.data[1]['id'], existing.id)
+        tags = Tag.objects.filter(user=self.user)
+        self.assertEqual(tags.count(), 3)
+        for item in res.data:
+            self.assertEqual(tags.get(name=item['name']).id, item['id'])
+
+    def test_bulk_get_or_create_existing_tags(self):
+        """test that known names are resolved with a single query"""
+        Tag.objects.create(user=self.user, name='Vegan')
+        Tag.objects.create(user=self.user, name='Quick')
+
+        with self.assertNumQueries(1):
+            res = self.client.post(
+                BULK_TAGS_URL, {'names': ['Quick', 'Vegan']}, format='json'
+            )
+
+        self.assertEqual(len(res.data), 2)
+
+    def test_bulk_get_or_create_invalid(self):
+        """test that an empty list of names is rejected"""
+        res = self.client.post(BULK_TAGS_URL, {'names': []}, format='json')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Prefetch
+from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import Ingredient, Recipe, Tag
+from recipe import serializers
+
+
+class ValuesSerializerTests(TestCase):
+    """test the values() path renders the same bytes as the serializers"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            'values@gmail.com',
+            'testpass'
+        )
+        tags = [Tag.objects.create(user=self.user, name=f'tag {i}')
+                for i in range(3)]
+        ingredient = Ingredient.objects.create(user=self.user, name='Salt')
+        for i, price in enumerate(('5.00', '0.10', '999.99')):
+            recipe = Recipe.objects.create(
+                user=self.user, title=f'Recipe {i}', time_minutes=i,
+                price=price, link='https://example.com' if i else '',
+                image=f'uploads/recipe/{i}.jpg' if i else '',
+                image_derivatives=i == 2,
+            )
+            recipe.tags.add(*tags[i:])
+        recipe.ingredients.add(ingredient)
+        self.request = Request(APIRequestFactory().get('/'))
+
+    def assertSameJson(self, serializer_class, queryset, request=None):
+        context = {'request': request or self.request}
+        expected = serializer_class(queryset, many=True, context=context)
+        values = serializers.ValuesSerializer(
+            serializer_class(many=True, context=context)
+        )
+        data = values.to_representation(values.get_queryset(queryset))
+
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(data),
+                         renderer.render(expected.data))
+
+    def test_recipes(self):
+        """test recipes with relations, prices and image variants"""
+        queryset = Recipe.objects.order_by('pk').prefetch_related(
+            Prefetch('tags', queryset=Tag.objects.order_by('pk')),
+            Prefetch('ingredients', queryset=Ingredient.objects.all()),
+        )
+
+        self.assertSameJson(serializers.RecipeSerializer, queryset)
+
+    def test_sparse_recipes(self):
+        """test requested fields are honoured"""
+        request = Request(APIRequestFactory().get(
+            '/', {'fields': 'price,image_variants'}
+        ))
+
+        self.assertSameJson(serializers.RecipeSerializer,
+                            Recipe.objects.order_by('pk'), request)
+
+    def test_tags_and_ingredients(self):
+        """test tag and ingredient lists"""
+        self.assertSameJson(serializers.TagSerializer,
+                            Tag.objects.order_by('-name'))
+        self.assertSameJson(serializers.IngredientSerializer,
+                            Ingredient.objects.all())
+
+    def test_nested_serializer_not_supported(self):
+        """test serializers with nested objects are refused"""
+        with self.assertRaises(ValueError):
+            serializers.ValuesSerializer(
+                serializers.RecipeDetailSerializer(many=True)
+            )
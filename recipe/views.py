@@ -1,19 +1,33 @@
+from io import BytesIO
+
+from django.db.models import Count, Prefetch
+from django.http import StreamingHttpResponse
+from django.http.multipartparser import parse_header
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.utils.encoders import JSONEncoder
 
+from core import images, metrics, search, uploads
+from core.authentication import CachedTokenAuthentication
 from core.models import Tag, Ingredient, Recipe
 
 from recipe import serializers
+from recipe.mixins import ConditionalGetMixin, ReplicaReadMixin, \
+    SparseFieldsMixin, ValuesListMixin
 
 
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(ReplicaReadMixin, ConditionalGetMixin,
+                            SparseFieldsMixin, ValuesListMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin, mixins.CreateModelMixin):
     """ base ViewSet for user owned recipe attributes"""
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    ordering = '-name'
+    ordering_fields = ('id', 'name')
 
     def get_queryset(self):
         """Return objects for the current authenticated user only"""
@@ -23,6 +37,9 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
         queryset = self.queryset
         if assigned_only:
             queryset = queryset.filter(recipe__isnull=False)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            queryset = self.sparse_queryset(queryset, fields)
 
         return queryset.filter(
             user=self.request.user
@@ -32,50 +49,153 @@ class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
         """create a new object"""
         serializer.save(user=self.request.user)
 
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_get_or_create(self, request):
+        """return objects for a list of names creating the missing ones"""
+        serializer = serializers.RecipeAttrBulkSerializer(data=request.data)
+
+        if serializer.is_valid():
+            model = self.queryset.model
+            names = serializer.validated_data['names']
+            ids = model.objects.get_or_create_many(request.user, names)
+            objects = [model(pk=ids[name], name=name)
+                       for name in dict.fromkeys(names)]
+            return Response(
+                self.get_serializer(objects, many=True).data,
+                status=status.HTTP_200_OK
+            )
+
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """manage tags in the database"""
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    version_collections = ('tag', 'recipe')
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """ manage ingredient database """
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    version_collections = ('ingredient', 'recipe')
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsMixin,
+                    ValuesListMixin, viewsets.ModelViewSet):
     """"manage recipes in the  database"""
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    version_collections = ('recipe', 'tag', 'ingredient')
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
+    ordering = '-id'
+    ordering_fields = ('id', 'title', 'time_minutes', 'price')
+    export_chunk_size = 500
+    throttle_scopes = {'upload_image': 'upload-image'}
+    sparse_field_columns = {
+        'image_variants': ('image', 'image_derivatives'),
+        'tags': (),
+        'ingredients': (),
+    }
 
     def _params_to_ints(self, qs):
         """Convert a list of string IDs to a list of integers"""
         return [int(str_id) for str_id in qs.split(',')]
 
+    def _filter_related(self, queryset, relation, ids, match_all):
+        """Keep recipes linked to any or all of the ids in a relation
+
+        The match is resolved in one grouped subquery over the m2m through
+        table, so the outer query never joins the relation and cannot
+        return duplicate rows.
+        """
+        field = Recipe._meta.get_field(relation)
+        source = f'{field.m2m_field_name()}_id'
+        target = f'{field.m2m_reverse_field_name()}_id'
+        ids = set(ids)
+        links = field.remote_field.through.objects.filter(
+            **{f'{target}__in': ids}
+        )
+        if match_all:
+            links = links.values(source).annotate(
+                matched=Count(target)
+            ).filter(matched=len(ids))
+
+        return queryset.filter(pk__in=links.values(source))
+
     def get_queryset(self):
         """Retrieve the recipes for the authenticated user"""
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
+        text = self.request.query_params.get('search')
+        match = self.request.query_params.get('match', 'any')
+        if match not in ('any', 'all'):
+            raise ValidationError({'match': "Must be 'any' or 'all'."})
         queryset = self.queryset
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = self._filter_related(
+                queryset, 'tags', tag_ids, match == 'all'
+            )
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = self._filter_related(
+                queryset, 'ingredients', ingredient_ids, match == 'all'
+            )
+
+        if text:
+            queryset = search.search(queryset, text)
+            # search results are paginated by relevance
+            self.ordering = '-rank'
+            self.ordering_fields = ('rank',)
+
+        return self._prefetch_related(
+            queryset.filter(user=self.request.user)
+        )
+
+    def _prefetch_related(self, queryset):
+        """Load the relations serialized by the current action up front
+
+        Reads limited with ?fields=/?omit= only load the columns and
+        relations of the remaining fields.
+        """
+        relations = ('tags', 'ingredients')
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            queryset = self.sparse_queryset(queryset, fields)
+            relations = [name for name in relations if name in fields]
 
-        return queryset.filter(user=self.request.user)
+        if self.action in ('retrieve', 'export'):
+            return queryset.prefetch_related(*relations)
+        if self.action in ('list', 'create', 'update', 'partial_update',
+                           'bulk_create'):
+            models = {'tags': Tag, 'ingredients': Ingredient}
+            return queryset.prefetch_related(*[
+                Prefetch(name, queryset=models[name].objects.only('id')
+                         .order_by('pk'))
+                for name in relations
+            ])
+
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
 
     def get_serializer_class(self):
         """"return appropriate serializer class """
-        if self.action == 'retrieve':
+        if self.action in ('retrieve', 'export'):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk_create':
+            return serializers.RecipeBulkSerializer
 
         return self.serializer_class
 
@@ -83,17 +203,33 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """create anew recipe"""
         serializer.save(user=self.request.user)
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST', 'PUT', 'GET'], detail=True,
+            url_path='upload-image')
     def upload_image(self, request, pk=None):
-        """upload image to the recipe """
+        """upload image to the recipe
+
+        POST takes the whole image as multipart form data, PUT takes it in
+        resumable chunks (see core.uploads) and GET reports the progress of
+        a chunked upload.
+        """
         recipe = self.get_object()
+        if request.method == 'GET':
+            return self._upload_progress(uploads.ChunkedUpload(recipe.pk))
+        if request.method == 'PUT':
+            return self._upload_chunk(request, recipe)
+
+        image = request.FILES.get('image')
+        metrics.count_upload_bytes('multipart', image and image.size)
         serializer = self.get_serializer(
             recipe,
             data=request.data,
         )
+        return self._save_image(serializer)
 
+    def _save_image(self, serializer):
         if serializer.is_valid():
-            serializer.save()
+            recipe = serializer.save(image_derivatives=False)
+            images.schedule(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -103,3 +239,92 @@ class RecipeViewSet(viewsets.ModelViewSet):
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
         )
+
+    def _upload_progress(self, upload, status_code=status.HTTP_200_OK,
+                         detail=None):
+        info = upload.info()
+        data = {'offset': upload.offset, 'size': info and info['size']}
+        if detail:
+            data['detail'] = detail
+        return Response(data, status=status_code,
+                        headers={'Upload-Offset': str(data['offset'])})
+
+    def _upload_chunk(self, request, recipe):
+        """write one chunk and save the image once it is complete"""
+        upload = uploads.ChunkedUpload(recipe.pk)
+        name = None
+        disposition = request.META.get('HTTP_CONTENT_DISPOSITION')
+        if disposition:
+            _, params = parse_header(disposition.encode('utf-8'))
+            name = params.get('filename', b'').decode('utf-8') or None
+        try:
+            first, last, total = uploads.parse_content_range(
+                request.META.get('HTTP_CONTENT_RANGE')
+            )
+            upload.write(request.stream or BytesIO(), first, last, total,
+                         name=name, content_type=request.content_type)
+        except ValueError as exc:
+            raise ValidationError({'detail': str(exc)})
+        except uploads.UploadError as exc:
+            return self._upload_progress(upload, status.HTTP_409_CONFLICT,
+                                         str(exc))
+        metrics.count_upload_bytes('chunked', last - first + 1)
+        if not upload.complete:
+            return self._upload_progress(upload, status.HTTP_202_ACCEPTED)
+
+        image = upload.file()
+        try:
+            serializer = self.get_serializer(recipe, data={'image': image})
+            return self._save_image(serializer)
+        finally:
+            image.close()
+            upload.discard()
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk_create(self, request):
+        """create a list of recipes in one transaction"""
+        serializer = self.get_serializer(data=request.data, many=True)
+
+        if serializer.is_valid():
+            recipes = serializer.save(user=request.user)
+            queryset = self._prefetch_related(Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ).order_by('pk'))
+            return Response(
+                serializers.RecipeSerializer(queryset, many=True).data,
+                status=status.HTTP_201_CREATED
+            )
+
+        return Response(
+            serializer.errors,
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def _export_lines(self, queryset):
+        """Yield one JSON line per recipe reading the queryset in chunks"""
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        last_pk = None
+        while True:
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            chunk = list(chunk[:self.export_chunk_size])
+            if not chunk:
+                return
+
+            for data in self.get_serializer(chunk, many=True).data:
+                yield encoder.encode(data) + '\n'
+            if len(chunk) < self.export_chunk_size:
+                return
+            last_pk = chunk[-1].pk
+
+    @action(methods=['GET'], detail=False, url_path='export')
+    def export(self, request):
+        """stream the user's recipes as newline delimited JSON"""
+        response = StreamingHttpResponse(
+            self._export_lines(self.get_queryset()),
+            content_type='application/x-ndjson',
+        )
+        response['Content-Disposition'] = \
+            'attachment; filename="recipes.ndjson"'
+        return response
@@ -18,12 +18,11 @@ class UserSerializer(serializers.ModelSerializer):
     def update(self, instance, validated_data):
         """update a user and setting a password correctly and return it"""
         password = validated_data.pop('password', None)
-        user = super().update(instance, validated_data)
-
         if password:
-            user.set_password(password)
-            user.save()
-        return user
+            # hashed once and saved with the other fields
+            instance.set_password(password)
+
+        return super().update(instance, validated_data)
 
 
 class AuthTokenSerializer(serializers.Serializer):